@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Measures how long each DAG file in dags/ takes to import, the way the
+# scheduler parses it, and reports heavy pipeline dependencies that were
+# loaded at parse time. Run it from the airflow directory inside the
+# Airflow image:
+#
+#   python checkDagImportTime.py [--budget 1.0]
+#
+# Exits with 1 when a DAG file goes over the budget or loads a heavy module.
+
+DAGS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dags")
+DAG_FILES = ["airflowpipeline.py", "reprocesspipeline.py"]
+
+# Modules that must only be loaded inside task callables
+HEAVY_MODULES = [
+    "psycopg2", "boto3", "pymilvus", "langchain", "langchain_openai", "langchain_text_splitters",
+    "openai", "tiktoken", "fitz", "openpyxl", "docx", "mammoth", "PIL", "pytesseract",
+    "pyarrow", "zstandard", "bs4"
+]
+
+# Runs in a fresh interpreter, so modules cached by an earlier DAG file do not hide the cost.
+# Airflow itself is imported first and is not counted, the scheduler has it loaded already.
+MEASURE_SCRIPT = """
+import sys, json, time, runpy
+import airflow
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+
+before = set(sys.modules)
+start = time.perf_counter()
+runpy.run_path(sys.argv[1])
+elapsed = time.perf_counter() - start
+
+loaded = sorted({name.split(".")[0] for name in set(sys.modules) - before})
+print(json.dumps({"seconds": elapsed, "modules": loaded}))
+"""
+
+
+# Function to import one DAG file in a subprocess and return its import time and new modules
+def measure_dag_file(dag_file):
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, dag_file],
+        cwd            = DAGS_DIRECTORY,
+        capture_output = True,
+        text           = True,
+        env            = dict(os.environ, PYTHONPATH=DAGS_DIRECTORY)
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {dag_file} failed:\n{result.stderr}")
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the DAG files")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("DAG_IMPORT_BUDGET_SECONDS", 1.0)), help="Maximum import time per DAG file in seconds")
+    args = parser.parse_args()
+
+    failed = False
+
+    for dag_file in DAG_FILES:
+        measurement = measure_dag_file(dag_file)
+        heavy = [module for module in measurement["modules"] if module in HEAVY_MODULES]
+
+        status = "OK"
+        if measurement["seconds"] > args.budget or heavy:
+            status = "FAIL"
+            failed = True
+
+        print(f"{status:4} {dag_file:24} {measurement['seconds']:.3f}s (budget {args.budget:.1f}s)")
+        if heavy:
+            print(f"     heavy modules loaded at parse time: {', '.join(heavy)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+
+# Runs EXPLAIN on the hot read queries of the FastAPI service and the Airflow
+# pipeline and fails if any of them falls back to a sequential scan on one of
+# the large tables. Run it from the airflow directory:
+#
+#   python checkQueryPlans.py [--seed] [--emails 50000]
+#
+# --seed DROPS AND RECREATES EVERY TABLE (create_tables_in_db + migrations) and
+# fills them with a synthetic mailbox, so point DB_NAME at a scratch database.
+# Without --seed the plans are checked against whatever data is already there.
+# The queries below are copies of the ones in fastapi/utils/services.py,
+# fastapi/agents/summary_agent.py and dags/services/processEmailAttachments.py
+# and have to be kept in sync with them. search_emails keeps only the part
+# that reads the large tables.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dags"))
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "dags", ".env"))
+
+from services.logger import start_logger
+from database.connectDB import create_connection_to_postgresql, close_connection
+from database.setupTables import create_tables_in_db
+from database.applyMigrations import apply_migrations
+from database.mailboxView import refresh_mailbox_view
+
+# Small tables (users, email_folders) are expected to be scanned
+LARGE_TABLES = {"emails", "recipients", "senders", "contacts", "categories", "attachments", "attachment_manifest", "mailbox_view"}
+
+FOLDERS = ["Inbox", "Sent Items", "Drafts", "Deleted Items", "Archive", "Junk Email", "Outbox", "Conversation History", "Notes"]
+
+SEED_QUERIES = [
+    """
+    INSERT INTO users (id, email, name)
+    SELECT 'user-' || g, 'user' || g || '@example.com', 'User ' || g
+    FROM generate_series(1, 3) g
+    """,
+    """
+    INSERT INTO email_folders (id, display_name)
+    SELECT 'folder-' || (i - 1), name
+    FROM unnest(%(folders)s::text[]) WITH ORDINALITY AS f(name, i)
+    """,
+    """
+    INSERT INTO emails (id, owner_user_id, parent_folder_id, conversation_id, received_datetime, sent_datetime, subject, body_preview, body, has_attachments, is_read)
+    SELECT 'email-' || g, 'user-' || (g %% 3 + 1), 'folder-' || (g %% 9), 'conversation-' || (g / 4),
+           now() - g * interval '1 minute', now() - g * interval '1 minute',
+           'Subject ' || g, 'Preview ' || g, 'Body of email ' || g, g %% 20 = 0, g %% 3 = 0
+    FROM generate_series(1, %(emails)s) g
+    """,
+    """
+    INSERT INTO contacts (id, address, display_name, domain)
+    SELECT g, 'contact' || g || '@example.com', 'Contact ' || g, 'example.com'
+    FROM generate_series(1, 700) g
+    UNION ALL
+    SELECT 1000 + g, 'user' || g || '@example.com', 'User ' || g, 'example.com'
+    FROM generate_series(1, 3) g
+    """,
+    """
+    INSERT INTO senders (id, email_id, contact_id)
+    SELECT 'sender-' || g, 'email-' || g, g %% 500 + 1
+    FROM generate_series(1, %(emails)s) g
+    """,
+    """
+    INSERT INTO recipients (id, owner_user_id, email_id, type, contact_id)
+    SELECT 'recipient-to-' || g, 'user-' || (g %% 3 + 1), 'email-' || g, 'to', 1000 + g %% 3 + 1
+    FROM generate_series(1, %(emails)s) g
+    UNION ALL
+    SELECT 'recipient-cc-' || g, 'user-' || (g %% 3 + 1), 'email-' || g, 'cc', g %% 700 + 1
+    FROM generate_series(1, %(emails)s) g
+    """,
+    """
+    INSERT INTO categories (id, owner_user_id, email_id, category)
+    SELECT 'category-' || g, 'user-' || (g %% 3 + 1), 'email-' || g, (ARRAY['Work', 'Finance', 'Travel', 'Personal'])[g %% 4 + 1]
+    FROM generate_series(1, %(emails)s) g
+    """,
+    """
+    INSERT INTO attachments (id, email_id, name, content_type, size)
+    SELECT 'attachment-' || g, 'email-' || g, 'file' || g || '.pdf', 'application/pdf', 1024
+    FROM generate_series(20, %(emails)s, 20) g
+    """,
+]
+
+HOT_QUERIES = {
+    "fetch_emails": ("""
+        SELECT v.sender_email, v.sender_name, v.user_email AS recipient_email, v.email_id, v.body_preview, v.subject,
+               v.sent_datetime, v.received_datetime, v.is_read, v.has_attachments, v.categories, v.attachments
+        FROM mailbox_view v
+        WHERE v.folder_name = %(folder_name)s
+          AND v.user_email = %(user_email)s
+          AND (v.received_datetime, v.email_id) < (now() - interval '20 days', 'email-0')
+        ORDER BY v.received_datetime DESC, v.email_id DESC
+        LIMIT 11
+    """, {"folder_name": "Inbox", "user_email": "user1@example.com"}),
+    "load_email": ("""
+        SELECT sc.address AS sender_email, rc.display_name AS recipient_name, e.subject, e.received_datetime, e.body, a.name AS attachment_name
+        FROM emails e
+        INNER JOIN senders s ON e.id = s.email_id
+        LEFT JOIN contacts sc ON s.contact_id = sc.id
+        INNER JOIN recipients r ON e.id = r.email_id
+        LEFT JOIN contacts rc ON r.contact_id = rc.id
+        LEFT JOIN attachments a ON e.id = a.email_id AND e.has_attachments = TRUE
+        WHERE e.id = %(email_id)s
+    """, {"email_id": "email-20"}),
+    "get_email_category": ("""
+        SELECT c.category FROM categories c WHERE c.email_id = %(email_id)s LIMIT 3
+    """, {"email_id": "email-20"}),
+    "get_thread_emails": ("""
+        SELECT e.id, e.subject, sc.address, rc.address, a.name
+        FROM emails e
+        LEFT JOIN senders s ON e.id = s.email_id
+        LEFT JOIN contacts sc ON s.contact_id = sc.id
+        LEFT JOIN recipients r ON e.id = r.email_id
+        LEFT JOIN contacts rc ON r.contact_id = rc.id
+        LEFT JOIN attachments a ON e.id = a.email_id
+        WHERE e.conversation_id = %(conversation_id)s
+    """, {"conversation_id": "conversation-5"}),
+    "fetch_emails_with_attachments": ("""
+        SELECT u.email AS user_email, e.id AS email_id, e.has_attachments
+        FROM users u
+        JOIN emails e ON e.owner_user_id = u.id
+        WHERE u.email = %(user_email)s
+          AND e.has_attachments = TRUE
+    """, {"user_email": "user1@example.com"}),
+    "emails_from_contact": ("""
+        SELECT e.id, e.subject, e.received_datetime
+        FROM contacts c
+        JOIN senders s ON s.contact_id = c.id
+        JOIN emails e ON e.id = s.email_id
+        WHERE c.address = %(address)s
+    """, {"address": "contact7@example.com"}),
+    "search_emails": ("""
+        SELECT e.id, ts_rank_cd(e.search_vector, q.query) AS rank
+        FROM emails e
+        CROSS JOIN websearch_to_tsquery('english', %(query_text)s) AS q(query)
+        INNER JOIN users u ON e.owner_user_id = u.id
+        WHERE e.search_vector @@ q.query
+          AND u.email = %(user_email)s
+        ORDER BY rank DESC, e.id DESC
+        LIMIT 21
+    """, {"query_text": "email 4242", "user_email": "user1@example.com"}),
+}
+
+
+# Function to create the tables and fill them with a synthetic mailbox
+def seed_database(logger, email_count):
+    create_tables_in_db(logger)
+    apply_migrations(logger)
+
+    conn = create_connection_to_postgresql()
+    try:
+        with conn.cursor() as cursor:
+            for query in SEED_QUERIES:
+                cursor.execute(query, {"emails": email_count, "folders": FOLDERS})
+            conn.commit()
+
+            # Built the way the pipeline builds it
+            refresh_mailbox_view(logger)
+
+            # Planner statistics for the new rows
+            cursor.execute("ANALYZE")
+            conn.commit()
+    finally:
+        close_connection(conn)
+
+    logger.info(f"checkQueryPlans.py - seed_database() - Seeded {email_count} emails")
+
+
+# Function to collect the sequential scans on large tables in a JSON plan
+def find_seq_scans(plan):
+    scans = []
+
+    # Partitions (emails_p0, ...) count as their parent table
+    relation = re.sub(r"_p\d+$", "", plan.get("Relation Name", ""))
+
+    if plan.get("Node Type") == "Seq Scan" and relation in LARGE_TABLES:
+        scans.append(plan["Relation Name"])
+
+    for child in plan.get("Plans", []):
+        scans.extend(find_seq_scans(child))
+
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the hot queries do not sequential-scan large tables")
+    parser.add_argument("--seed", action="store_true", help="Drop and recreate every table and seed a synthetic mailbox first")
+    parser.add_argument("--emails", type=int, default=50000, help="Number of emails to seed")
+    args = parser.parse_args()
+
+    logger = start_logger()
+
+    if args.seed:
+        seed_database(logger, args.emails)
+
+    failed = False
+    conn = create_connection_to_postgresql()
+
+    try:
+        with conn.cursor() as cursor:
+            for name, (query, params) in HOT_QUERIES.items():
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+                seq_scans = find_seq_scans(plan)
+                if seq_scans:
+                    failed = True
+                    print(f"FAIL {name:32} sequential scan on {', '.join(sorted(set(seq_scans)))}")
+                else:
+                    print(f"OK   {name:32} cost {plan['Total Cost']:.1f}")
+    finally:
+        close_connection(conn)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
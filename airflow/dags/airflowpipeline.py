@@ -5,13 +5,11 @@ from airflow.operators.python import PythonOperator
 import os
 from dotenv import load_dotenv
 from services.logger import start_logger
-from auth.accessToken import get_token_response, format_token_response
-from database.setupTables import create_tables_in_db
-from database.loadtoDB import load_users_tokendata_to_db, fetch_new_job, update_job_timestamp
-from services.processEmails import process_emails
-from services.processEmailAttachments import process_emails_with_attachments
-from services.extractAttachments import extract_contents_from_attachments
-from services.processEmailFolders import get_email_folders
+
+# The scheduler re-parses this file every few seconds. Pipeline modules pull in
+# psycopg2, boto3, pymilvus, LangChain, tiktoken, PyMuPDF, openpyxl and others,
+# so they are imported inside the task callables and only loaded by the worker
+# that runs the task. Check the parse time with `python checkDagImportTime.py`.
 
 # Initialize logger
 logger = start_logger()
@@ -21,6 +19,9 @@ load_dotenv()
 def get_and_format_token(**context):
     """Get and format authentication token"""
     
+    from auth.accessToken import get_token_response, format_token_response
+    from database.loadtoDB import fetch_new_job
+
     try:
         received_token_dict = None
         tokens_present = False
@@ -93,6 +94,9 @@ def get_and_format_token(**context):
 def setup_database(**context):
     """Setup database tables if not already created"""
     
+    from database.setupTables import create_tables_in_db
+    from database.applyMigrations import apply_migrations
+
     try:
         logger.info("Task: setup_database - Starting database setup")
         
@@ -121,9 +125,16 @@ def setup_database(**context):
         context['task_instance'].xcom_push(key='DB_SETUP', value=False)
         raise
 
+    # Migrations are checked on every run, so existing databases pick up new ones.
+    # A failed migration must not reset DB_SETUP, that would drop every table.
+    apply_migrations(logger)
+    logger.info("Task: setup_database - Schema migrations are up to date")
+
 def process_user_token(**context):
     """Process user token and load to database"""
     
+    from database.loadtoDB import load_users_tokendata_to_db
+
     try:
         logger.info("Task: process_user_token - Processing user token")
         
@@ -149,6 +160,9 @@ def process_user_token(**context):
 
 def process_email_folders(**context):
     """Process email folders and save to database"""
+    
+    from services.processEmailFolders import get_email_folders
+
     try:
         logger.info("Task: process_email_folders - Processing email folders")
         
@@ -165,8 +179,10 @@ def process_email_folders(**context):
             if formatted_token is None:
                 raise ValueError("formatted_token contains None instead of a dictionary in process_email_folders")
 
+            user_email = context['task_instance'].xcom_pull(task_ids='process_token_task', key='user_email')
+
             # Process email folders
-            get_email_folders(logger, formatted_token['access_token'])
+            get_email_folders(logger, formatted_token['access_token'], user_email)
             logger.info("Task: process_email_folders - Email folders processed successfully")
             
             # Set FOLDERS_PROCESSED to True in XCom
@@ -185,6 +201,9 @@ def process_email_folders(**context):
 def process_email_data(**context):
     """Process email data"""
     
+    from services.processEmails import process_emails
+    from database.folderCounts import refresh_folder_counts
+
     try:
         logger.info("Task: process_email_data - Processing emails")
         
@@ -211,14 +230,59 @@ def process_email_data(**context):
             formatted_token['id']
         )
         logger.info("Task: process_email_data - Emails processed successfully")
+
+        # Sidebar counts follow the emails that were just committed, FastAPI serves them once its cache expires
+        refresh_folder_counts(logger, user_email)
     
     except Exception as e:
         logger.error(f"Task: process_email_data - Error in process_email_data: {e}")
         raise
 
+def index_emails(**context):
+    """Index committed emails that are not in Milvus yet"""
+    
+    from services.emailStages import index_pending_emails
+
+    try:
+        logger.info("Task: index_emails - Indexing pending emails")
+        
+        user_email = context['task_instance'].xcom_pull(task_ids='process_token_task', key='user_email')
+
+        if user_email is None:
+            raise ValueError("user_email contains None instead of a string in index_emails")
+        
+        index_pending_emails(logger, user_email)
+        logger.info("Task: index_emails - Pending emails indexed successfully")
+    
+    except Exception as e:
+        logger.error(f"Task: index_emails - Error in index_emails: {e}")
+        raise
+
+def categorize_emails(**context):
+    """Categorize committed emails that have not been labeled yet"""
+    
+    from services.emailStages import categorize_pending_emails
+
+    try:
+        logger.info("Task: categorize_emails - Categorizing pending emails")
+        
+        user_email = context['task_instance'].xcom_pull(task_ids='process_token_task', key='user_email')
+
+        if user_email is None:
+            raise ValueError("user_email contains None instead of a string in categorize_emails")
+        
+        categorize_pending_emails(logger, user_email)
+        logger.info("Task: categorize_emails - Pending emails categorized successfully")
+    
+    except Exception as e:
+        logger.error(f"Task: categorize_emails - Error in categorize_emails: {e}")
+        raise
+
 def process_attachments(**context):
     """Process email attachments"""
     
+    from services.processEmailAttachments import process_emails_with_attachments
+
     try:
         logger.info("Task: process_attachments - Processing email attachments")
         
@@ -234,7 +298,8 @@ def process_attachments(**context):
         process_emails_with_attachments(
             logger,
             formatted_token['access_token'],
-            s3_bucket_name
+            s3_bucket_name,
+            formatted_token['email']
         )
         logger.info("Task: process_attachments - Email attachments processed successfully")
     
@@ -245,6 +310,8 @@ def process_attachments(**context):
 def extract_attachment_contents(**context):
     """Extract contents from email attachments"""
     
+    from services.extractAttachments import extract_contents_from_attachments
+
     try:
         logger.info("Task: extract_attachment_contents - Extracting contents from attachments")
         
@@ -258,6 +325,8 @@ def extract_attachment_contents(**context):
 def update_job(**context):
     """ Update the job's updated_at time in the database """
 
+    from database.loadtoDB import update_job_timestamp
+
     try:
         logger.info("Task: update_job - Updating job's updated_at timestamp")
         
@@ -334,6 +403,20 @@ with DAG(
         dag=dag,
     )
 
+    index_emails_task = PythonOperator(
+        task_id='index_emails_task',
+        python_callable=index_emails,
+        provide_context=True,
+        dag=dag,
+    )
+
+    categorize_emails_task = PythonOperator(
+        task_id='categorize_emails_task',
+        python_callable=categorize_emails,
+        provide_context=True,
+        dag=dag,
+    )
+
     process_attachments_task = PythonOperator(
         task_id='process_attachments_task',
         python_callable=process_attachments,
@@ -356,4 +439,12 @@ with DAG(
     )
 
     # Task dependencies
-    setup_db_task >> get_token_task >> process_token_task >> process_folders_task >> process_emails_task >> process_attachments_task >> extract_contents_task >> update_job_task
\ No newline at end of file
+    setup_db_task >> get_token_task >> process_token_task >> process_folders_task >> process_emails_task
+
+    # Once the emails are committed, the downstream stages run in parallel and
+    # each reads its pending work from Postgres. Extraction consumes the files
+    # written by the attachment transfer, so it stays chained after it.
+    process_emails_task >> [index_emails_task, categorize_emails_task, process_attachments_task]
+    process_attachments_task >> extract_contents_task
+
+    [index_emails_task, categorize_emails_task, extract_contents_task] >> update_job_task
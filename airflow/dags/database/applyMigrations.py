@@ -0,0 +1,75 @@
+import os
+import re
+
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Schema changes on top of setupTables.create_tables_in_db are kept as numbered
+# SQL files in database/migrations (NNNN_description.sql). Every file is applied
+# once, in order, inside its own transaction, and recorded in SCHEMA_MIGRATIONS.
+# New changes always go into a new file; applied files are never edited.
+
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+# Function to list the migration files as (version, name, path), oldest first
+def list_migrations():
+    migrations = []
+
+    for file_name in sorted(os.listdir(MIGRATIONS_DIRECTORY)):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIRECTORY, file_name)))
+
+    return migrations
+
+
+# Function to apply every migration that is not recorded in SCHEMA_MIGRATIONS yet
+def apply_migrations(logger):
+    logger.info("Airflow - POSTGRESQL - database/applyMigrations.py - apply_migrations() - Applying pending schema migrations")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to apply migrations")
+
+    applied = []
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            conn.commit()
+
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied_versions = {row[0] for row in cursor.fetchall()}
+
+            for version, name, path in list_migrations():
+                if version in applied_versions:
+                    continue
+
+                logger.info(f"Airflow - POSTGRESQL - database/applyMigrations.py - apply_migrations() - Applying migration {version:04d}_{name}")
+
+                with open(path, "r") as migration_file:
+                    cursor.execute(migration_file.read())
+
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+                applied.append(version)
+
+        logger.info(f"Airflow - POSTGRESQL - database/applyMigrations.py - apply_migrations() - {len(applied)} migrations applied")
+        return applied
+
+    except Exception as e:
+        logger.error(f"Airflow - POSTGRESQL - database/applyMigrations.py - apply_migrations() - Migration failed and was rolled back: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        close_connection(conn)
@@ -0,0 +1,120 @@
+import json
+from psycopg2.extras import RealDictCursor
+
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Attachments are stored once per sha256 of their bytes. The ATTACHMENT_BLOBS
+# row caches the extracted text and chunk embeddings, so a re-occurrence of
+# the same file (forwarded threads, newsletter logos) costs one lookup here
+# instead of an S3 upload, a parse and an embedding cycle.
+
+# Function to fetch a blob by its content hash
+def fetch_attachment_blob(logger, content_hash):
+    logger.info(f"Airflow - database/attachmentBlobs.py - fetch_attachment_blob() - Looking up blob {content_hash}")
+
+    conn = create_connection_to_postgresql()
+    blob = None
+
+    if not conn:
+        logger.error("Airflow - database/attachmentBlobs.py - fetch_attachment_blob() - Failed to connect to database")
+        return blob
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT * FROM attachment_blobs WHERE content_hash = %s", (content_hash,))
+            blob = cursor.fetchone()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentBlobs.py - fetch_attachment_blob() - Error fetching blob {content_hash}: {e}")
+
+    finally:
+        close_connection(conn)
+        return blob
+
+
+# Function to register a newly stored blob
+def insert_attachment_blob(logger, content_hash, s3_url, size, content_type):
+    logger.info(f"Airflow - database/attachmentBlobs.py - insert_attachment_blob() - Registering blob {content_hash}")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentBlobs.py - insert_attachment_blob() - Failed to connect to database")
+        return
+
+    insert_query = """
+        INSERT INTO attachment_blobs (content_hash, s3_url, size, content_type)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (content_hash) DO NOTHING
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(insert_query, (content_hash, s3_url, size, content_type))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentBlobs.py - insert_attachment_blob() - Error registering blob {content_hash}: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
+
+
+# Function to cache the extracted text (and page sections) of a blob
+def update_attachment_blob_text(logger, content_hash, extracted_text, extracted_sections=None):
+    logger.info(f"Airflow - database/attachmentBlobs.py - update_attachment_blob_text() - Caching extracted text for blob {content_hash}")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentBlobs.py - update_attachment_blob_text() - Failed to connect to database")
+        return
+
+    update_query = """
+        UPDATE attachment_blobs
+        SET extracted_text = %s, extracted_sections = %s, extracted_at = CURRENT_TIMESTAMP
+        WHERE content_hash = %s
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            sections = json.dumps(extracted_sections) if extracted_sections is not None else None
+            cursor.execute(update_query, (extracted_text, sections, content_hash))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentBlobs.py - update_attachment_blob_text() - Error caching text for blob {content_hash}: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
+
+
+# Function to cache the chunk embeddings of a blob
+def update_attachment_blob_embeddings(logger, content_hash, embedded_chunks):
+    logger.info(f"Airflow - database/attachmentBlobs.py - update_attachment_blob_embeddings() - Caching {len(embedded_chunks)} chunk embeddings for blob {content_hash}")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentBlobs.py - update_attachment_blob_embeddings() - Failed to connect to database")
+        return
+
+    update_query = """
+        UPDATE attachment_blobs
+        SET embedded_chunks = %s, embedded_at = CURRENT_TIMESTAMP
+        WHERE content_hash = %s
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(update_query, (json.dumps(embedded_chunks), content_hash))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentBlobs.py - update_attachment_blob_embeddings() - Error caching embeddings for blob {content_hash}: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
@@ -0,0 +1,159 @@
+from psycopg2.extras import RealDictCursor
+
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Every attachment written to the download directory is registered in the
+# ATTACHMENT_MANIFEST table with its size, mtime and hash. The extraction stage
+# only picks up entries that are still pending, so its runtime follows the
+# number of new attachments rather than everything ever downloaded.
+
+# Function to register a local attachment file in the manifest
+def register_manifest_entry(logger, entry):
+    logger.info(f"Airflow - database/attachmentManifest.py - register_manifest_entry() - Registering {entry['path']} in the manifest")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentManifest.py - register_manifest_entry() - Failed to connect to database")
+        return
+
+    # A file whose bytes changed has to be extracted and embedded again
+    upsert_query = """
+        INSERT INTO attachment_manifest (
+            path, user_email, email_id, file_type, file_name, size, mtime, content_hash
+        ) VALUES (
+            %(path)s, %(user_email)s, %(email_id)s, %(file_type)s, %(file_name)s, %(size)s, %(mtime)s, %(content_hash)s
+        )
+        ON CONFLICT (path)
+        DO UPDATE SET
+            size = EXCLUDED.size,
+            mtime = EXCLUDED.mtime,
+            content_hash = EXCLUDED.content_hash,
+            extraction_status = CASE
+                WHEN attachment_manifest.content_hash IS DISTINCT FROM EXCLUDED.content_hash THEN 'pending'
+                ELSE attachment_manifest.extraction_status
+            END,
+            attempts = CASE
+                WHEN attachment_manifest.content_hash IS DISTINCT FROM EXCLUDED.content_hash THEN 0
+                ELSE attachment_manifest.attempts
+            END,
+            embedded_status = CASE
+                WHEN attachment_manifest.content_hash IS DISTINCT FROM EXCLUDED.content_hash THEN 'pending'
+                ELSE attachment_manifest.embedded_status
+            END,
+            updated_at = CURRENT_TIMESTAMP
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(upsert_query, entry)
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentManifest.py - register_manifest_entry() - Error registering {entry['path']}: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
+
+
+# Function to fetch manifest entries that still need extraction or embedding
+def fetch_pending_manifest_entries(logger):
+    logger.info("Airflow - database/attachmentManifest.py - fetch_pending_manifest_entries() - Fetching pending manifest entries")
+
+    conn = create_connection_to_postgresql()
+    entries = []
+
+    if not conn:
+        logger.error("Airflow - database/attachmentManifest.py - fetch_pending_manifest_entries() - Failed to connect to database")
+        return entries
+
+    query = """
+        SELECT *
+        FROM attachment_manifest
+        WHERE extraction_status IN ('pending', 'retry')
+           OR (extraction_status = 'extracted' AND embedded_status = 'pending')
+        ORDER BY updated_at ASC
+    """
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query)
+            entries = cursor.fetchall()
+            logger.info(f"Airflow - database/attachmentManifest.py - fetch_pending_manifest_entries() - Found {len(entries)} pending entries")
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentManifest.py - fetch_pending_manifest_entries() - Error fetching pending entries: {e}")
+
+    finally:
+        close_connection(conn)
+        return entries
+
+
+# Function to update the extraction and/or embedding status of manifest entries
+def update_manifest_status(logger, paths, extraction_status=None, embedded_status=None):
+    if not paths:
+        return
+
+    logger.info(f"Airflow - database/attachmentManifest.py - update_manifest_status() - Updating {len(paths)} manifest entries (extraction: {extraction_status}, embedding: {embedded_status})")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentManifest.py - update_manifest_status() - Failed to connect to database")
+        return
+
+    update_query = """
+        UPDATE attachment_manifest
+        SET extraction_status = COALESCE(%s, extraction_status),
+            embedded_status = COALESCE(%s, embedded_status),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE path = ANY(%s)
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(update_query, (extraction_status, embedded_status, list(paths)))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentManifest.py - update_manifest_status() - Error updating manifest entries: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
+
+
+# Function to put failed or timed out entries on the retry list
+def mark_manifest_entries_for_retry(logger, paths, max_attempts):
+    if not paths:
+        return
+
+    logger.info(f"Airflow - database/attachmentManifest.py - mark_manifest_entries_for_retry() - Marking {len(paths)} manifest entries for retry")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/attachmentManifest.py - mark_manifest_entries_for_retry() - Failed to connect to database")
+        return
+
+    # Entries that keep failing are given up on after max_attempts runs
+    update_query = """
+        UPDATE attachment_manifest
+        SET attempts = attempts + 1,
+            extraction_status = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'retry' END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE path = ANY(%s)
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(update_query, (max_attempts, list(paths)))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/attachmentManifest.py - mark_manifest_entries_for_retry() - Error marking manifest entries for retry: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
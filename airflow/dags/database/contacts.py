@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Senders and recipients reference one row per address in CONTACTS through an
+# integer contact_id. The loader resolves addresses in bulk, and keeps the ids
+# it has seen in a per-process LRU so most participants cost no query at all.
+
+CONTACT_CACHE = OrderedDict()
+
+
+# Function to normalize an email address to its contact key
+def normalize_address(address):
+    return (address or "").strip().lower()
+
+
+# Function to read an address from the contact cache
+def get_cached_contact_id(address):
+    contact_id = CONTACT_CACHE.get(address)
+
+    if contact_id is not None:
+        CONTACT_CACHE.move_to_end(address)
+
+    return contact_id
+
+
+# Function to add an address to the contact cache, evicting the least recently used ones
+def cache_contact_id(address, contact_id):
+    CONTACT_CACHE[address] = contact_id
+    CONTACT_CACHE.move_to_end(address)
+
+    while len(CONTACT_CACHE) > int(os.getenv("CONTACT_CACHE_SIZE", 50000)):
+        CONTACT_CACHE.popitem(last=False)
+
+
+# Function to get the contact ids of participants, creating the missing contacts in one statement
+def get_or_create_contact_ids(logger, participants):
+    contact_ids = {}
+    missing = {}
+
+    for participant in participants:
+        address = normalize_address(participant.get("email_address"))
+
+        # Calendar reminders and similar items have no address
+        if not address or address in contact_ids:
+            continue
+
+        contact_id = get_cached_contact_id(address)
+        if contact_id is not None:
+            contact_ids[address] = contact_id
+        elif address not in missing or not missing[address]:
+            missing[address] = participant.get("name") or None
+
+    if not missing:
+        return contact_ids
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to resolve contacts")
+
+    # DO UPDATE instead of DO NOTHING, so RETURNING also yields the contacts that already existed
+    upsert_query = """
+        INSERT INTO contacts (address, display_name, domain)
+        VALUES %s
+        ON CONFLICT (address)
+        DO UPDATE SET
+            display_name = COALESCE(EXCLUDED.display_name, contacts.display_name)
+        RETURNING id, address
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            # Sorted so concurrent runs lock the contact rows in the same order and cannot deadlock
+            rows = [(address, name, address.split("@")[-1] if "@" in address else None) for address, name in sorted(missing.items())]
+            returned = execute_values(cursor, upsert_query, rows, fetch=True)
+            conn.commit()
+
+        for contact_id, address in returned:
+            contact_ids[address] = contact_id
+            cache_contact_id(address, contact_id)
+
+        logger.info(f"Airflow - database/contacts.py - get_or_create_contact_ids() - Resolved {len(returned)} contacts from the database, {len(contact_ids) - len(returned)} from the cache")
+        return contact_ids
+
+    except Exception as e:
+        logger.error(f"Airflow - database/contacts.py - get_or_create_contact_ids() - Error resolving contacts: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        close_connection(conn)
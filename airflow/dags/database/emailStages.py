@@ -0,0 +1,112 @@
+from psycopg2.extras import RealDictCursor
+
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Emails are committed to Postgres by the load stage first. Vector indexing and
+# categorization run afterwards as separate DAG tasks, each picking up the
+# emails whose EMAILS.vector_indexed / EMAILS.categorized flag is still FALSE.
+# A failed email keeps its flag and is retried by the next run.
+
+PENDING_EMAILS_QUERY = """
+    SELECT DISTINCT ON (e.id)
+        u.email AS user_email,
+        e.owner_user_id,
+        e.id,
+        e.subject,
+        e.body,
+        e.reply_to,
+        e.conversation_id,
+        e.conversation_index,
+        e.created_datetime,
+        e.received_datetime,
+        e.sent_datetime,
+        COALESCE(c.display_name, '') AS sender_name,
+        COALESCE(c.address, '') AS sender_email
+    FROM users u
+    JOIN emails e ON e.owner_user_id = u.id
+    LEFT JOIN senders s ON s.email_id = e.id
+    LEFT JOIN contacts c ON c.id = s.contact_id
+    WHERE u.email = %(user_email)s
+      AND e.{flag} = FALSE
+      AND NOT (e.id = ANY(%(exclude_ids)s))
+    ORDER BY e.id
+    LIMIT %(limit)s
+"""
+
+
+# Function to fetch a batch of emails of a user whose stage flag is not set yet
+def fetch_pending_emails(logger, user_email, flag, limit, exclude_ids=()):
+    logger.info(f"Airflow - database/emailStages.py - fetch_pending_emails() - Fetching emails of {user_email} with {flag} = FALSE")
+
+    conn = create_connection_to_postgresql()
+
+    # An empty batch means the stage is done, so a failure must not look like one
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to fetch pending emails")
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(PENDING_EMAILS_QUERY.format(flag=flag), {"user_email": user_email, "limit": limit, "exclude_ids": list(exclude_ids)})
+            emails = [dict(row) for row in cursor.fetchall()]
+
+        logger.info(f"Airflow - database/emailStages.py - fetch_pending_emails() - Fetched {len(emails)} emails")
+        return emails
+
+    except Exception as e:
+        logger.error(f"Airflow - database/emailStages.py - fetch_pending_emails() - Error fetching pending emails: {e}")
+        raise
+
+    finally:
+        close_connection(conn)
+
+
+# Function to set a stage flag on processed emails
+def mark_emails(logger, email_ids, flag, value=True):
+    if not email_ids:
+        return
+
+    conn = create_connection_to_postgresql()
+
+    # The stage loops fetch unflagged emails until none are left, so an unsaved flag must stop them
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to update stage flags")
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"UPDATE emails SET {flag} = %s WHERE id = ANY(%s)", (value, list(email_ids)))
+            conn.commit()
+
+        logger.info(f"Airflow - database/emailStages.py - mark_emails() - Set {flag} = {value} on {len(email_ids)} emails")
+
+    except Exception as e:
+        logger.error(f"Airflow - database/emailStages.py - mark_emails() - Error updating {flag}: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        close_connection(conn)
+
+
+# Function to drop the generated categories of emails so they can be labeled again
+def delete_generated_categories(logger, email_ids):
+    if not email_ids:
+        return
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/emailStages.py - delete_generated_categories() - Failed to connect to database")
+        return
+
+    # Categories set by the user are kept
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM categories WHERE email_id = ANY(%s) AND user_defined_category IS NULL", (list(email_ids),))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/emailStages.py - delete_generated_categories() - Error deleting categories: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
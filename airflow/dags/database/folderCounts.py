@@ -0,0 +1,42 @@
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# EMAIL_FOLDERS.total_item_count / unread_item_count are what the mailbox sidebar
+# shows. They are recomputed from the committed emails of a user after every sync,
+# so reading them costs one row per folder instead of a count over EMAILS.
+
+# Function to recompute the total and unread counts of every folder of a user
+def refresh_folder_counts(logger, user_email):
+    logger.info(f"Airflow - database/folderCounts.py - refresh_folder_counts() - Refreshing folder counts of {user_email}")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to refresh folder counts")
+
+    # Folders that lost all their emails go back to zero
+    update_query = """
+        UPDATE email_folders f
+        SET total_item_count = (
+                SELECT count(*) FROM emails e WHERE e.owner_user_id = u.id AND e.parent_folder_id = f.id
+            ),
+            unread_item_count = (
+                SELECT count(*) FROM emails e WHERE e.owner_user_id = u.id AND e.parent_folder_id = f.id AND e.is_read = FALSE
+            )
+        FROM users u
+        WHERE f.owner_user_id = u.id
+          AND u.email = %(user_email)s
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(update_query, {"user_email": user_email})
+            conn.commit()
+            logger.info(f"Airflow - database/folderCounts.py - refresh_folder_counts() - Refreshed counts of {cursor.rowcount} folders")
+
+    except Exception as e:
+        logger.error(f"Airflow - database/folderCounts.py - refresh_folder_counts() - Error refreshing folder counts: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        close_connection(conn)
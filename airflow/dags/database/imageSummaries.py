@@ -0,0 +1,58 @@
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# Vision summaries are keyed by the sha256 of the image bytes (the content hash
+# of its attachment blob), so an image is only described once across mailboxes
+# and a summary is only ever reused for exactly the same image.
+
+# Function to fetch a cached summary by content hash
+def fetch_image_summary(logger, content_hash):
+    logger.info(f"Airflow - database/imageSummaries.py - fetch_image_summary() - Looking up summary for image {content_hash}")
+
+    conn = create_connection_to_postgresql()
+    summary = None
+
+    if not conn:
+        logger.error("Airflow - database/imageSummaries.py - fetch_image_summary() - Failed to connect to database")
+        return summary
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT summary FROM image_summaries WHERE content_hash = %s", (content_hash,))
+            row = cursor.fetchone()
+            summary = row[0] if row else None
+
+    except Exception as e:
+        logger.error(f"Airflow - database/imageSummaries.py - fetch_image_summary() - Error fetching summary for image {content_hash}: {e}")
+
+    finally:
+        close_connection(conn)
+        return summary
+
+
+# Function to cache the summary of an image
+def insert_image_summary(logger, content_hash, summary):
+    logger.info(f"Airflow - database/imageSummaries.py - insert_image_summary() - Caching summary for image {content_hash}")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/imageSummaries.py - insert_image_summary() - Failed to connect to database")
+        return
+
+    insert_query = """
+        INSERT INTO image_summaries (content_hash, summary)
+        VALUES (%s, %s)
+        ON CONFLICT (content_hash) DO NOTHING
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(insert_query, (content_hash, summary))
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/imageSummaries.py - insert_image_summary() - Error caching summary for image {content_hash}: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
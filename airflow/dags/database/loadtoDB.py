@@ -1,10 +1,27 @@
+import os
 import ast
-import uuid
 import json
+import hashlib
 
 from database.connectDB import create_connection_to_postgresql, close_connection
-from services.vectors import create_embeddings_and_index
-from services.labeling import label_email
+from database.contacts import get_or_create_contact_ids, normalize_address
+from database.mailboxView import refresh_mailbox_view
+
+# Participant and category rows are keyed by a hash of their natural key, so
+# re-syncing an email updates its rows instead of adding another copy.
+# The same keys are computed in SQL by migrations/0003_deterministic_keys.sql.
+
+# Function to build a deterministic row key from its natural key parts
+def build_row_key(*parts):
+    return hashlib.md5(":".join(str(part or "") for part in parts).encode("utf-8")).hexdigest()
+
+
+# Function to get the upsert target of EMAILS, RECIPIENTS and CATEGORIES
+def get_owner_conflict_target():
+    # Only partition_tables_by_owner (EMAIL_PARTITIONS > 0) rekeys them by (owner_user_id, id).
+    # Otherwise id is still the primary key, and rows without an owner never match (owner_user_id, id)
+    return "(owner_user_id, id)" if int(os.getenv("EMAIL_PARTITIONS", 0)) > 0 else "(id)"
+
 
 # Function to store token response with respect to user in Users table
 def load_users_tokendata_to_db(logger, formatted_token_response):
@@ -54,6 +71,27 @@ def load_users_tokendata_to_db(logger, formatted_token_response):
             return user_email
 
 
+# Function to get the id of a user from their email address
+def fetch_user_id(logger, user_email):
+    conn = create_connection_to_postgresql()
+    user_id = None
+
+    if conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id FROM users WHERE email = %s", (user_email,))
+                record = cursor.fetchone()
+                user_id = record[0] if record else None
+
+        except Exception as e:
+            logger.error(f"Airflow - database/loadtoDB.py - fetch_user_id() - Error fetching user id of {user_email} = {e}")
+
+        finally:
+            close_connection(conn)
+
+    return user_id
+
+
 # Fuction to load email link data into EMAIL_LINKS table
 def insert_or_update_email_links(logger, email_link_data):
     logger.info("Airflow - database/loadtoDB.py - insert_or_update_email_links() - Inserting or updating email links data in EMAIL_LINKS table")
@@ -99,17 +137,30 @@ def insert_email_folders(logger, email_folder):
             cursor = conn.cursor()
             emailfolder_insert_query = f"""
                         INSERT INTO email_folders (
-                            id, display_name, parent_folder_id, child_folder_count, unread_item_count,
+                            id, owner_user_id, display_name, parent_folder_id, child_folder_count, unread_item_count,
                             total_item_count, size_in_bytes, is_hidden, created_at
                         )
                         VALUES (
-                            %(id)s, %(display_name)s, %(parent_folder_id)s, %(child_folder_count)s,
+                            %(id)s, %(owner_user_id)s, %(display_name)s, %(parent_folder_id)s, %(child_folder_count)s,
                             %(unread_item_count)s, %(total_item_count)s, %(size_in_bytes)s,
                             %(is_hidden)s, CURRENT_TIMESTAMP
                         )
-                        ON CONFLICT (id) DO NOTHING;
+                        ON CONFLICT (id)
+                        DO UPDATE SET
+                            owner_user_id = COALESCE(EXCLUDED.owner_user_id, email_folders.owner_user_id),
+                            display_name = EXCLUDED.display_name,
+                            parent_folder_id = EXCLUDED.parent_folder_id,
+                            child_folder_count = EXCLUDED.child_folder_count,
+                            size_in_bytes = EXCLUDED.size_in_bytes,
+                            is_hidden = EXCLUDED.is_hidden;
                     """
             cursor.execute(emailfolder_insert_query, email_folder)
+
+            # Renamed folders are renamed in the mailbox listing too
+            cursor.execute(
+                "UPDATE mailbox_view SET folder_name = %(display_name)s WHERE parent_folder_id = %(id)s AND folder_name IS DISTINCT FROM %(display_name)s",
+                email_folder
+            )
             conn.commit()
             logger.info("Airflow - database/loadtoDB.py - insert_email_folders() - Email folders inserted successfully in EMAIL_FOLDERS table")
 
@@ -130,26 +181,28 @@ def insert_email_data(logger, email_data):
     if conn:
         try:
             cursor = conn.cursor()
+            # A new change_key means Graph edited the email, so it is embedded and categorized again
             email_insert_query = f"""
                     INSERT INTO emails (
-                    id, content_type, body, body_preview, change_key, conversation_id, conversation_index, 
+                    id, owner_user_id, content_type, body, body_preview, change_key, conversation_id, conversation_index, 
                     created_datetime, created_datetime_timezone, end_datetime, end_datetime_timezone, 
                     has_attachments, importance, inference_classification, is_draft, is_read, 
                     is_all_day, is_out_of_date, meeting_message_type, meeting_request_type, 
                     odata_etag, odata_value, parent_folder_id, received_datetime, recurrence, 
                     reply_to, response_type, sent_datetime, start_datetime, start_datetime_timezone, 
-                    subject, type, web_link
+                    subject, type, web_link, search_sender
                 ) VALUES (
-                    %(id)s, %(content_type)s, %(body)s, %(body_preview)s, %(change_key)s, %(conversation_id)s, %(conversation_index)s,
+                    %(id)s, %(owner_user_id)s, %(content_type)s, %(body)s, %(body_preview)s, %(change_key)s, %(conversation_id)s, %(conversation_index)s,
                     %(created_datetime)s, %(created_datetime_timezone)s, %(end_datetime)s, %(end_datetime_timezone)s,
                     %(has_attachments)s, %(importance)s, %(inference_classification)s, %(is_draft)s, %(is_read)s,
                     %(is_all_day)s, %(is_out_of_date)s, %(meeting_message_type)s, %(meeting_request_type)s,
                     %(odata_etag)s, %(odata_value)s, %(parent_folder_id)s, %(received_datetime)s, %(recurrence)s,
                     %(reply_to)s, %(response_type)s, %(sent_datetime)s, %(start_datetime)s, %(start_datetime_timezone)s,
-                    %(subject)s, %(type)s, %(web_link)s
+                    %(subject)s, %(type)s, %(web_link)s, %(search_sender)s
                 )
-                ON CONFLICT (id)
+                ON CONFLICT {get_owner_conflict_target()}
                 DO UPDATE SET
+                    owner_user_id = COALESCE(emails.owner_user_id, EXCLUDED.owner_user_id),
                     content_type = EXCLUDED.content_type,
                     body = EXCLUDED.body,
                     body_preview = EXCLUDED.body_preview,
@@ -181,7 +234,10 @@ def insert_email_data(logger, email_data):
                     start_datetime_timezone = EXCLUDED.start_datetime_timezone,
                     subject = EXCLUDED.subject,
                     type = EXCLUDED.type,
-                    web_link = EXCLUDED.web_link
+                    web_link = EXCLUDED.web_link,
+                    search_sender = EXCLUDED.search_sender,
+                    vector_indexed = emails.vector_indexed AND emails.change_key IS NOT DISTINCT FROM EXCLUDED.change_key,
+                    categorized = emails.categorized AND emails.change_key IS NOT DISTINCT FROM EXCLUDED.change_key
                 """
 
             cursor.execute(email_insert_query, email_data)
@@ -207,15 +263,14 @@ def insert_sender_data(logger, sender_data):
             cursor = conn.cursor()
             sender_insert_query = f"""
                     INSERT INTO senders (
-                        id, email_id, email_address, name
+                        id, email_id, contact_id
                     ) VALUES (
-                        %(id)s, %(email_id)s, %(email_address)s, %(name)s
+                        %(id)s, %(email_id)s, %(contact_id)s
                     )
-                    ON CONFLICT (id) 
+                    ON CONFLICT (email_id) 
                     DO UPDATE SET
-                        email_id = EXCLUDED.email_id,
-                        email_address = EXCLUDED.email_address,
-                        name = EXCLUDED.name
+                        id = EXCLUDED.id,
+                        contact_id = EXCLUDED.contact_id
                 """
 
             cursor.execute(sender_insert_query, sender_data)
@@ -241,20 +296,25 @@ def insert_recipient_data(logger, recipients_data):
             cursor = conn.cursor()
             recipient_insert_query = f"""
                     INSERT INTO recipients (
-                        id, email_id, type, email_address, name
+                        id, owner_user_id, email_id, type, contact_id
                     ) VALUES (
-                        %(id)s, %(email_id)s, %(type)s, %(email_address)s, %(name)s
+                        %(id)s, %(owner_user_id)s, %(email_id)s, %(type)s, %(contact_id)s
                     )
-                    ON CONFLICT (id) 
+                    ON CONFLICT {get_owner_conflict_target()}
                     DO UPDATE SET
-                        email_id = EXCLUDED.email_id,
-                        type = EXCLUDED.type,
-                        email_address = EXCLUDED.email_address,
-                        name = EXCLUDED.name
+                        owner_user_id = COALESCE(recipients.owner_user_id, EXCLUDED.owner_user_id),
+                        contact_id = EXCLUDED.contact_id
                 """
 
             for recipient in recipients_data:
                 cursor.execute(recipient_insert_query, recipient)
+
+            # Participants removed from the email since the last sync
+            if recipients_data:
+                cursor.execute(
+                    "DELETE FROM recipients WHERE email_id = %s AND NOT (id = ANY(%s))",
+                    (recipients_data[0]["email_id"], [recipient["id"] for recipient in recipients_data])
+                )
             conn.commit()
             logger.info("Airflow - database/loadtoDB.py - insert_recipient_data() - RECIPIENTS contents inserted successfully in RECIPIENTS table")
 
@@ -298,18 +358,19 @@ def insert_flags_data(logger, flags_data):
 
 
 # Function to save email categories
-def insert_category_data(logger, email_id, labels):
+def insert_category_data(logger, email_id, labels, owner_user_id=None):
     logger.info("Airflow - database/loadtoDB.py - insert_category_data() - Loading email categories into the database")
 
     conn = create_connection_to_postgresql()
 
     if conn:
-        categories_insert_query = """
+        categories_insert_query = f"""
             INSERT INTO categories (
-                id, email_id, category
+                id, owner_user_id, email_id, category
             ) VALUES (
-                %s, %s, %s  
+                %s, %s, %s, %s
             )
+            ON CONFLICT {get_owner_conflict_target()} DO NOTHING
         """
         
         try:
@@ -318,7 +379,7 @@ def insert_category_data(logger, email_id, labels):
 
             with conn.cursor() as cursor:
                 for label in labels:
-                    cursor.execute(categories_insert_query, (str(uuid.uuid4()), str(email_id), str(label),))
+                    cursor.execute(categories_insert_query, (build_row_key(email_id, "category", str(label).lower()), owner_user_id, str(email_id), str(label),))
                 
                 conn.commit()
                 logger.info("Airflow - database/loadtoDB.py - insert_category_data() - Inserted email category into the database")
@@ -333,10 +394,16 @@ def insert_category_data(logger, email_id, labels):
 def load_email_info_to_db(logger, formatted_mail_responses, user_email):
     logger.info("Airflow - database/loadtoDB.py - load_email_info_to_db() - Loading mail information into the database")
 
+    # Every row is stamped with the mailbox it was synced from
+    owner_user_id = fetch_user_id(logger, user_email)
+    if owner_user_id is None:
+        raise ValueError(f"No user found with email {user_email}, cannot assign the mailbox owner")
+
     for email in formatted_mail_responses:
         # Email data
         email_data = {
             "id"                        : email.get("id"),
+            "owner_user_id"             : owner_user_id,
             "content_type"              : email.get("body", None).get("contentType", "html"),
             "body"                      : email.get("body", None).get("content", ""),
             "body_preview"              : email.get("bodyPreview", None),
@@ -359,7 +426,7 @@ def load_email_info_to_db(logger, formatted_mail_responses, user_email):
             "odata_etag"                : email.get("@odata.etag", None),
             "odata_value"               : email.get("@odata.value", None),
             "parent_folder_id"          : email.get("parentFolderId", None),
-            "received_datetime"         : email.get("receivedDateTime", None) or None,
+            "received_datetime"         : email.get("receivedDateTime", None) or email.get("sentDateTime", None) or email.get("createdDateTime", None) or None,
             "recurrence"                : json.dumps(email.get("recurrence")) if email.get("recurrence", None) else None,
             "reply_to"                  : json.dumps(email.get("replyTo")) if email.get("replyTo", None) else None,
             "response_type"             : email.get("responseType", None),
@@ -388,12 +455,15 @@ def load_email_info_to_db(logger, formatted_mail_responses, user_email):
             sender_dict = {}
         
         sender_data = {
-            "id"            : str(uuid.uuid4()),
+            "id"            : build_row_key(email.get("id", ""), "from", sender_dict.get("address", "").lower()),
             "email_id"      : email.get("id", ""),
             "email_address" : sender_dict.get("address", ""),
             "name"          : sender_dict.get("name", "")
         }
 
+        # Searchable sender text, part of the generated EMAILS.search_vector
+        email_data["search_sender"] = " ".join(filter(None, [sender_data["name"], sender_data["email_address"]])) or None
+
         # Recipient data
         recipients_data = []
         for recipient_type, recipients_key in [("to", "toRecipients"), ("cc", "ccRecipients"), ("bcc", "bccRecipients")]:
@@ -401,13 +471,19 @@ def load_email_info_to_db(logger, formatted_mail_responses, user_email):
                 recipient_info = recipient.get("emailAddress", "")
                 recipient_dict = ast.literal_eval(recipient_info)
                 recipients_data.append({
-                    "id"            : str(uuid.uuid4()),
+                    "id"            : build_row_key(email.get("id", ""), recipient_type, recipient_dict.get('address', "").lower()),
+                    "owner_user_id" : owner_user_id,
                     "email_id"      : email.get("id", ""),
                     "type"          : recipient_type,
                     "email_address" : recipient_dict.get('address', ""),
                     "name"          : recipient_dict.get('name', "")
                 })
 
+        # Participants reference their contact by id, resolved for the whole email at once
+        contact_ids = get_or_create_contact_ids(logger, [sender_data] + recipients_data)
+        for participant in [sender_data] + recipients_data:
+            participant["contact_id"] = contact_ids.get(normalize_address(participant["email_address"]))
+
         # Email flags data
         flag_data = {
             "email_id"      : email.get("id", ""),
@@ -434,43 +510,11 @@ def load_email_info_to_db(logger, formatted_mail_responses, user_email):
         insert_flags_data(logger, flag_data)
         logger.info(f"Airflow - database/loadtoDB.py - load_email_info_to_db() - flags contents uploaded to FLAGS table in database")
 
-        # Finally, index the email contents in Milvus
-        data_to_index = {
-            "subject"           : email_data["subject"],
-            "body"              : email_data["body"],
-            "sender_name"       : sender_data["name"],
-            "sender_email"      : sender_data["email_address"],
-            "reply_to"          : email_data["reply_to"],
-            "created_datetime"  : email_data["created_datetime"],
-            "received_datetime" : email_data["received_datetime"],
-            "sent_datetime"     : email_data["sent_datetime"],
-        }
-
-        metadata = {
-            "id"                 : email_data["id"],
-            "user_email"         : user_email,
-            "conversation_id"    : email_data["conversation_id"],
-            "conversation_index" : email_data["conversation_index"],
-            "message_type"       : "email"
-        }
-
-        create_embeddings_and_index(data_to_index=data_to_index, metadata=metadata)
-        
-        # Email Categorization
-        cat_data = {
-            "sender_email" : sender_data["email_address"],
-            "subject"      : email_data["subject"],
-            "body"         : email_data["body"],
-            "reply_to"     : email_data["reply_to"]
-        }
-
-        categories = label_email(email_dict=cat_data)
-
-        # Insert category data into Postgres        
-        logger.info(f"Airflow - database/loadtoDB.py - load_email_info_to_db() - Loading 'category' contents to CATEGORY table in database")
-        insert_category_data(logger, email_data["id"], categories)
-        logger.info(f"Airflow - database/loadtoDB.py - load_email_info_to_db() - 'category' contents uploaded to CATEGORY table in database")
+        # Vector indexing and categorization run as separate DAG tasks on the committed
+        # emails (see services/emailStages.py)
 
+    # The listing rows of the page, once all of its emails are committed
+    refresh_mailbox_view(logger, [email.get("id") for email in formatted_mail_responses])
 
 
 def fetch_new_job(logger):
@@ -0,0 +1,74 @@
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# MAILBOX_VIEW (see migrations/0008_mailbox_view.sql) is the denormalized table
+# behind the FastAPI mailbox listing. Every stage that changes what the list
+# shows (loading, categorizing, attachments) rebuilds the rows of the emails it
+# touched once its own writes are committed.
+
+MAILBOX_VIEW_UPSERT_QUERY = """
+    INSERT INTO mailbox_view (
+        owner_user_id, user_email, email_id, parent_folder_id, folder_name, sender_email, sender_name,
+        subject, body_preview, sent_datetime, received_datetime, is_read, has_attachments, categories, attachments
+    )
+    SELECT
+        e.owner_user_id, u.email, e.id, e.parent_folder_id, f.display_name, sc.address, sc.display_name,
+        e.subject, e.body_preview, e.sent_datetime, e.received_datetime, e.is_read, e.has_attachments,
+        COALESCE((SELECT array_agg(c.category ORDER BY c.category) FROM categories c WHERE c.email_id = e.id), ARRAY[]::TEXT[]),
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('name', a.name, 'content_type', a.content_type, 'size', a.size, 'bucket_url', a.bucket_url) ORDER BY a.name)
+            FROM attachments a WHERE a.email_id = e.id
+        ), '[]'::JSONB)
+    FROM emails e
+    JOIN users u ON u.id = e.owner_user_id
+    LEFT JOIN senders s ON s.email_id = e.id
+    LEFT JOIN contacts sc ON sc.id = s.contact_id
+    LEFT JOIN email_folders f ON f.id = e.parent_folder_id
+    {email_filter}
+    ON CONFLICT (owner_user_id, email_id)
+    DO UPDATE SET
+        user_email = EXCLUDED.user_email,
+        parent_folder_id = EXCLUDED.parent_folder_id,
+        folder_name = EXCLUDED.folder_name,
+        sender_email = EXCLUDED.sender_email,
+        sender_name = EXCLUDED.sender_name,
+        subject = EXCLUDED.subject,
+        body_preview = EXCLUDED.body_preview,
+        sent_datetime = EXCLUDED.sent_datetime,
+        received_datetime = EXCLUDED.received_datetime,
+        is_read = EXCLUDED.is_read,
+        has_attachments = EXCLUDED.has_attachments,
+        categories = EXCLUDED.categories,
+        attachments = EXCLUDED.attachments,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+# Function to rebuild the mailbox view rows of emails, or of every email when email_ids is None
+def refresh_mailbox_view(logger, email_ids=None):
+    if email_ids is not None:
+        email_ids = list(email_ids)
+
+        if not email_ids:
+            return
+
+    logger.info(f"Airflow - database/mailboxView.py - refresh_mailbox_view() - Refreshing the mailbox view of {len(email_ids) if email_ids is not None else 'all'} emails")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        raise ConnectionError("Failed to connect to the database to refresh the mailbox view")
+
+    email_filter = "WHERE e.id = ANY(%(email_ids)s)" if email_ids is not None else ""
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(MAILBOX_VIEW_UPSERT_QUERY.format(email_filter=email_filter), {"email_ids": email_ids})
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/mailboxView.py - refresh_mailbox_view() - Error refreshing the mailbox view: {e}")
+        conn.rollback()
+        raise
+
+    finally:
+        close_connection(conn)
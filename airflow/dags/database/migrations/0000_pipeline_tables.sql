@@ -0,0 +1,57 @@
+-- Tables and columns the attachment and staging pipeline added to
+-- setupTables.create_tables_in_db. Databases created before them only get
+-- schema changes through migrations (setup_database skips create_tables_in_db
+-- once DB_SETUP is set), so they are created here before 0001 indexes them.
+-- Every statement is a no-op on a database created by create_tables_in_db.
+
+CREATE TABLE IF NOT EXISTS attachment_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    s3_url TEXT,
+    size BIGINT,
+    content_type TEXT,
+    extracted_text TEXT DEFAULT NULL,
+    extracted_sections JSONB DEFAULT NULL,
+    embedded_chunks JSONB DEFAULT NULL,
+    extracted_at TIMESTAMP DEFAULT NULL,
+    embedded_at TIMESTAMP DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE attachments ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) REFERENCES attachment_blobs(content_hash);
+
+CREATE TABLE IF NOT EXISTS attachment_manifest (
+    path TEXT PRIMARY KEY,
+    user_email VARCHAR(255),
+    email_id VARCHAR(255),
+    file_type VARCHAR(50),
+    file_name TEXT,
+    size BIGINT,
+    mtime DOUBLE PRECISION,
+    content_hash VARCHAR(64),
+    extraction_status VARCHAR(20) DEFAULT 'pending',
+    embedded_status VARCHAR(20) DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS image_summaries (
+    image_hash VARCHAR(16) PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS vector_indexed BOOLEAN DEFAULT FALSE;
+
+-- Emails categorized before the flag existed already have their categories,
+-- marking them keeps the categorize stage from running them through the LLM again
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'emails' AND column_name = 'categorized'
+    ) THEN
+        ALTER TABLE emails ADD COLUMN categorized BOOLEAN DEFAULT FALSE;
+        UPDATE emails e SET categorized = TRUE WHERE EXISTS (SELECT 1 FROM categories c WHERE c.email_id = e.id);
+    END IF;
+END $$;
@@ -0,0 +1,27 @@
+-- Indexes for the hot read paths. create_tables_in_db only creates primary keys,
+-- so every participant join and folder listing used to be a sequential scan.
+
+-- Participant joins (fetch_emails, load_email, get_thread_emails, fetch_emails_with_attachments)
+CREATE INDEX IF NOT EXISTS idx_recipients_email_id ON recipients (email_id);
+CREATE INDEX IF NOT EXISTS idx_recipients_email_address ON recipients (email_address, email_id);
+CREATE INDEX IF NOT EXISTS idx_senders_email_id ON senders (email_id);
+CREATE INDEX IF NOT EXISTS idx_senders_email_address ON senders (email_address, email_id);
+
+-- Folder listing ordered by newest first (fetch_emails)
+CREATE INDEX IF NOT EXISTS idx_emails_folder_received ON emails (parent_folder_id, received_datetime DESC);
+CREATE INDEX IF NOT EXISTS idx_email_folders_display_name ON email_folders (display_name);
+
+-- Threads (ThreadAnalyzer.get_conversation_ids, get_thread_emails)
+CREATE INDEX IF NOT EXISTS idx_emails_conversation_id ON emails (conversation_id);
+
+-- Categories and attachments of one email (get_email_category, load_email)
+CREATE INDEX IF NOT EXISTS idx_categories_email_id ON categories (email_id);
+CREATE INDEX IF NOT EXISTS idx_attachments_email_id ON attachments (email_id);
+CREATE INDEX IF NOT EXISTS idx_attachments_content_hash ON attachments (content_hash);
+
+-- Only a small share of emails has attachments or still waits for a pipeline stage
+CREATE INDEX IF NOT EXISTS idx_emails_has_attachments ON emails (id) WHERE has_attachments = TRUE;
+CREATE INDEX IF NOT EXISTS idx_emails_pending_index ON emails (id) WHERE vector_indexed = FALSE;
+CREATE INDEX IF NOT EXISTS idx_emails_pending_categories ON emails (id) WHERE categorized = FALSE;
+CREATE INDEX IF NOT EXISTS idx_attachment_manifest_pending ON attachment_manifest (updated_at)
+    WHERE extraction_status IN ('pending', 'retry') OR (extraction_status = 'extracted' AND embedded_status = 'pending');
@@ -0,0 +1,34 @@
+-- Explicit mailbox ownership. EMAILS, RECIPIENTS and CATEGORIES carry the id of
+-- the user whose mailbox the row was synced from, so per-user queries no longer
+-- infer it by joining participant addresses against USERS.
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS owner_user_id VARCHAR(255) DEFAULT NULL;
+ALTER TABLE recipients ADD COLUMN IF NOT EXISTS owner_user_id VARCHAR(255) DEFAULT NULL;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS owner_user_id VARCHAR(255) DEFAULT NULL;
+
+-- Rows synced before this migration: the owner is the user among the recipients, else the sender
+UPDATE emails e
+SET owner_user_id = COALESCE(
+    (SELECT u.id FROM recipients r JOIN users u ON u.email = r.email_address WHERE r.email_id = e.id LIMIT 1),
+    (SELECT u.id FROM senders s JOIN users u ON u.email = s.email_address WHERE s.email_id = e.id LIMIT 1)
+)
+WHERE e.owner_user_id IS NULL;
+
+UPDATE recipients r SET owner_user_id = e.owner_user_id FROM emails e WHERE r.email_id = e.id AND r.owner_user_id IS NULL;
+UPDATE categories c SET owner_user_id = e.owner_user_id FROM emails e WHERE c.email_id = e.id AND c.owner_user_id IS NULL;
+
+-- Per-user access paths, all led by the owner. The unique indexes are the
+-- upsert targets of the loader, with or without partitioning.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_emails_owner_id ON emails (owner_user_id, id);
+CREATE INDEX IF NOT EXISTS idx_emails_owner_folder_received ON emails (owner_user_id, parent_folder_id, received_datetime DESC);
+CREATE INDEX IF NOT EXISTS idx_emails_owner_conversation ON emails (owner_user_id, conversation_id);
+CREATE INDEX IF NOT EXISTS idx_emails_owner_attachments ON emails (owner_user_id, id) WHERE has_attachments = TRUE;
+CREATE INDEX IF NOT EXISTS idx_emails_owner_pending_index ON emails (owner_user_id, id) WHERE vector_indexed = FALSE;
+CREATE INDEX IF NOT EXISTS idx_emails_owner_pending_categories ON emails (owner_user_id, id) WHERE categorized = FALSE;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recipients_owner_id ON recipients (owner_user_id, id);
+CREATE INDEX IF NOT EXISTS idx_categories_owner_email ON categories (owner_user_id, email_id);
+
+-- Superseded by the owner-led partial indexes above
+DROP INDEX IF EXISTS idx_emails_has_attachments;
+DROP INDEX IF EXISTS idx_emails_pending_index;
+DROP INDEX IF EXISTS idx_emails_pending_categories;
@@ -0,0 +1,59 @@
+-- Senders, recipients and categories used random uuid4 keys, so the upserts of
+-- the loader never conflicted and every re-sync added another copy of the
+-- rows. Their keys are now md5 hashes of the natural key (see build_row_key in
+-- database/loadtoDB.py), which makes the key itself the uniqueness constraint:
+--
+--   senders    : md5(email_id || ':from:' || lower(address))       one row per email
+--   recipients : md5(email_id || ':' || type || ':' || lower(address))
+--   categories : md5(email_id || ':category:' || lower(category))
+--
+-- This migration removes the duplicates already stored and rewrites the keys.
+-- Duplicates were written by re-syncs of the same Graph data, so any copy is
+-- as good as another. The one with the smallest old id is kept, an arbitrary
+-- but explicit rule (ctid is a physical location and says nothing about which
+-- row was written last).
+
+-- Senders: one row per email
+DELETE FROM senders a
+USING senders b
+WHERE a.email_id = b.email_id
+  AND a.id > b.id;
+
+UPDATE senders
+SET id = md5(email_id || ':from:' || lower(COALESCE(email_address, '')))
+WHERE id <> md5(email_id || ':from:' || lower(COALESCE(email_address, '')));
+
+-- Recipients: one row per email, type and address
+DELETE FROM recipients a
+USING recipients b
+WHERE a.email_id = b.email_id
+  AND a.type IS NOT DISTINCT FROM b.type
+  AND lower(COALESCE(a.email_address, '')) = lower(COALESCE(b.email_address, ''))
+  AND a.id > b.id;
+
+UPDATE recipients
+SET id = md5(email_id || ':' || COALESCE(type, '') || ':' || lower(COALESCE(email_address, '')))
+WHERE id <> md5(email_id || ':' || COALESCE(type, '') || ':' || lower(COALESCE(email_address, '')));
+
+-- Generated categories: one row per email and category. Rows that only carry a
+-- user defined category keep their key.
+DELETE FROM categories a
+USING categories b
+WHERE a.email_id = b.email_id
+  AND a.category IS NOT NULL
+  AND lower(a.category) = lower(b.category)
+  AND a.id > b.id;
+
+UPDATE categories
+SET id = md5(email_id || ':category:' || lower(category))
+WHERE category IS NOT NULL
+  AND id <> md5(email_id || ':category:' || lower(category));
+
+-- Upsert targets of the loader
+CREATE UNIQUE INDEX IF NOT EXISTS idx_senders_email_id_unique ON senders (email_id);
+DROP INDEX IF EXISTS idx_senders_email_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_owner_id ON categories (owner_user_id, id);
+
+ANALYZE senders;
+ANALYZE recipients;
+ANALYZE categories;
@@ -0,0 +1,40 @@
+-- Sender and recipient addresses and names were repeated as strings on every
+-- participant row. They move to a CONTACTS dimension with one row per
+-- normalized address, and SENDERS / RECIPIENTS keep an integer contact_id.
+-- Participants without an address (e.g. calendar reminders) get no contact.
+
+CREATE TABLE IF NOT EXISTS contacts (
+    id BIGSERIAL PRIMARY KEY,
+    address VARCHAR(255) NOT NULL UNIQUE,
+    display_name VARCHAR(255) DEFAULT NULL,
+    domain VARCHAR(255) DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO contacts (address, display_name, domain)
+SELECT DISTINCT ON (address) address, name, NULLIF(split_part(address, '@', 2), '')
+FROM (
+    SELECT lower(trim(email_address)) AS address, NULLIF(name, '') AS name FROM senders
+    UNION ALL
+    SELECT lower(trim(email_address)) AS address, NULLIF(name, '') AS name FROM recipients
+) participants
+WHERE address <> ''
+ORDER BY address, name NULLS LAST
+ON CONFLICT (address) DO NOTHING;
+
+ALTER TABLE senders ADD COLUMN IF NOT EXISTS contact_id BIGINT REFERENCES contacts(id);
+ALTER TABLE recipients ADD COLUMN IF NOT EXISTS contact_id BIGINT REFERENCES contacts(id);
+
+UPDATE senders s SET contact_id = c.id FROM contacts c WHERE c.address = lower(trim(s.email_address));
+UPDATE recipients r SET contact_id = c.id FROM contacts c WHERE c.address = lower(trim(r.email_address));
+
+-- The address indexes of 0001 are dropped together with the columns
+ALTER TABLE senders DROP COLUMN IF EXISTS email_address, DROP COLUMN IF EXISTS name;
+ALTER TABLE recipients DROP COLUMN IF EXISTS email_address, DROP COLUMN IF EXISTS name;
+
+-- "All mail from / to X" and the participant joins run on integers
+CREATE INDEX IF NOT EXISTS idx_senders_contact ON senders (contact_id, email_id);
+CREATE INDEX IF NOT EXISTS idx_recipients_contact ON recipients (contact_id, email_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_domain ON contacts (domain);
+
+ANALYZE contacts;
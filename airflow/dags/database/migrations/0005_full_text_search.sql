@@ -0,0 +1,36 @@
+-- Server-side mailbox search. EMAILS.search_vector is a generated tsvector over
+-- the subject (weight A), the sender (B), the body (C) and the attachment names
+-- and extracted text (D). Sender and attachment text live in other tables, so
+-- they are copied onto the email as plain text by the pipeline: search_sender
+-- at load time, search_attachments after the attachment extraction stage.
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_sender TEXT DEFAULT NULL;
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_attachments TEXT DEFAULT NULL;
+
+UPDATE emails e
+SET search_sender = concat_ws(' ', c.display_name, c.address)
+FROM senders s
+JOIN contacts c ON c.id = s.contact_id
+WHERE s.email_id = e.id;
+
+-- Capped, a tsvector cannot exceed 1MB
+UPDATE emails e
+SET search_attachments = a.search_text
+FROM (
+    SELECT a.email_id, left(string_agg(concat_ws(' ', a.name, b.extracted_text), ' '), 200000) AS search_text
+    FROM attachments a
+    LEFT JOIN attachment_blobs b ON b.content_hash = a.content_hash
+    GROUP BY a.email_id
+) a
+WHERE a.email_id = e.id;
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(search_sender, '')), 'B') ||
+    setweight(to_tsvector('english', left(coalesce(body, ''), 200000)), 'C') ||
+    setweight(to_tsvector('english', coalesce(search_attachments, '')), 'D')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_emails_search ON emails USING GIN (search_vector);
+
+ANALYZE emails;
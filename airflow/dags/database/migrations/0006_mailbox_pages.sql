@@ -0,0 +1,15 @@
+-- Mailbox listing is paged by keyset on (received_datetime, id) instead of a
+-- fixed LIMIT 10, so the folder index carries the id as the tie breaker and a
+-- page deep into years of mail costs the same as the first one.
+
+-- Row comparisons skip NULLs, so every email needs a received time to be reachable
+UPDATE emails
+SET received_datetime = COALESCE(sent_datetime, created_datetime)
+WHERE received_datetime IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_emails_owner_folder_page ON emails (owner_user_id, parent_folder_id, received_datetime DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_emails_folder_page ON emails (parent_folder_id, received_datetime DESC, id DESC);
+
+-- Superseded by the two indexes above
+DROP INDEX IF EXISTS idx_emails_owner_folder_received;
+DROP INDEX IF EXISTS idx_emails_folder_received;
@@ -0,0 +1,23 @@
+-- Folder counts are served from EMAIL_FOLDERS.total_item_count / unread_item_count,
+-- which the pipeline recomputes from EMAILS after every sync. Folder ids are per
+-- mailbox, so folders carry their owner like EMAILS does.
+
+ALTER TABLE email_folders ADD COLUMN IF NOT EXISTS owner_user_id VARCHAR(255) DEFAULT NULL;
+
+-- Folders synced before this migration: the owner of the emails they hold
+UPDATE email_folders f
+SET owner_user_id = e.owner_user_id
+FROM (
+    SELECT DISTINCT ON (parent_folder_id) parent_folder_id, owner_user_id
+    FROM emails
+    WHERE owner_user_id IS NOT NULL
+    ORDER BY parent_folder_id
+) e
+WHERE e.parent_folder_id = f.id
+  AND f.owner_user_id IS NULL;
+
+UPDATE email_folders f
+SET total_item_count = (SELECT count(*) FROM emails e WHERE e.parent_folder_id = f.id),
+    unread_item_count = (SELECT count(*) FROM emails e WHERE e.parent_folder_id = f.id AND e.is_read = FALSE);
+
+CREATE INDEX IF NOT EXISTS idx_email_folders_owner ON email_folders (owner_user_id, display_name);
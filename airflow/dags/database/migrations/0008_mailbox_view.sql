@@ -0,0 +1,54 @@
+-- Denormalized mailbox listing. MAILBOX_VIEW holds one row per email per owner
+-- with everything the mailbox list renders: sender, folder name, categories and
+-- attachment metadata. The pipeline rewrites the rows of the emails it touches
+-- (database/mailboxView.py), so the FastAPI list endpoints read one table
+-- through one index instead of joining emails, users, senders, contacts and
+-- email_folders on every page load.
+
+CREATE TABLE IF NOT EXISTS mailbox_view (
+    owner_user_id VARCHAR(255) NOT NULL,
+    user_email VARCHAR(255),
+    email_id VARCHAR(255) NOT NULL,
+    parent_folder_id VARCHAR(255),
+    folder_name VARCHAR(255),
+    sender_email VARCHAR(255),
+    sender_name VARCHAR(255),
+    subject TEXT,
+    body_preview TEXT,
+    sent_datetime TIMESTAMPTZ,
+    received_datetime TIMESTAMPTZ,
+    is_read BOOLEAN DEFAULT FALSE,
+    has_attachments BOOLEAN DEFAULT FALSE,
+    categories TEXT[] NOT NULL DEFAULT ARRAY[]::TEXT[],
+    attachments JSONB NOT NULL DEFAULT '[]'::JSONB,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (owner_user_id, email_id)
+);
+
+INSERT INTO mailbox_view (
+    owner_user_id, user_email, email_id, parent_folder_id, folder_name, sender_email, sender_name,
+    subject, body_preview, sent_datetime, received_datetime, is_read, has_attachments, categories, attachments
+)
+SELECT
+    e.owner_user_id, u.email, e.id, e.parent_folder_id, f.display_name, sc.address, sc.display_name,
+    e.subject, e.body_preview, e.sent_datetime, e.received_datetime, e.is_read, e.has_attachments,
+    COALESCE((SELECT array_agg(c.category ORDER BY c.category) FROM categories c WHERE c.email_id = e.id), ARRAY[]::TEXT[]),
+    COALESCE((
+        SELECT jsonb_agg(jsonb_build_object('name', a.name, 'content_type', a.content_type, 'size', a.size, 'bucket_url', a.bucket_url) ORDER BY a.name)
+        FROM attachments a WHERE a.email_id = e.id
+    ), '[]'::JSONB)
+FROM emails e
+JOIN users u ON u.id = e.owner_user_id
+LEFT JOIN senders s ON s.email_id = e.id
+LEFT JOIN contacts sc ON sc.id = s.contact_id
+LEFT JOIN email_folders f ON f.id = e.parent_folder_id
+ON CONFLICT (owner_user_id, email_id) DO NOTHING;
+
+-- Keyset pages of a folder, per mailbox and across mailboxes
+CREATE INDEX IF NOT EXISTS idx_mailbox_view_user_folder_page ON mailbox_view (user_email, folder_name, received_datetime DESC, email_id DESC);
+CREATE INDEX IF NOT EXISTS idx_mailbox_view_folder_page ON mailbox_view (folder_name, received_datetime DESC, email_id DESC);
+
+-- Folder renames are applied to the rows of the folder
+CREATE INDEX IF NOT EXISTS idx_mailbox_view_folder_id ON mailbox_view (parent_folder_id);
+
+ANALYZE mailbox_view;
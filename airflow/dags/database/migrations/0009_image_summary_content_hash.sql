@@ -0,0 +1,18 @@
+-- IMAGE_SUMMARIES was keyed by a 64-bit perceptual hash (dHash). Look-alike
+-- images such as scanned forms, screenshots or near-blank pages share a dHash,
+-- so one mailbox's summary was served to another. The cache is now keyed by
+-- the sha256 of the image bytes, the same value as ATTACHMENT_BLOBS.content_hash.
+-- The old entries cannot be mapped to the new key and are dropped; they are
+-- rebuilt on the next extraction of each image.
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'image_summaries' AND column_name = 'image_hash'
+    ) THEN
+        DELETE FROM image_summaries;
+        ALTER TABLE image_summaries RENAME COLUMN image_hash TO content_hash;
+        ALTER TABLE image_summaries ALTER COLUMN content_hash TYPE VARCHAR(64);
+    END IF;
+END $$;
@@ -0,0 +1,48 @@
+from database.connectDB import create_connection_to_postgresql, close_connection
+
+# EMAILS.search_vector is generated by Postgres from columns of the email row
+# (see migrations/0005_full_text_search.sql). The attachment part of it is kept
+# in EMAILS.search_attachments, which is rebuilt here once the attachments of an
+# email have been extracted.
+
+# Attachment text beyond this many characters is not searchable, a tsvector cannot exceed 1MB
+SEARCH_ATTACHMENTS_MAX_CHARS = 200000
+
+
+# Function to rebuild the searchable attachment text of emails
+def refresh_attachment_search_text(logger, email_ids):
+    email_ids = list(email_ids)
+
+    if not email_ids:
+        return
+
+    logger.info(f"Airflow - database/searchDocuments.py - refresh_attachment_search_text() - Refreshing searchable attachment text of {len(email_ids)} emails")
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - database/searchDocuments.py - refresh_attachment_search_text() - Failed to connect to database")
+        return
+
+    update_query = """
+        UPDATE emails e
+        SET search_attachments = (
+            SELECT left(string_agg(concat_ws(' ', a.name, b.extracted_text), ' '), %(max_chars)s)
+            FROM attachments a
+            LEFT JOIN attachment_blobs b ON b.content_hash = a.content_hash
+            WHERE a.email_id = e.id
+        )
+        WHERE e.id = ANY(%(email_ids)s)
+    """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(update_query, {"email_ids": email_ids, "max_chars": SEARCH_ATTACHMENTS_MAX_CHARS})
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Airflow - database/searchDocuments.py - refresh_attachment_search_text() - Error refreshing searchable attachment text: {e}")
+        conn.rollback()
+
+    finally:
+        close_connection(conn)
@@ -1,5 +1,39 @@
+import os
+
 from database.connectDB import create_connection_to_postgresql, close_connection
 
+# Tables that can be hash partitioned on the mailbox owner (EMAIL_PARTITIONS > 0)
+PARTITIONED_TABLES = {
+    "create_emails_table"     : "emails",
+    "create_recipients_table" : "recipients",
+    "create_categories_table" : "categories",
+}
+
+
+# Function to rewrite the per-mailbox tables as hash partitions on owner_user_id
+def partition_tables_by_owner(create_tables, partitions):
+    for query_name, table_name in PARTITIONED_TABLES.items():
+        query = create_tables[query_name].strip().rstrip(";").rstrip()
+
+        # The partition key has to be part of every unique constraint
+        query = query.replace("id VARCHAR(255) PRIMARY KEY", "id VARCHAR(255) NOT NULL", 1)
+        query = query.replace("owner_user_id VARCHAR(255) DEFAULT NULL", "owner_user_id VARCHAR(255) NOT NULL")
+        query = query.replace("email_id VARCHAR(255) REFERENCES emails(id)", "email_id VARCHAR(255)")
+
+        constraints = "PRIMARY KEY (owner_user_id, id)"
+        if table_name != "emails":
+            constraints += ",\n                    FOREIGN KEY (owner_user_id, email_id) REFERENCES emails (owner_user_id, id)"
+
+        create_tables[query_name] = f"{query[:-1].rstrip()},\n                    {constraints}\n                ) PARTITION BY HASH (owner_user_id);"
+
+        for remainder in range(partitions):
+            create_tables[f"create_{table_name}_p{remainder}"] = f"CREATE TABLE IF NOT EXISTS {table_name}_p{remainder} PARTITION OF {table_name} FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder});"
+
+    # emails(id) alone is no longer unique, so the other tables cannot reference it
+    for query_name in ["create_senders_table", "create_attachments_table", "create_flags_table"]:
+        create_tables[query_name] = create_tables[query_name].replace(" REFERENCES emails(id)", "")
+
+
 # Function to create tables in PostgreSQL database
 def create_tables_in_db(logger):
     logger.info("Airflow - POSTGRESQL - database/setupTables.py - create_tables_in_db() - Dropping the existing tables and Creating tables in PostgreSQL database")
@@ -11,11 +45,17 @@ def create_tables_in_db(logger):
                 "drop_recipients_table"             : "DROP TABLE IF EXISTS recipients CASCADE;",
                 "drop_senders_table"                : "DROP TABLE IF EXISTS senders CASCADE;",
                 "drop_attachments_table"            : "DROP TABLE IF EXISTS attachments CASCADE;",
+                "drop_attachment_blobs_table"       : "DROP TABLE IF EXISTS attachment_blobs CASCADE;",
+                "drop_attachment_manifest_table"    : "DROP TABLE IF EXISTS attachment_manifest CASCADE;",
+                "drop_image_summaries_table"        : "DROP TABLE IF EXISTS image_summaries CASCADE;",
                 "drop_flags_table"                  : "DROP TABLE IF EXISTS flags CASCADE;",
                 "drop_categories_table"             : "DROP TABLE IF EXISTS categories CASCADE;",
                 "drop_email_links_table"            : "DROP TABLE IF EXISTS email_links CASCADE;",
                 "drop_queued_jobs_table"            : "DROP TABLE IF EXISTS queued_jobs CASCADE;",
-                "drop_email_folders_table"          : "DROP TABLE IF EXISTS email_folders CASCADE"
+                "drop_email_folders_table"          : "DROP TABLE IF EXISTS email_folders CASCADE",
+                "drop_contacts_table"               : "DROP TABLE IF EXISTS contacts CASCADE",
+                "drop_mailbox_view_table"           : "DROP TABLE IF EXISTS mailbox_view CASCADE",
+                "drop_schema_migrations_table"      : "DROP TABLE IF EXISTS schema_migrations CASCADE"
             },
         "create_tables": {
                 "create_users_table": """
@@ -49,6 +89,7 @@ def create_tables_in_db(logger):
                     end_datetime_timezone VARCHAR(50) DEFAULT NULL,
                     has_attachments BOOLEAN DEFAULT FALSE,
                     id VARCHAR(255) PRIMARY KEY,
+                    owner_user_id VARCHAR(255) DEFAULT NULL,
                     importance VARCHAR(50) DEFAULT NULL,
                     inference_classification VARCHAR(50) DEFAULT NULL,
                     is_draft BOOLEAN DEFAULT FALSE,
@@ -70,12 +111,14 @@ def create_tables_in_db(logger):
                     subject TEXT DEFAULT NULL,
                     type VARCHAR(50) DEFAULT NULL,
                     web_link TEXT DEFAULT NULL,
-                    vector_indexed BOOLEAN DEFAULT FALSE
+                    vector_indexed BOOLEAN DEFAULT FALSE,
+                    categorized BOOLEAN DEFAULT FALSE
                 );
                 """,
                 "create_recipients_table": """
                 CREATE TABLE IF NOT EXISTS recipients (
                     id VARCHAR(255) PRIMARY KEY,
+                    owner_user_id VARCHAR(255) DEFAULT NULL,
                     email_id VARCHAR(255) REFERENCES emails(id),
                     type VARCHAR(50),
                     email_address VARCHAR(255),
@@ -90,6 +133,20 @@ def create_tables_in_db(logger):
                     name VARCHAR(255)
                 );
                 """,
+                "create_attachment_blobs_table": """
+                CREATE TABLE IF NOT EXISTS attachment_blobs (
+                    content_hash VARCHAR(64) PRIMARY KEY,
+                    s3_url TEXT,
+                    size BIGINT,
+                    content_type TEXT,
+                    extracted_text TEXT DEFAULT NULL,
+                    extracted_sections JSONB DEFAULT NULL,
+                    embedded_chunks JSONB DEFAULT NULL,
+                    extracted_at TIMESTAMP DEFAULT NULL,
+                    embedded_at TIMESTAMP DEFAULT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """,
                 "create_attachments_table": """
                 CREATE TABLE IF NOT EXISTS attachments (
                     id VARCHAR(255) PRIMARY KEY,
@@ -97,7 +154,32 @@ def create_tables_in_db(logger):
                     name TEXT,
                     content_type TEXT,
                     size BIGINT,
-                    bucket_url TEXT
+                    bucket_url TEXT,
+                    content_hash VARCHAR(64) REFERENCES attachment_blobs(content_hash)
+                );
+                """,
+                "create_attachment_manifest_table": """
+                CREATE TABLE IF NOT EXISTS attachment_manifest (
+                    path TEXT PRIMARY KEY,
+                    user_email VARCHAR(255),
+                    email_id VARCHAR(255),
+                    file_type VARCHAR(50),
+                    file_name TEXT,
+                    size BIGINT,
+                    mtime DOUBLE PRECISION,
+                    content_hash VARCHAR(64),
+                    extraction_status VARCHAR(20) DEFAULT 'pending',
+                    embedded_status VARCHAR(20) DEFAULT 'pending',
+                    attempts INT DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """,
+                "create_image_summaries_table": """
+                CREATE TABLE IF NOT EXISTS image_summaries (
+                    content_hash VARCHAR(64) PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
                 """,
                 "create_flags_table": """
@@ -109,6 +191,7 @@ def create_tables_in_db(logger):
                 "create_categories_table": """
                     CREATE TABLE IF NOT EXISTS categories (
                         id VARCHAR(255) PRIMARY KEY,
+                        owner_user_id VARCHAR(255) DEFAULT NULL,
                         email_id VARCHAR(255) REFERENCES emails(id),
                         category TEXT,
                         user_defined_category TEXT
@@ -151,6 +234,12 @@ def create_tables_in_db(logger):
             },
     }
 
+    # Large multi-tenant installations can spread the mailboxes over hash partitions
+    partitions = int(os.getenv("EMAIL_PARTITIONS", 0))
+    if partitions > 0:
+        logger.info(f"Airflow - POSTGRESQL - database/setupTables.py - create_tables_in_db() - Partitioning emails, recipients and categories into {partitions} partitions by owner")
+        partition_tables_by_owner(queries["create_tables"], partitions)
+
     conn = create_connection_to_postgresql()
 
     if conn:
@@ -0,0 +1,69 @@
+from airflow import DAG
+from datetime import datetime
+from airflow.models.param import Param
+from airflow.operators.python import PythonOperator
+
+from dotenv import load_dotenv
+from services.logger import start_logger
+
+# Initialize logger
+logger = start_logger()
+
+load_dotenv()
+
+def reprocess_archive(**context):
+    """Replay archived Graph API pages through parse, load, embed and label"""
+
+    # Imported here to keep the DAG file cheap to parse (see airflowpipeline.py)
+    from services.reprocessArchive import reprocess_archived_emails
+
+    try:
+        params = context['params']
+        logger.info(f"Task: reprocess_archive - Reprocessing archive of {params['user_email']}")
+
+        reprocess_archived_emails(
+            logger,
+            params['user_email'],
+            since         = params.get('since') or None,
+            until         = params.get('until') or None,
+            rebuild_index = params.get('rebuild_index', False)
+        )
+        logger.info("Task: reprocess_archive - Archive reprocessed successfully")
+
+    except Exception as e:
+        logger.error(f"Task: reprocess_archive - Error in reprocess_archive: {e}")
+        raise
+
+
+# Default arguments for our DAG
+default_args = {
+    'owner'            : 'airflow',
+    'depends_on_past'  : False,
+    'email_on_failure' : True,
+    'email_on_retry'   : False,
+    'retries'          : 0,
+    'start_date'       : datetime(2024, 1, 1),
+}
+
+# Triggered manually; makes no Microsoft Graph API calls
+with DAG(
+    'outlook_reprocess',
+    default_args      = default_args,
+    description       = 'Replay archived Graph API pages through the email pipeline',
+    schedule_interval = None,
+    catchup           = False,
+    tags              = ['email', 'reprocessing'],
+    params            = {
+        'user_email'    : Param('', type='string'),
+        'since'         : Param('', type='string'),
+        'until'         : Param('', type='string'),
+        'rebuild_index' : Param(False, type='boolean'),
+    }
+) as dag:
+
+    reprocess_archive_task = PythonOperator(
+        task_id='reprocess_archive_task',
+        python_callable=reprocess_archive,
+        provide_context=True,
+        dag=dag,
+    )
@@ -0,0 +1,153 @@
+import os
+import re
+import tiktoken
+from functools import lru_cache
+
+# Attachments are chunked along their own structure (pages, sheets, headings,
+# paragraphs, table rows) and sized in tokens, so every embedding call covers
+# a dense, well-bounded piece of text. Fragments too small to stand on their
+# own are merged into their neighbours.
+
+HEADING_PATTERN = re.compile(r"^(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-Z].{0,80}|[A-Z][A-Z0-9 &/,:-]{2,80})$")
+TABLE_ROW_PATTERN = re.compile(r" \| ")
+
+
+# Function to get the cl100k_base encoder, loaded once per process
+@lru_cache(maxsize=1)
+def get_encoder():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    return len(get_encoder().encode(text))
+
+
+# Function to check if a line is a heading (markdown, numbered or all caps title)
+def is_heading(line):
+    return len(line) <= 100 and bool(HEADING_PATTERN.match(line))
+
+
+# Function to split a section into structural blocks: headed paragraphs and table blocks
+def split_into_blocks(text):
+    blocks = []
+    current = []
+    current_is_table = False
+
+    def flush():
+        if current:
+            blocks.append({"text": "\n".join(current).strip(), "is_table": current_is_table})
+            current.clear()
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+
+        # Paragraph boundary
+        if not line:
+            if not current_is_table:
+                flush()
+            continue
+
+        line_is_table = bool(TABLE_ROW_PATTERN.search(line))
+
+        # A heading starts a new block and stays attached to the text that follows it
+        if is_heading(line) and not line_is_table:
+            flush()
+            current_is_table = False
+            current.append(line)
+            continue
+
+        if current and line_is_table != current_is_table and not (len(current) == 1 and is_heading(current[0])):
+            flush()
+
+        current_is_table = line_is_table
+        current.append(line)
+
+    flush()
+    return [block for block in blocks if block["text"]]
+
+
+# Function to split a block that is larger than a chunk on its own; lead opens the first piece
+def split_large_block(block, max_tokens, lead=None):
+    encoder = get_encoder()
+
+    # Tables are split on row boundaries. Every row labels its own values
+    # (serialize_table_row), so no row is repeated in the following pieces
+    if block["is_table"]:
+        pieces = []
+        current, current_tokens = ([lead], count_tokens(lead)) if lead else ([], 0)
+
+        for row in block["text"].split("\n"):
+            row_tokens = count_tokens(row)
+            if current and current_tokens + row_tokens > max_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(row)
+            current_tokens += row_tokens
+
+        if current:
+            pieces.append("\n".join(current))
+        return pieces
+
+    # Prose is cut into windows of max_tokens
+    tokens = encoder.encode(block["text"])
+    return [encoder.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+# Function to turn extracted sections into token-sized chunks with page and sheet metadata
+def chunk_sections(sections, max_tokens=None, min_tokens=None):
+    max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", 512))
+    min_tokens = min_tokens or int(os.getenv("CHUNK_MIN_TOKENS", 64))
+
+    chunks = []
+
+    def add_chunk(text, tokens, section):
+        previous = chunks[-1] if chunks else None
+
+        # A tiny fragment joins the previous chunk of the same sheet when it fits
+        if previous and previous["sheet"] == section.get("sheet") and \
+           min(tokens, previous["tokens"]) < min_tokens and previous["tokens"] + tokens <= max_tokens:
+            previous["text"] += "\n\n" + text
+            previous["tokens"] += tokens
+            previous["page_end"] = section.get("page") or previous["page_end"]
+            return
+
+        chunks.append({
+            "text"     : text,
+            "tokens"   : tokens,
+            "page"     : section.get("page"),
+            "page_end" : section.get("page"),
+            "sheet"    : section.get("sheet"),
+        })
+
+    for section in sections:
+        buffer, buffer_tokens = [], 0
+
+        for block in split_into_blocks(section["text"]):
+            block_tokens = count_tokens(block["text"])
+
+            if block_tokens > max_tokens:
+                lead = None
+
+                # The sheet title and column names stay with the first rows of their table
+                if buffer and block["is_table"] and buffer_tokens <= max_tokens // 2:
+                    lead = "\n\n".join(buffer)
+                elif buffer:
+                    add_chunk("\n\n".join(buffer), buffer_tokens, section)
+                buffer, buffer_tokens = [], 0
+
+                for piece in split_large_block(block, max_tokens, lead=lead):
+                    add_chunk(piece, count_tokens(piece), section)
+                continue
+
+            # Blocks are packed together until the next one would overflow the chunk
+            if buffer and buffer_tokens + block_tokens > max_tokens:
+                add_chunk("\n\n".join(buffer), buffer_tokens, section)
+                buffer, buffer_tokens = [], 0
+
+            buffer.append(block["text"])
+            buffer_tokens += block_tokens
+
+        if buffer:
+            add_chunk("\n\n".join(buffer), buffer_tokens, section)
+
+    return chunks
@@ -0,0 +1,97 @@
+import os
+
+from services.vectors import create_embeddings_and_index
+from services.labeling import label_email
+from database.loadtoDB import insert_category_data
+from database.emailStages import fetch_pending_emails, mark_emails
+from database.mailboxView import refresh_mailbox_view
+
+# Downstream stages of the email pipeline. Each one reads its pending emails
+# from Postgres in batches, so the DAG can run them in parallel once the load
+# stage has committed a sync, and a failed run picks up where it stopped.
+
+# Function to get the number of emails a stage processes per query
+def get_stage_batch_size():
+    return int(os.getenv("EMAIL_STAGE_BATCH", 100))
+
+
+# Function to index every email of a user that is not in Milvus yet
+def index_pending_emails(logger, user_email):
+    logger.info(f"Airflow - services/emailStages.py - index_pending_emails() - Indexing pending emails of {user_email}")
+
+    indexed_count = 0
+    failed_ids = set()
+
+    while True:
+        emails = fetch_pending_emails(logger, user_email, "vector_indexed", get_stage_batch_size(), exclude_ids=failed_ids)
+        if not emails:
+            break
+
+        indexed_ids = []
+        for email in emails:
+            data_to_index = {
+                "subject"           : email["subject"],
+                "body"              : email["body"],
+                "sender_name"       : email["sender_name"],
+                "sender_email"      : email["sender_email"],
+                "reply_to"          : email["reply_to"],
+                "created_datetime"  : email["created_datetime"],
+                "received_datetime" : email["received_datetime"],
+                "sent_datetime"     : email["sent_datetime"],
+            }
+
+            metadata = {
+                "id"                 : email["id"],
+                "user_email"         : user_email,
+                "conversation_id"    : email["conversation_id"],
+                "conversation_index" : email["conversation_index"],
+                "message_type"       : "email"
+            }
+
+            if create_embeddings_and_index(data_to_index=data_to_index, metadata=metadata):
+                indexed_ids.append(email["id"])
+            else:
+                failed_ids.add(email["id"])
+
+        mark_emails(logger, indexed_ids, "vector_indexed")
+        indexed_count += len(indexed_ids)
+
+    logger.info(f"Airflow - services/emailStages.py - index_pending_emails() - Indexed {indexed_count} emails, {len(failed_ids)} left for the next run")
+    return indexed_count
+
+
+# Function to categorize every email of a user that has not been labeled yet
+def categorize_pending_emails(logger, user_email):
+    logger.info(f"Airflow - services/emailStages.py - categorize_pending_emails() - Categorizing pending emails of {user_email}")
+
+    categorized_count = 0
+    failed_ids = set()
+
+    while True:
+        emails = fetch_pending_emails(logger, user_email, "categorized", get_stage_batch_size(), exclude_ids=failed_ids)
+        if not emails:
+            break
+
+        categorized_ids = []
+        for email in emails:
+            cat_data = {
+                "sender_email" : email["sender_email"],
+                "subject"      : email["subject"],
+                "body"         : email["body"] or "",
+                "reply_to"     : email["reply_to"]
+            }
+
+            categories = label_email(email_dict=cat_data)
+
+            if categories:
+                insert_category_data(logger, email["id"], categories, owner_user_id=email["owner_user_id"])
+                categorized_ids.append(email["id"])
+            else:
+                failed_ids.add(email["id"])
+
+        mark_emails(logger, categorized_ids, "categorized")
+        refresh_mailbox_view(logger, categorized_ids)
+        categorized_count += len(categorized_ids)
+
+    logger.info(f"Airflow - services/emailStages.py - categorize_pending_emails() - Categorized {categorized_count} emails, {len(failed_ids)} left for the next run")
+    return categorized_count
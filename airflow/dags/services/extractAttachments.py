@@ -1,62 +1,43 @@
 import os
-import json
-import csv
-import boto3
+import time
+import signal
+import resource
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-
-from services.extractFileContents import parse_images, parse_csv_files, parse_word_file, parse_txt_files, parse_excel_files, parse_pdf_files
-from services.processEmails import save_emails_to_json_file
+from database.attachmentBlobs import fetch_attachment_blob, update_attachment_blob_text
+from database.attachmentManifest import fetch_pending_manifest_entries, update_manifest_status, mark_manifest_entries_for_retry
+from database.searchDocuments import refresh_attachment_search_text
+from services.transferAttachments import ATTACHMENT_CATEGORIES, compute_file_hash, register_local_attachment
+from services.imageSummaries import summarize_images
+from services.tabularAttachments import export_tables_to_parquet
+from services.extractFileContents import parse_images, parse_word_file, parse_txt_files, parse_excel_sheets, parse_csv_table, parse_pdf_pages, split_pdf_pages, extract_pdf_page_range, log_pdf_pages
+from services.recordLog import append_record, clear_consumed_log, get_pending_keys
 from services.vectors import embed_email_attachments
+from services.logger import start_logger
 
-# Function to create directories
-def create_local_directory(logger, directory_path):
-    directory_path = normalize_path(directory_path)
-    
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
-        logger.info(f"Created directory: {directory_path}")
-
+# Parsers raise on failure, so whatever they return is the file's contents, even when empty.
+# A file type without a parser fails for good instead of being retried.
+class UnsupportedAttachmentError(ValueError):
+    pass
 
-# Function to normalize file paths
-def normalize_path(file_path):
-    return os.path.normpath(file_path)
 
-# Function to download attachments from S3
-def download_attachments_from_s3(logger, user_email, email_id, s3_bucket_name):
-    logger.info(f"Downloading attachments for email ID: {email_id} from S3.")
-    
-    s3_client = boto3.client("s3")
-    base_download_dir = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY"), f"{user_email}/{email_id}")
-    logger.info(f"Downloading attachments for email ID: {email_id} from S3. to {base_download_dir}")
-    base_s3_prefix = f"{user_email}/{email_id}/attachments"
-    
-    try:
-        response = s3_client.list_objects_v2(Bucket=s3_bucket_name, Prefix=base_s3_prefix)
-        
-        if "Contents" not in response:
-            logger.info(f"No attachments found in S3 for email ID: {email_id}.")
-            return
-        
-        for obj in response["Contents"]:
-            key = obj["Key"]
-            relative_path = key[len(base_s3_prefix):].lstrip("/")
-            local_file_path = os.path.join(base_download_dir, relative_path)
-            create_local_directory(logger, os.path.dirname(local_file_path))
-            
-            if os.path.exists(local_file_path):
-                logger.info(f"File already exists locally: {local_file_path}. Skipping download.")
-                continue
-            
-            s3_client.download_file(s3_bucket_name, key, local_file_path)
-            logger.info(f"Downloaded {key} to {local_file_path}")
-    
-    except Exception as e:
-        logger.error(f"Failed to download attachments for email ID: {email_id}. Error: {e}")
+# Function to build the contents and page sections of a PDF from its page records
+def build_pdf_contents(pages):
+    content = "".join(page["text"] for page in pages).strip()
+    sections = [{"page": page["page"], "text": page["text"]} for page in pages if page["text"].strip()]
+    return content, sections
 
 
+# Returns the text of a file along with its sections (PDF pages, spreadsheet sheets) when the format has any
 def extract_contents_from_file(logger, file_path):
     file_extension = os.path.splitext(file_path)[-1].lower()  # Get file extension
     content = ""
+    sections = None
+
+    # Caps keep a single huge document from dominating the run
+    max_pages = int(os.getenv("ATTACHMENT_MAX_PAGES", 500))
+    max_rows  = int(os.getenv("ATTACHMENT_MAX_ROWS", 100000))
+    max_bytes = int(os.getenv("ATTACHMENT_MAX_TEXT_BYTES", 10485760))
 
     file_extensions = {
         "PDFs"          : [".pdf"],
@@ -70,7 +51,7 @@ def extract_contents_from_file(logger, file_path):
     try:
         if file_extension in file_extensions["PDFs"]:
             logger.info("Parsing PDF file")
-            content = parse_pdf_files(logger, file_path)
+            content, sections = build_pdf_contents(parse_pdf_pages(logger, file_path, max_pages=max_pages))
         
         elif file_extension in file_extensions["Images"]:
             logger.info("Parsing Image file")
@@ -86,86 +67,310 @@ def extract_contents_from_file(logger, file_path):
         
         elif file_extension in file_extensions["SpreadSheets"]:
             logger.info("Parsing Spreadsheet file")
-            content = parse_excel_files(logger, file_path)
+            sections = parse_excel_sheets(logger, file_path, max_rows=max_rows, max_bytes=max_bytes)
+            content = "\n".join(section["text"] for section in sections)
         
         elif file_extension in file_extensions["CSVFiles"]:
             logger.info("Parsing CSV file")
-            content = parse_csv_files(logger, file_path)
+            sections = parse_csv_table(logger, file_path, max_rows=max_rows, max_bytes=max_bytes)
+            content = "\n".join(section["text"] for section in sections)
         
         else:
             logger.warning(f"Unsupported file type: {file_extension}")
-            content = f"Unsupported file type: {file_extension}"
+            raise UnsupportedAttachmentError(f"Unsupported file type: {file_extension}")
     
     except Exception as e:
-        content = f"Error processing file {file_path}: {str(e)}"
+        logger.error(f"Airflow - services/extractAttachments.py - extract_contents_from_file() - Error processing file {file_path}: {e}")
+        raise
+    
+    return content or "", sections
+
+
+# Raised inside a worker when a file exceeds its wall-clock budget
+def raise_extraction_timeout(signum, frame):
+    raise TimeoutError("Extraction exceeded its time budget")
+
+
+# Runs once in every worker process of the extraction pool
+def init_extraction_worker(memory_limit_bytes):
+    # Cap the address space so a runaway parser raises MemoryError in its
+    # own process instead of getting the whole Airflow task OOM-killed
+    if memory_limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+    signal.signal(signal.SIGALRM, raise_extraction_timeout)
+
+
+# Parses a single file inside a worker process
+def extract_file_in_worker(file_path, content_hash, timeout_seconds):
+    logger = start_logger()
+
+    signal.alarm(timeout_seconds)
+    try:
+        content, sections = extract_contents_from_file(logger, file_path)
+
+        # Tables are also stored as Parquet so they can be queried instead of only embedded
+        if sections and os.path.splitext(file_path)[-1].lower() in (".xlsx", ".csv"):
+            try:
+                tables = export_tables_to_parquet(logger, file_path, content_hash, max_rows=int(os.getenv("ATTACHMENT_MAX_ROWS", 100000)))
+                tables_by_sheet = {table["sheet"]: table for table in tables}
+
+                for section in sections:
+                    section["table"] = tables_by_sheet.get(section["sheet"])
+
+            except Exception as e:
+                logger.error(f"Airflow - services/extractAttachments.py - extract_file_in_worker() - Failed to export tables of {file_path}: {e}")
+
+        return content, sections
     
-    return content
+    finally:
+        signal.alarm(0)
+
+
+# Extracts one page range of a large PDF inside a worker process, under the same limits as a whole file
+def extract_pdf_range_in_worker(file_path, start_page, end_page, max_seconds, timeout_seconds):
+    signal.alarm(timeout_seconds)
+    try:
+        return extract_pdf_page_range(file_path, start_page, end_page, time.time() + max_seconds)
 
+    finally:
+        signal.alarm(0)
 
-def extract_filepaths_with_attachments(logger, download_dir):
-    logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Extracting files with attachments")
+
+EXTRACTED_CONTENTS_LOG = "extracted_contents"
+
+
+# Appends each extracted record to the log; on_extracted is called after every record
+def extract_filepaths_with_attachments(logger, download_dir, entries, on_extracted=None):
+    logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Extracting {len(entries)} files with attachments")
     
-    extracted_data = []
-    # Walk through the base directory
-    email_ids = os.listdir(download_dir)
+    extracted_paths = []
+    retry_paths = []
+    failed_paths = []
+    skipped_paths = []
+    files_to_parse = {}
+    images_to_summarize = {}
+
+    # A file whose record is still waiting in the log (its embedding failed or did not run)
+    # is not extracted and appended again, or its chunks would be embedded twice
+    pending_records = get_pending_keys(logger, EXTRACTED_CONTENTS_LOG, lambda record: (record["path"], record["content_hash"]))
+
+    # Stores the outcome of a parse, whichever way the file was parsed
+    def collect_result(record, has_blob, content, sections=None, error=None):
+        if isinstance(error, UnsupportedAttachmentError):
+            logger.error(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - {error}")
+            failed_paths.append(record["path"])
+            return
+
+        if error is not None:
+            logger.error(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Failed to extract {record['file']}: {error}")
+            retry_paths.append(record["path"])
+            return
+
+        if has_blob:
+            update_attachment_blob_text(logger, record["content_hash"], content, sections)
+
+        # A valid file without any text has nothing to embed
+        if not content.strip():
+            logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - No text in {record['file']}")
+            skipped_paths.append(record["path"])
+            return
+
+        logger.info(f"Extracted contents from {record['file']} is {content}")
+
+        extracted_paths.append(record["path"])
+        append_record(logger, EXTRACTED_CONTENTS_LOG, {**record, "content": content, "sections": sections})
+
+        if on_extracted:
+            on_extracted()
+
+    for entry in entries:
+        # downloads/user_email/email_id/file_type/filename.ext
+        file_path = os.path.join(download_dir, entry["path"])
+
+        if not os.path.isfile(file_path):
+            logger.warning(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - File is missing from the download directory: {file_path}")
+            failed_paths.append(entry["path"])
+            continue
+
+        content_hash = entry["content_hash"]
 
-    for email_id in email_ids:
-        # downloads/email_id
-        email_dir = os.path.join(download_dir, email_id)
+        # The file was rewritten after it was registered, so its hash has to be refreshed
+        file_stat = os.stat(file_path)
+        if file_stat.st_size != entry["size"] or file_stat.st_mtime != entry["mtime"]:
+            content_hash = compute_file_hash(file_path)
+            register_local_attachment(logger, file_path, content_hash)
+
+        if (entry["path"], content_hash) in pending_records:
+            logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - {entry['path']} is already waiting in the log")
+            extracted_paths.append(entry["path"])
+            continue
+
+        blob = fetch_attachment_blob(logger, content_hash)
+        record = {
+            "path"         : entry["path"],
+            "email_id"     : entry["user_email"],
+            "email"        : entry["email_id"],
+            "file_type"    : entry["file_type"],
+            "file"         : entry["file_name"],
+            "content_hash" : content_hash,
+        }
+
+        # The same bytes were already parsed for another email or user
+        if blob and blob["extracted_text"] is not None and not blob["extracted_text"].strip():
+            skipped_paths.append(entry["path"])
+
+        elif blob and blob["extracted_text"] is not None:
+            logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Reusing cached contents of blob {content_hash}")
+            extracted_paths.append(entry["path"])
+            append_record(logger, EXTRACTED_CONTENTS_LOG, {**record, "content": blob["extracted_text"], "sections": blob["extracted_sections"]})
+
+            if on_extracted:
+                on_extracted()
+
+        # Images are I/O bound vision calls, so they are batched separately from the CPU bound parsers
+        elif os.path.splitext(file_path)[-1].lower() in ATTACHMENT_CATEGORIES["Images"]:
+            images_to_summarize[file_path] = (record, blob is not None)
         
-        if not os.path.isdir(email_dir):
+        else:
+            files_to_parse[file_path] = (record, blob is not None)
+
+    if images_to_summarize:
+        summaries, skipped_images, image_errors = summarize_images(logger, {file_path: record['content_hash'] for file_path, (record, _) in images_to_summarize.items()})
+
+        # Tiny images carry no content worth embedding
+        skipped_paths.extend(images_to_summarize[file_path][0]["path"] for file_path in skipped_images)
+
+        for file_path, summary in summaries.items():
+            record, has_blob = images_to_summarize[file_path]
+            collect_result(record, has_blob, summary)
+
+        for file_path, error in image_errors.items():
+            record, has_blob = images_to_summarize[file_path]
+            collect_result(record, has_blob, None, error=error)
+
+    # Large PDFs are split into page ranges that are scheduled on the pool like files,
+    # so their pages are parsed in parallel without starting a pool inside a worker
+    pdf_ranges = {}
+    max_pages = int(os.getenv("ATTACHMENT_MAX_PAGES", 500))
+
+    for file_path in list(files_to_parse):
+        if os.path.splitext(file_path)[-1].lower() != ".pdf":
             continue
-        emails = os.listdir(email_dir)
 
-        for email in emails:
-            # downloads/email_id/mail_id
-            mails_dir = os.path.join(email_dir, email)
-            
-            if not os.path.isdir(mails_dir):
-                continue
-            file_types = os.listdir(mails_dir)
+        try:
+            ranges = split_pdf_pages(logger, file_path, max_pages=max_pages)
+        except Exception as e:
+            record, has_blob = files_to_parse.pop(file_path)
+            collect_result(record, has_blob, None, error=e)
+            continue
 
-            for file_type in file_types:
-                # downloads/email_id/mail_id/file_type
-                file_types_dir = os.path.join(mails_dir,file_type)
-                
-                if not os.path.isdir(file_types_dir):
-                    continue
-                files = os.listdir(file_types_dir)
-
-                if files:
-                    for file in files:
-                        # downloads/email_id/mail_id/file_type/filename.ext
-                        file_path = os.path.join(file_types_dir, file)
-                        
-                        logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Processing file: {file_path}")
-                        content = extract_contents_from_file(logger, file_path)
-                        logger.info(f"Extracted contents from {file} is {content}")
-
-                        extracted_data.append({
-                            "email_id"  : email_id,
-                            "email"     : email,
-                            "file_type" : file_type,
-                            "file"      : file,
-                            "content"   : content
-                        })
-                else:
-                    continue
+        if len(ranges) > 1:
+            pdf_ranges[file_path] = ranges
+
+    if not files_to_parse:
+        return extracted_paths, retry_paths, failed_paths, skipped_paths
+
+    timeout_seconds = int(os.getenv("ATTACHMENT_TIMEOUT_SECONDS", 120))
+    memory_limit_bytes = int(os.getenv("ATTACHMENT_MEMORY_LIMIT_MB", 2048)) * 1024 * 1024
+    max_workers = int(os.getenv("ATTACHMENT_WORKERS", 0)) or os.cpu_count()
+
+    logger.info(f"Airflow - services/extractAttachments.py - extract_filepaths_with_attachments() - Parsing {len(files_to_parse)} files with {max_workers} workers")
+
+    pdf_max_seconds = int(os.getenv("PDF_MAX_SECONDS", 90))
+    range_results = {}
+
+    # Parsing is CPU bound, so files and PDF page ranges are spread over processes. Each
+    # task gets its own time and memory budget, and a crash only affects the tasks in flight.
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_extraction_worker, initargs=(memory_limit_bytes,)) as executor:
+        futures = {}
+
+        for file_path, (record, has_blob) in files_to_parse.items():
+            if file_path in pdf_ranges:
+                for range_index, (start_page, end_page) in enumerate(pdf_ranges[file_path]):
+                    futures[executor.submit(extract_pdf_range_in_worker, file_path, start_page, end_page, pdf_max_seconds, timeout_seconds)] = (file_path, range_index)
             else:
+                futures[executor.submit(extract_file_in_worker, file_path, record["content_hash"], timeout_seconds)] = (file_path, None)
+
+        # Results are handled as soon as each file finishes
+        for future in as_completed(futures):
+            file_path, range_index = futures[future]
+            record, has_blob = files_to_parse[file_path]
+
+            if range_index is None:
+                try:
+                    content, sections = future.result()
+                except Exception as e:
+                    collect_result(record, has_blob, None, error=e)
+                    continue
+
+                collect_result(record, has_blob, content, sections)
+                continue
+
+            # The ranges of a PDF are put back together once the last one is done
+            results = range_results.setdefault(file_path, {})
+            try:
+                results[range_index] = future.result()
+            except Exception as e:
+                results[range_index] = e
+
+            if len(results) < len(pdf_ranges[file_path]):
+                continue
+
+            errors = [result for result in results.values() if isinstance(result, Exception)]
+            if errors:
+                collect_result(record, has_blob, None, error=errors[0])
                 continue
-    return extracted_data
+
+            pages = [page for idx in sorted(results) for page in results[idx]]
+            log_pdf_pages(logger, file_path, pages, pdf_ranges[file_path][-1][1])
+
+            content, sections = build_pdf_contents(pages)
+            collect_result(record, has_blob, content, sections)
+
+    return extracted_paths, retry_paths, failed_paths, skipped_paths
+
 
 def extract_contents_from_attachments(logger):
     logger.info(f"Airflow - services/extractAttachments.py - extract_contents_from_attachments() - Extracting contents from email attachments")
     
     download_dir = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY"))
     
-    # If no attachments were found, the DOWNLOAD_DIRECTORY won't exist
-    if not os.path.isdir(download_dir):
-        logger.warning(f"Airflow - services/extractAttachments.py - extract_contents_from_attachments() - No attachments were found so far")
+    # Only attachments that are new, changed, retried or not embedded yet are processed
+    entries = fetch_pending_manifest_entries(logger)
+    
+    if not entries:
+        logger.info(f"Airflow - services/extractAttachments.py - extract_contents_from_attachments() - No new attachments to extract")
         return
 
-    extracted_data = extract_filepaths_with_attachments(logger, download_dir)
-    
-    save_emails_to_json_file(logger, extracted_data, "extracted_contents.json")
-    embed_email_attachments(filename="extracted_contents.json")
\ No newline at end of file
+    embed_batch_size = int(os.getenv("ATTACHMENT_EMBED_BATCH", 20))
+    pending_records = 0
+
+    # Embeds whatever the log holds beyond the last consumed record
+    def embed_pending_records():
+        nonlocal pending_records
+        pending_records = 0
+
+        embedded_paths = embed_email_attachments(log_name=EXTRACTED_CONTENTS_LOG)
+        update_manifest_status(logger, embedded_paths, embedded_status="embedded")
+
+    # Embedding starts while the remaining files are still being parsed by the pool
+    def on_extracted():
+        nonlocal pending_records
+        pending_records += 1
+
+        if pending_records >= embed_batch_size:
+            embed_pending_records()
+
+    extracted_paths, retry_paths, failed_paths, skipped_paths = extract_filepaths_with_attachments(logger, download_dir, entries, on_extracted)
+
+    update_manifest_status(logger, extracted_paths, extraction_status="extracted")
+    update_manifest_status(logger, failed_paths, extraction_status="failed")
+    update_manifest_status(logger, skipped_paths, extraction_status="skipped", embedded_status="skipped")
+    mark_manifest_entries_for_retry(logger, retry_paths, max_attempts=int(os.getenv("ATTACHMENT_MAX_ATTEMPTS", 3)))
+
+    # Attachment names and extracted text become searchable on their emails
+    refresh_attachment_search_text(logger, {entry["email_id"] for entry in entries})
+
+    embed_pending_records()
+    clear_consumed_log(logger, EXTRACTED_CONTENTS_LOG)
@@ -1,164 +1,209 @@
 import os
 import csv
-import json
-import base64
-import openai
+import time
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
 
 from docx import Document
 import mammoth
 from openpyxl import load_workbook
 import fitz
+import pytesseract
+from PIL import Image
+
+from services.imageSummaries import summarize_image
 
 # Loading environment variables
 load_dotenv()
 
-# Sub function to convert images to base64
-def encode_image_to_base64(logger, image_path):
-    logger.info(f"Ariflow - encode_image_to_base64 - Encoding image to base64")
-    try:
-        with open(image_path, 'rb') as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-        logger.info(f"Ariflow - encode_image_to_base64 - Image encoded to base64 successfully")
-        return img_base64
-    except Exception as e:
-        logger.error(f"Ariflow - encode_image_to_base64 - Error encoding image to base64: {e}")
-        return None
- 
-# Sub function to summarize images using OpenAI  
-def image_summarize(logger, img_base64, prompt):
-    logger.info(f"Ariflow - image_summarize - Summarizing image with GPT")
-    try:
-
-        chat = ChatOpenAI(
-            model       = "gpt-4o", 
-            max_tokens  = 1024,
-            api_key     = os.getenv("OPENAI_API_KEY")
-        )
-
-        msg = chat.invoke(
-            [
-                HumanMessage(
-                    content=[
-                        {
-                            "type": "text", 
-                            "text": prompt
-                        },
-                        {
-                            "type"      : "image_url",
-                            "image_url" : {"url": f"data:image/jpeg;base64,{img_base64}"},
-                        },
-                    ]
-                )
-            ]
-        )
-        logger.info(f"Ariflow - image_summarize - Summary generated successfully")
-        return msg.content
-    
-    except Exception as e:
-            logger.error(f"Ariflow - image_summarize - Error generating summary with GPT-4o: {e}")
-            return None
-
 # Function to parse images and extract contents
 def parse_images(logger, image_path):
     logger.info(f"Ariflow - parse_images - Generating summaries for images in {image_path}")
-    prompt = (
-        "You are an assistant tasked with summarizing images for retrieval via RAGs. "
-        "These summaries will be embedded and used to retrieve the raw image via RAGs. "
-        "Give a concise summary of the image that is well optimized for retrieval via RAGs."
+
+    if not os.path.isfile(image_path):
+        raise FileNotFoundError(f"Image not found: {image_path}")
+
+    # Summaries are cached by perceptual hash in services/imageSummaries.py
+    return summarize_image(logger, image_path)
+
+# Function to turn a table row into text, labelling each value with its column header
+def serialize_table_row(header, row):
+    values = ["" if cell is None else str(cell).strip() for cell in row]
+
+    if not header:
+        return ", ".join(values)
+
+    return " | ".join(
+        f"{header[idx] if idx < len(header) and header[idx] else f'Column {idx + 1}'}: {value}"
+        for idx, value in enumerate(values) if value
     )
-    
-    if os.path.isfile(image_path):
-        logger.info(f"Ariflow - parse_images - Processing image")
-
-        # Encode image to base64
-        image_base64 = encode_image_to_base64(logger, image_path)
-        if image_base64:
-            image_summary = image_summarize(logger, image_base64, prompt)
-            logger.info(f"Ariflow - parse_images - Image {image_path} summary: {image_summary}")
-        
-            if image_summary:
-                return image_summary
-            else:
-                return "Failed to summarize image"
-        else:
-            return f"Failed to encode image {image_path}"
-
-# Function to parse CSV files and extract contents
-def parse_csv_files(logger, csv_file_path):
-    logger.info(f"Ariflow - parse_csv_files - Extarcting contents from csv file: {csv_file_path}")
-
-    extracted_contents = ""
 
-    try:
-        # Open the CSV file for reading
-        with open(csv_file_path, 'r') as file:
-            csv_reader = csv.reader(file)
-            for row in csv_reader:
-                # Join the row contents and append to the extracted contents
-                extracted_contents += ", ".join(row) + "\n"
-    except Exception as e:
-        logger.error(f"Airflow - parse_csv_files - Error processing CSV file: {e}")
-        extracted_contents = f"Error processing CSV file {csv_file_path}: {str(e)}"
-
-    return extracted_contents
-
-# Parsing Word Document files
+
+# Function to serialize a stream of table rows within row and byte caps
+def serialize_table_rows(logger, rows, max_rows=None, max_bytes=None):
+    lines = []
+    header = None
+    total_bytes = 0
+    row_count = 0
+
+    for row in rows:
+        # The first non-empty row names the columns
+        if header is None:
+            if not any(cell not in (None, "") for cell in row):
+                continue
+            header = ["" if cell is None else str(cell).strip() for cell in row]
+            lines.append(", ".join(header))
+            continue
+
+        if max_rows and row_count >= max_rows:
+            logger.warning(f"Airflow - serialize_table_rows - Row cap of {max_rows} reached, remaining rows skipped")
+            break
+
+        line = serialize_table_row(header, row)
+        if not line:
+            continue
+
+        total_bytes += len(line) + 1
+        if max_bytes and total_bytes > max_bytes:
+            logger.warning(f"Airflow - serialize_table_rows - Byte cap of {max_bytes} reached, remaining rows skipped")
+            break
+
+        lines.append(line)
+        row_count += 1
+
+    return "\n".join(lines), row_count
+
+
+# Function to extract a CSV file as a single table section
+def parse_csv_table(logger, csv_file_path, max_rows=None, max_bytes=None):
+    logger.info(f"Ariflow - parse_csv_table - Extarcting contents from csv file: {csv_file_path}")
+
+    # Rows are streamed from disk, so memory stays bounded whatever the file size
+    with open(csv_file_path, 'r', newline='', encoding='utf-8', errors='replace') as file:
+        text, row_count = serialize_table_rows(logger, csv.reader(file), max_rows, max_bytes)
+
+    return [{"sheet": None, "text": text, "rows": row_count}]
+
+
+# Parsing Word Document files, errors are raised to the caller
 def parse_word_file(logger, file_path):
-    try:
-        file_extension = os.path.splitext(file_path)[-1].lower()
-
-        if file_extension == ".docx":
-            # Use python-docx for .docx files
-            doc = Document(file_path)
-            content = "\n".join([para.text for para in doc.paragraphs])
-        elif file_extension == ".doc":
-            # Use mammoth for .doc files
-            with open(file_path, "rb") as doc_file:
-                result = mammoth.extract_raw_text(doc_file)
-                content = result.value  # Extracted text
-        else:
-            content = f"Unsupported file type: {file_extension}"
-    except Exception as e:
-        content = f"Error parsing file {file_path}: {str(e)}"
+    file_extension = os.path.splitext(file_path)[-1].lower()
+
+    if file_extension == ".docx":
+        # Use python-docx for .docx files
+        doc = Document(file_path)
+        content = "\n".join([para.text for para in doc.paragraphs])
+    elif file_extension == ".doc":
+        # Use mammoth for .doc files
+        with open(file_path, "rb") as doc_file:
+            result = mammoth.extract_raw_text(doc_file)
+            content = result.value  # Extracted text
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
 
     return content
 
-# Parsing txt files
+# Parsing txt files, errors are raised to the caller
 def parse_txt_files(logger, file_path):
-    try:
-        with open(file_path, "r", encoding="utf-8") as txt_file:
-            content = txt_file.read()
-        return content
-    except Exception as e:
-        return f"Error parsing file {file_path}: {str(e)}"
+    with open(file_path, "r", encoding="utf-8") as txt_file:
+        return txt_file.read()
     
 
-# Parsing Spreadsheets
-def parse_excel_files(logger, file_path):
-    try:
-        workbook = load_workbook(file_path, data_only=True)
-        content = ""
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            content += f"Sheet: {sheet_name}\n"
-            for row in sheet.iter_rows(values_only=True):
-                content += ", ".join([str(cell) if cell is not None else "" for cell in row]) + "\n"
-        return content.strip()
-    except Exception as e:
-        return f"Error parsing XLSX file {file_path}: {str(e)}"
-
-
-def parse_pdf_files(logger, file_path):
+# Function to extract every sheet of a workbook as its own section
+def parse_excel_sheets(logger, file_path, max_rows=None, max_bytes=None):
+    # Read-only mode streams rows from the archive instead of building the whole workbook in memory
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    sections = []
+
     try:
-        pdf_document = fitz.open(file_path)
-        content = ""
-        for page_num in range(len(pdf_document)):
+        for sheet in workbook.worksheets:
+            # Caps apply to the workbook as a whole
+            remaining_rows = max_rows - sum(section["rows"] for section in sections) if max_rows else None
+            remaining_bytes = max_bytes - sum(len(section["text"]) for section in sections) if max_bytes else None
+
+            if (max_rows and remaining_rows <= 0) or (max_bytes and remaining_bytes <= 0):
+                logger.warning(f"Airflow - parse_excel_sheets - Caps reached, remaining sheets of {file_path} skipped")
+                break
+
+            text, row_count = serialize_table_rows(logger, sheet.iter_rows(values_only=True), remaining_rows, remaining_bytes)
+            if text:
+                sections.append({"sheet": sheet.title, "text": f"Sheet: {sheet.title}\n{text}", "rows": row_count})
+    
+    finally:
+        workbook.close()
+
+    return sections
+
+
+# Function to OCR a page that has no text layer
+def ocr_pdf_page(page):
+    # Render at a resolution Tesseract reads reliably, then recognise the bitmap
+    pixmap = page.get_pixmap(dpi=int(os.getenv("PDF_OCR_DPI", 200)), alpha=False)
+    image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image)
+
+
+# Extracts a range of pages; large documents are split into ranges that run as separate tasks of the extraction pool
+def extract_pdf_page_range(file_path, start_page, end_page, deadline):
+    pages = []
+
+    with fitz.open(file_path) as pdf_document:
+        for page_num in range(start_page, end_page):
+            # Stop at the time budget and keep whatever was extracted so far
+            if time.time() > deadline:
+                break
+
             page = pdf_document[page_num]
-            content += page.get_text()
-        pdf_document.close()
-        return content.strip()
-    except Exception as e:
-        return f"Error parsing PDF file {file_path}: {str(e)}"
\ No newline at end of file
+            text = page.get_text()
+            is_ocr = False
+
+            # Scanned pages have images but no text layer
+            if not text.strip() and page.get_images():
+                try:
+                    text = ocr_pdf_page(page)
+                    is_ocr = True
+                except Exception:
+                    text = ""
+
+            pages.append({"page": page_num + 1, "text": text, "ocr": is_ocr})
+
+    return pages
+
+
+# Function to split the pages of a PDF into the ranges that are extracted independently
+def split_pdf_pages(logger, file_path, max_pages=None):
+    with fitz.open(file_path) as pdf_document:
+        total_pages = len(pdf_document)
+
+    page_count = min(total_pages, max_pages) if max_pages else total_pages
+    if page_count < total_pages:
+        logger.warning(f"Airflow - split_pdf_pages - Page cap of {max_pages} reached, {total_pages - page_count} pages skipped in {file_path}")
+
+    max_ranges = int(os.getenv("PDF_PAGE_WORKERS", 4))
+
+    # Small documents are not worth spreading over several workers
+    if page_count < int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16)) or max_ranges <= 1:
+        return [(0, page_count)] if page_count else []
+
+    step = -(-page_count // max_ranges)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+# Function to log how much of a PDF was extracted once all of its ranges are done
+def log_pdf_pages(logger, file_path, pages, page_count):
+    if len(pages) < page_count:
+        logger.warning(f"Airflow - parse_pdf_pages - Time budget reached after {len(pages)} of {page_count} pages in {file_path}")
+
+    ocr_pages = sum(1 for page in pages if page["ocr"])
+    if ocr_pages:
+        logger.info(f"Airflow - parse_pdf_pages - OCR applied to {ocr_pages} image-only pages in {file_path}")
+
+
+# Function to extract per-page records from a PDF, one range after the other in the calling process
+def parse_pdf_pages(logger, file_path, max_pages=None, max_seconds=None):
+    ranges = split_pdf_pages(logger, file_path, max_pages=max_pages)
+    deadline = time.time() + (max_seconds or int(os.getenv("PDF_MAX_SECONDS", 90)))
+
+    pages = [page for start, end in ranges for page in extract_pdf_page_range(file_path, start, end, deadline)]
+    log_pdf_pages(logger, file_path, pages, ranges[-1][1] if ranges else 0)
+
+    return pages
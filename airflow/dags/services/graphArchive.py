@@ -0,0 +1,158 @@
+import os
+import io
+import json
+import uuid
+import boto3
+import zstandard
+from contextlib import closing
+from datetime import datetime, timezone
+
+# Raw Microsoft Graph API pages are archived exactly as received, so that the
+# parse -> load -> embed -> label stages can be replayed after a change to the
+# HTML cleaner, the categorization prompt or the embedding format without
+# calling Graph again (see services/reprocessArchive.py). Layout:
+#
+#   <GRAPH_ARCHIVE_DIRECTORY>/<user>/<kind>/dt=<YYYY-MM-DD>/<run id>.jsonl.zst
+#
+# Every run writes a new segment and segments are never rewritten. Each page
+# is its own zstd frame, so a segment is readable up to the last complete page
+# even if the run was interrupted. With GRAPH_ARCHIVE_TO_S3 the segments are
+# also uploaded under graph_archive/<user>/<kind>/dt=<YYYY-MM-DD>/ in
+# S3_BUCKET_NAME, and replays read them from there when the worker's local
+# disk does not have them.
+
+# Function to get the archive root directory
+def get_archive_directory():
+    return os.path.join(os.getcwd(), os.getenv("GRAPH_ARCHIVE_DIRECTORY", "graph_archive"))
+
+
+# Function to check whether archive segments are kept in S3 as well
+def is_s3_archive_enabled():
+    return os.getenv("GRAPH_ARCHIVE_TO_S3", "false").lower() == "true"
+
+
+# Function to get the S3 key of a segment from its path relative to the archive root
+def get_s3_key(relative_path):
+    return f"graph_archive/{relative_path.replace(os.sep, '/')}"
+
+
+class GraphArchiveWriter:
+    """ Appends the raw Graph pages of one run to a new archive segment """
+
+    def __init__(self, logger, user_email, kind):
+        self.logger = logger
+        self.user_email = user_email
+        self.kind = kind
+        self.compressor = zstandard.ZstdCompressor(level=int(os.getenv("GRAPH_ARCHIVE_ZSTD_LEVEL", 10)))
+
+        partition = f"dt={datetime.now(timezone.utc).strftime('%Y-%m-%d')}"
+        self.relative_path = os.path.join(user_email, kind, partition, f"{datetime.now(timezone.utc).strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl.zst")
+        self.path = os.path.join(get_archive_directory(), self.relative_path)
+        self.page_count = 0
+
+    def append_page(self, url, payload):
+        record = {
+            "fetched_at" : datetime.now(timezone.utc).isoformat(),
+            "url"        : url,
+            "payload"    : payload
+        }
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as segment:
+            segment.write(self.compressor.compress((json.dumps(record) + "\n").encode("utf-8")))
+
+        self.page_count += 1
+
+    def close(self):
+        if not self.page_count:
+            return
+
+        self.logger.info(f"Airflow - services/graphArchive.py - close() - Archived {self.page_count} {self.kind} pages to {self.path}")
+
+        # Segments can also be kept in S3 next to the attachments
+        if is_s3_archive_enabled():
+            try:
+                s3_key = get_s3_key(self.relative_path)
+                boto3.client("s3").upload_file(self.path, os.getenv("S3_BUCKET_NAME"), s3_key)
+                self.logger.info(f"Airflow - services/graphArchive.py - close() - Uploaded archive segment to {s3_key}")
+            except Exception as e:
+                self.logger.error(f"Airflow - services/graphArchive.py - close() - Failed to upload archive segment {self.path}: {e}")
+
+
+# Function to check whether a dt=<YYYY-MM-DD> partition falls inside the replay window
+def is_partition_in_range(partition, since=None, until=None):
+    date = partition.replace("dt=", "")
+    return not ((since and date < since) or (until and date > until))
+
+
+# Function to list the segments of a user on the local disk
+def list_local_segments(user_email, kind, since=None, until=None):
+    kind_directory = os.path.join(get_archive_directory(), user_email, kind)
+
+    if not os.path.isdir(kind_directory):
+        return set()
+
+    segments = set()
+    for partition in os.listdir(kind_directory):
+        if not is_partition_in_range(partition, since, until):
+            continue
+
+        partition_directory = os.path.join(kind_directory, partition)
+        segments.update(f"{user_email}/{kind}/{partition}/{name}" for name in os.listdir(partition_directory) if name.endswith(".jsonl.zst"))
+
+    return segments
+
+
+# Function to list the segments of a user in S3
+def list_s3_segments(user_email, kind, since=None, until=None):
+    prefix = get_s3_key(f"{user_email}/{kind}/")
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+
+    segments = set()
+    for page in paginator.paginate(Bucket=os.getenv("S3_BUCKET_NAME"), Prefix=prefix):
+        for s3_object in page.get("Contents", []):
+            partition, _, name = s3_object["Key"][len(prefix):].partition("/")
+
+            if name.endswith(".jsonl.zst") and is_partition_in_range(partition, since, until):
+                segments.add(f"{user_email}/{kind}/{partition}/{name}")
+
+    return segments
+
+
+# Function to list archive segments of a user in chronological order, as paths relative to the archive root
+def list_archive_segments(user_email, kind, since=None, until=None):
+    segments = list_local_segments(user_email, kind, since, until)
+
+    # Segments written by other workers are only in S3
+    if is_s3_archive_enabled():
+        segments |= list_s3_segments(user_email, kind, since, until)
+
+    # Partition dates and the HHMMSS prefix of the segment names sort chronologically
+    return sorted(segments)
+
+
+# Function to open a segment, from the local disk when it is there and from S3 otherwise
+def open_archive_segment(relative_path):
+    local_path = os.path.join(get_archive_directory(), *relative_path.split("/"))
+
+    if os.path.exists(local_path):
+        return open(local_path, "rb")
+
+    return boto3.client("s3").get_object(Bucket=os.getenv("S3_BUCKET_NAME"), Key=get_s3_key(relative_path))["Body"]
+
+
+# Generator over the archived pages of a user, oldest first
+def read_archived_pages(logger, user_email, kind, since=None, until=None):
+    for segment_path in list_archive_segments(user_email, kind, since, until):
+        logger.info(f"Airflow - services/graphArchive.py - read_archived_pages() - Reading {segment_path}")
+
+        with closing(open_archive_segment(segment_path)) as segment:
+            reader = zstandard.ZstdDecompressor().stream_reader(segment, read_across_frames=True)
+
+            try:
+                for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                    yield json.loads(line)
+
+            # An interrupted run can leave an incomplete last frame behind
+            except (zstandard.ZstdError, json.JSONDecodeError) as e:
+                logger.warning(f"Airflow - services/graphArchive.py - read_archived_pages() - Stopped reading {segment_path} at a damaged page: {e}")
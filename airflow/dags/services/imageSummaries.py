@@ -0,0 +1,205 @@
+import os
+import time
+import base64
+import hashlib
+import threading
+from PIL import Image
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+
+from database.imageSummaries import fetch_image_summary, insert_image_summary
+
+# Loading environment variables
+load_dotenv()
+
+# The FastAPI service summarizes images on demand through the same cache
+# (fastapi/utils/imageSummaries.py), so compute_image_hash and
+# IMAGE_SUMMARY_PROMPT must be changed in both places together. The cache is
+# keyed by the exact bytes of the image, never by what it looks like.
+
+IMAGE_SUMMARY_PROMPT = (
+    "You are an assistant tasked with summarizing images for retrieval via RAGs. "
+    "These summaries will be embedded and used to retrieve the raw image via RAGs. "
+    "Give a concise summary of the image that is well optimized for retrieval via RAGs."
+)
+
+# One client is shared by every vision call made from this process
+_vision_client = None
+_vision_client_lock = threading.Lock()
+
+# Start time of the most recent vision call, used to space out requests
+_last_request_time = 0.0
+_rate_limit_lock = threading.Lock()
+
+
+# Function to get the shared GPT-4o client
+def get_vision_client():
+    global _vision_client
+
+    with _vision_client_lock:
+        if _vision_client is None:
+            _vision_client = ChatOpenAI(
+                model       = "gpt-4o",
+                max_tokens  = 1024,
+                timeout     = int(os.getenv("ATTACHMENT_TIMEOUT_SECONDS", 120)),
+                api_key     = os.getenv("OPENAI_API_KEY")
+            )
+
+    return _vision_client
+
+
+# Function to block until the next vision call fits in IMAGE_SUMMARY_RPM
+def wait_for_rate_limit():
+    global _last_request_time
+
+    min_interval = 60.0 / int(os.getenv("IMAGE_SUMMARY_RPM", 60))
+
+    with _rate_limit_lock:
+        wait_time = _last_request_time + min_interval - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        _last_request_time = time.monotonic()
+
+
+# Function to check if an image is too small to carry any content (tracking pixels, spacers, icons)
+def is_tiny_image(logger, image_path):
+    min_bytes = int(os.getenv("IMAGE_MIN_BYTES", 2048))
+    min_dimension = int(os.getenv("IMAGE_MIN_DIMENSION", 32))
+
+    if os.path.getsize(image_path) < min_bytes:
+        return True
+
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+        return width < min_dimension or height < min_dimension
+
+    except Exception as e:
+        logger.error(f"Airflow - services/imageSummaries.py - is_tiny_image() - Error reading image {image_path}: {e}")
+        return False
+
+
+# Function to compute the cache key of an image, the sha256 of its bytes like ATTACHMENT_BLOBS.content_hash
+def compute_image_hash(image_path, chunk_size=1024 * 1024):
+    # Perceptual hashes collide for look-alike images (scanned forms, screenshots,
+    # near-blank pages), which would serve one mailbox's summary to another
+    digest = hashlib.sha256()
+
+    with open(image_path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# Sub function to convert images to base64
+def encode_image_to_base64(logger, image_path):
+    logger.info(f"Airflow - services/imageSummaries.py - encode_image_to_base64() - Encoding image to base64")
+    try:
+        with open(image_path, 'rb') as img_file:
+            return base64.b64encode(img_file.read()).decode('utf-8')
+    except Exception as e:
+        logger.error(f"Airflow - services/imageSummaries.py - encode_image_to_base64() - Error encoding image to base64: {e}")
+        return None
+
+
+# Sub function to summarize images using OpenAI
+def image_summarize(logger, img_base64, prompt):
+    logger.info(f"Airflow - services/imageSummaries.py - image_summarize() - Summarizing image with GPT")
+    try:
+        wait_for_rate_limit()
+
+        msg = get_vision_client().invoke(
+            [
+                HumanMessage(
+                    content=[
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        {
+                            "type"      : "image_url",
+                            "image_url" : {"url": f"data:image/jpeg;base64,{img_base64}"},
+                        },
+                    ]
+                )
+            ]
+        )
+        return msg.content
+
+    except Exception as e:
+        logger.error(f"Airflow - services/imageSummaries.py - image_summarize() - Error generating summary with GPT-4o: {e}")
+        return None
+
+
+# Function to summarize one image, going through the summary cache first. Raises when no summary could be made
+def summarize_image(logger, image_path, image_hash=None):
+    image_hash = image_hash or compute_image_hash(image_path)
+
+    cached_summary = fetch_image_summary(logger, image_hash)
+    if cached_summary:
+        logger.info(f"Airflow - services/imageSummaries.py - summarize_image() - Reusing cached summary for {image_path}")
+        return cached_summary
+
+    image_base64 = encode_image_to_base64(logger, image_path)
+    if not image_base64:
+        raise RuntimeError(f"Failed to encode image {image_path}")
+
+    image_summary = image_summarize(logger, image_base64, IMAGE_SUMMARY_PROMPT)
+    if not image_summary:
+        raise RuntimeError(f"Failed to summarize image {image_path}")
+
+    insert_image_summary(logger, image_hash, image_summary)
+    logger.info(f"Airflow - services/imageSummaries.py - summarize_image() - Image {image_path} summary: {image_summary}")
+
+    return image_summary
+
+
+# Function to summarize a batch of images concurrently, returns the summaries, the tiny images and the errors by path.
+# images maps each path to its content hash when the caller already knows it
+def summarize_images(logger, images):
+    logger.info(f"Airflow - services/imageSummaries.py - summarize_images() - Summarizing {len(images)} images")
+
+    summaries = {}
+    skipped_paths = []
+    errors = {}
+    images_by_hash = {}
+
+    for image_path, content_hash in images.items():
+        if is_tiny_image(logger, image_path):
+            logger.info(f"Airflow - services/imageSummaries.py - summarize_images() - Skipping tiny image {image_path}")
+            skipped_paths.append(image_path)
+            continue
+
+        try:
+            image_hash = content_hash or compute_image_hash(image_path)
+        except Exception as e:
+            errors[image_path] = e
+            continue
+
+        # Copies of the same image in the batch share a single vision call
+        images_by_hash.setdefault(image_hash, []).append(image_path)
+
+    logger.info(f"Airflow - services/imageSummaries.py - summarize_images() - {len(images_by_hash)} distinct images after deduplication")
+
+    # Returns (summary, error) so one failed image does not stop the others
+    def summarize_or_fail(item):
+        try:
+            return summarize_image(logger, item[1][0], image_hash=item[0]), None
+        except Exception as e:
+            return None, e
+
+    max_workers = int(os.getenv("IMAGE_SUMMARY_CONCURRENCY", 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(summarize_or_fail, images_by_hash.items())
+
+        for paths, (summary, error) in zip(images_by_hash.values(), results):
+            for image_path in paths:
+                if error is not None:
+                    errors[image_path] = error
+                else:
+                    summaries[image_path] = summary
+
+    return summaries, skipped_paths, errors
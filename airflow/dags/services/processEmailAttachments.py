@@ -1,25 +1,22 @@
-import os
-import boto3
-import base64
 import requests
-import time
 from database.connectDB import create_connection_to_postgresql, close_connection
-from services.processEmails import save_emails_to_json_file
-from services.extractAttachments import download_attachments_from_s3
+from database.mailboxView import refresh_mailbox_view
+from services.transferAttachments import transfer_attachments
 
-def fetch_emails_with_attachments(logger):
+def fetch_emails_with_attachments(logger, user_email):
     logger.info(f"Airflow - services/processEmailAttachments.py - fetch_emails_with_attachments() - Fetching mails with attachments")
 
+    # Only the mailbox of the user whose token is used, and only emails whose attachments were never downloaded
     query = """
-        SELECT DISTINCT 
+        SELECT
             u.email AS user_email,
             e.id AS email_id,
             e.has_attachments
-        FROM emails e
-        JOIN senders s ON s.email_id = e.id
-        JOIN recipients r ON r.email_id = e.id
-        JOIN users u ON (u.email = s.email_address OR u.email = r.email_address)
-        WHERE e.has_attachments = TRUE;
+        FROM users u
+        JOIN emails e ON e.owner_user_id = u.id
+        WHERE u.email = %s
+          AND e.has_attachments = TRUE
+          AND NOT EXISTS (SELECT 1 FROM attachments a WHERE a.email_id = e.id);
         """
 
     conn = create_connection_to_postgresql()
@@ -27,7 +24,7 @@ def fetch_emails_with_attachments(logger):
         
         try:
             cursor = conn.cursor()
-            cursor.execute(query)
+            cursor.execute(query, (user_email,))
             emails_with_attachments = cursor.fetchall()
             logger.info(f"Airflow - services/processEmailAttachments.py - fetch_emails_with_attachments() - All the emails with attachments fetched successfully")
             return emails_with_attachments
@@ -45,17 +42,17 @@ def fetch_emails_with_attachments(logger):
         return []
     
 
-def insert_attachment_data(logger, attachment_id, email_id, file_name, content_type, size, s3_url):
+def insert_attachment_data(logger, attachment_id, email_id, file_name, content_type, size, s3_url, content_hash):
     conn = create_connection_to_postgresql()
 
     if conn:
         insert_query = """
-            INSERT INTO attachments (id, email_id, name, content_type, size, bucket_url)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO attachments (id, email_id, name, content_type, size, bucket_url, content_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
         """
         cursor = conn.cursor()
         try:
-            cursor.execute(insert_query, (attachment_id, email_id, file_name, content_type, size, s3_url))
+            cursor.execute(insert_query, (attachment_id, email_id, file_name, content_type, size, s3_url, content_hash))
             conn.commit()
             logger.info(f"Attachment {file_name} inserted into the database.")
         
@@ -68,118 +65,65 @@ def insert_attachment_data(logger, attachment_id, email_id, file_name, content_t
     else:
         logger.info(f"Airflow - services/processEmailAttachments.py - fetch_emails_with_attachments() - Failed to connect to the database. {e}")
 
-def upload_attachments_to_s3(logger, user_email, email_id, s3_bucket_name, access_token):
-    logger.info(f"Processing attachments for email ID: {email_id}")
-
-    # Initialize S3 client
-    s3_client = boto3.client("s3")
+def fetch_existing_attachment_ids(logger, email_id):
+    conn = create_connection_to_postgresql()
 
-    # Fetch attachments using Microsoft Graph API
-    attachment_url = f"https://graph.microsoft.com/v1.0/me/messages/{email_id}/attachments"
+    if not conn:
+        logger.info(f"Airflow - services/processEmailAttachments.py - fetch_existing_attachment_ids() - Failed to connect to the database.")
+        return set()
 
-    response = requests.get(
-        attachment_url,
-        headers={"Authorization": f"Bearer {access_token}"},
-        timeout=120,
-    )
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM attachments WHERE email_id = %s", (email_id,))
+        return {row[0] for row in cursor.fetchall()}
 
-    if response.status_code != 200:
-        logger.error(f"Failed to fetch attachments for email ID: {email_id}. Response: {response.text}")
-        return
-    
-    save_emails_to_json_file(logger, response.json(), f"{email_id}_attachments")
-
-    # save_emails_to_json_file(logger, response.json(), f"{email_id}_with_attachments.json")
-    attachments = response.json().get("value", [])
-    if not attachments:
-        logger.info(f"No attachments found for email ID: {email_id}.")
-        return
-
-    file_extensions = {
-        "PDFs"          : [".pdf"],
-        "Images"        : [".png", ".jpg", ".jpeg"],
-        "Docs"          : [".doc", ".docx"],
-        "TextFiles"     : [".txt"],
-        "SpreadSheets"  : [".xls", ".xlsx"],
-        "CSVFiles"      : ['.csv'],
-    }
-    
-    # Define base directory structure
-    base_dir = f"{user_email}/{email_id}/attachments"
-
-    # Create subdirectories for categorizing attachment files 
-    subdirectories = {
-        category: os.path.join(base_dir, category) for category in file_extensions.keys()
-    }
-
-    # Create subdirectories in S3 if they don't exist
-    for sub_dir in subdirectories.values():
-        s3_client.put_object(Bucket=s3_bucket_name, Key=f"{sub_dir}/")
-
-    # Upload attachments to S3 and insert data into the database
-    for attachment in attachments:
-        attachment_id = attachment.get("id")
-        file_name     = attachment.get("name")
-        content_bytes = attachment.get("contentBytes")
-        content_type  = attachment.get("contentType")
-        size          = attachment.get("size")  # Assuming size is in the attachment response
-
-        if not file_name or not content_bytes:
-            continue
-
-        file_contents = base64.b64decode(content_bytes)
-
-        # Save the file locally
-        if not os.path.isdir(os.path.join(os.getcwd(), "tmp")):
-            logger.info(f"creating local directory: {os.path.join(os.getcwd(), 'tmp')}")
-            os.makedirs(os.path.join(os.getcwd(), "tmp"))
-
-        local_file_path = os.path.join(os.getcwd(), f"tmp/{file_name}")  # Use /tmp or a preferred directory
-        logger.info(f"Storing attachments contents into local file: {local_file_path}")
-        
-        with open(local_file_path, "wb") as f:
-            f.write(file_contents)
-        logger.info(f"Files uploaded to  {local_file_path}")
+    except Exception as e:
+        logger.error(f"Airflow - services/processEmailAttachments.py - fetch_existing_attachment_ids() - Error fetching attachments for email ID {email_id}: {e}")
+        return set()
 
-        # Determine the target directory based on file type
-        target_dir = None
-        for category, extensions in file_extensions.items():
-            if any(file_name.lower().endswith(ext) for ext in extensions):
-                target_dir = subdirectories.get(category)
-                break
+    finally:
+        close_connection(conn, cursor)
 
-        if not target_dir:
-            logger.info(f"Skipping unsupported file type: {file_name}")
-            continue
+def upload_attachments_to_s3(logger, user_email, email_id, s3_bucket_name, access_token):
+    logger.info(f"Processing attachments for email ID: {email_id}")
 
-        try:
-            s3_key = f"{target_dir}/{file_name}"
-            s3_client.upload_file(local_file_path, s3_bucket_name, s3_key)
+    # Attachments already stored for this email don't need their bytes moved again
+    existing_ids = fetch_existing_attachment_ids(logger, email_id)
 
-            # Fetch the S3 URL for the uploaded file
-            s3_url = f"s3://{s3_bucket_name}/{s3_key}"
+    try:
+        transferred = transfer_attachments(logger, access_token, user_email, email_id, s3_bucket_name, skip_ids=existing_ids)
+    
+    except requests.RequestException as e:
+        logger.error(f"Failed to fetch attachments for email ID: {email_id}. Error: {e}")
+        return []
 
-            # Log the upload details
-            logger.info(f"[SUCCESS] Uploaded attachment {file_name} (ID: {attachment_id}) to S3 bucket {s3_bucket_name}.")
-            logger.info(f"Attachment Details: ID: {attachment_id}, Name: {file_name}, Content Type: {content_type}, Size: {size} bytes, S3 URL: {s3_url}")
+    for attachment in transferred:
+        logger.info(f"[SUCCESS] Uploaded attachment {attachment['name']} (ID: {attachment['id']}) to S3 bucket {s3_bucket_name}.")
+        logger.info(f"Attachment Details: ID: {attachment['id']}, Name: {attachment['name']}, Content Type: {attachment['content_type']}, Size: {attachment['size']} bytes, S3 URL: {attachment['s3_url']}, SHA256: {attachment['content_hash']}")
 
-            # Insert the attachment details into the database
-            insert_attachment_data(logger, attachment_id, email_id, file_name, content_type, size, s3_url)    
+        # Insert the attachment details into the database
+        insert_attachment_data(logger, attachment["id"], email_id, attachment["name"], attachment["content_type"], attachment["size"], attachment["s3_url"], attachment["content_hash"])
 
-        except Exception as e:
-            logger.error(f"[ERROR] Failed to upload {file_name} for email ID: {email_id}. Error: {e}")
+    return transferred
 
 
-def process_emails_with_attachments(logger, access_token, s3_bucket_name):
+def process_emails_with_attachments(logger, access_token, s3_bucket_name, user_email):
     logger.info(f"Airflow - services/processEmailAttachments.py - process_emails_with_attachments() - Processing mails with attachments")
 
     logger.info(f"Airflow - services/processEmailAttachments.py - process_emails_with_attachments() - Fetching mails with attachments")
-    emails_with_attachments = fetch_emails_with_attachments(logger)
+    emails_with_attachments = fetch_emails_with_attachments(logger, user_email)
+    updated_email_ids = []
 
     # Process each email's attachments
     for user_email, email_id, has_attachments in emails_with_attachments:
         if has_attachments:
             logger.info(f"Airflow - services/processEmailAttachments.py - process_emails_with_attachments() - Fetching mails with attachments for email - {user_email}, mail-id - {email_id}")
             
-            upload_attachments_to_s3(logger, user_email, email_id, s3_bucket_name, access_token)
-            download_attachments_from_s3(logger, user_email, email_id, s3_bucket_name)
\ No newline at end of file
+            # Every transferred attachment already has a local copy for the extractor,
+            # so S3 is only written to here. Use services/rehydrateAttachments.py to
+            # rebuild the download directory from S3 for reprocessing.
+            if upload_attachments_to_s3(logger, user_email, email_id, s3_bucket_name, access_token):
+                updated_email_ids.append(email_id)
+
+    # New attachments show up in the mailbox listing
+    refresh_mailbox_view(logger, updated_email_ids)
@@ -1,12 +1,15 @@
 import requests
 import os
 
-from database.loadtoDB import insert_email_folders
+from database.loadtoDB import insert_email_folders, fetch_user_id
 
 # Function to get email folders
-def get_email_folders(logger, access_token):
+def get_email_folders(logger, access_token, user_email):
     logger.info("Airflow - services/processEmailFolders - get_email_folders() - Inside get_email_folders() function")
 
+    # Folder ids belong to one mailbox, and the folder counts are read per owner
+    owner_user_id = fetch_user_id(logger, user_email)
+
     mailfolder_endpoint = os.getenv("MAILFOLDERS_ENDPOINT")
 
     headers = {
@@ -28,6 +31,7 @@ def get_email_folders(logger, access_token):
         for emailfolder in emailfolders:
             formatted_emaildir = {
                 "id"                        : emailfolder.get("id"),
+                "owner_user_id"             : owner_user_id,
                 "display_name"              : emailfolder.get("displayName"),
                 "parent_folder_id"          : emailfolder.get("parentFolderId"),
                 "child_folder_count"        : emailfolder.get("childFolderCount"),
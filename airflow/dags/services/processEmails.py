@@ -1,5 +1,4 @@
 import os
-import json
 import chardet
 import requests
 from bs4 import BeautifulSoup
@@ -7,6 +6,7 @@ from unidecode import unidecode
 
 from database.loadtoDB import load_email_info_to_db, insert_or_update_email_links
 from database.connectDB import create_connection_to_postgresql, close_connection
+from services.graphArchive import GraphArchiveWriter
 
 # Function to fetch all the emails
 def fetch_emails(logger, access_token,  email_id, user_id):
@@ -53,6 +53,9 @@ def fetch_emails(logger, access_token,  email_id, user_id):
     is_current_link_processed = False
     count = 0
 
+    # Raw pages are archived so later changes can be replayed without calling Graph again
+    archive = GraphArchiveWriter(logger, email_id, "messages")
+
     try:
         while current_link:
             logger.info(f"Airflow - services/processEmails.py - fetch_emails() - Fetching emails from link: {current_link}")
@@ -61,6 +64,7 @@ def fetch_emails(logger, access_token,  email_id, user_id):
             response.raise_for_status()
 
             email_data = response.json()
+            archive.append_page(current_link, email_data)
             emails = email_data.get("value", [])
             all_emails.extend(emails)  
 
@@ -92,6 +96,9 @@ def fetch_emails(logger, access_token,  email_id, user_id):
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Airflow - services/processEmails.py - fetch_emails() - Error while fetching emails: {e}")
+
+    finally:
+        archive.close()
     
     logger.info(f"Airflow - services/processEmails.py - fetch_emails() - Completed fetching all emails. Total emails: {len(all_emails)}")
     return all_emails
@@ -166,17 +173,6 @@ def process_email_response(logger, emails):
     return formatted_email_data
 
 
-# Function to save mails to JSON file
-def save_emails_to_json_file(logger, email_data, file_name):
-    logger.info(f"Airflow - services/processEmails.py - save_emails_to_json_file() - Saving mails to JSON file {file_name}")
-    try:
-        with open(file_name, "w") as json_file:
-            json.dump(email_data, json_file, indent=4)
-        logger.info(f"Airflow - services/processEmails.py - save_emails_to_json_file() - Email data saved to {file_name}")
-    except Exception as e:
-        logger.error(f"Airflow - services/processEmails.py - save_emails_to_json_file() - Error saving email data to JSON file: {e}")
-
-
 def process_emails(logger, access_token, user_email, email_id, user_id):
     logger.info(f"Airflow - services/processEmails.py - process_emails() - Processing emails")
 
@@ -185,7 +181,6 @@ def process_emails(logger, access_token, user_email, email_id, user_id):
 
     logger.info(f"Airflow - services/processEmails.py - process_emails() - Processing mail responses to format contents of emails")
     formatted_mail_responses = process_email_response(logger, mail_responses)
-    save_emails_to_json_file(logger, formatted_mail_responses, "mail_responses.json")
 
     logger.info(f"Airflow - services/processEmails.py - process_emails() - Loading mail data into PostgreSQL database")
     load_email_info_to_db(logger, formatted_mail_responses, user_email)
\ No newline at end of file
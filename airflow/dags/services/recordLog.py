@@ -0,0 +1,84 @@
+import os
+import json
+import gzip
+
+# Append-only, gzip compressed JSONL logs that hand records from one stage of
+# the pipeline to the next. Every append writes a complete gzip member, so a
+# reader can consume the log while the writer is still adding to it. Readers
+# keep their position in a "<log>.offset" file and resume from there.
+
+# Function to get the path of a record log
+def get_record_log_path(log_name):
+    log_directory = os.path.join(os.getcwd(), os.getenv("RECORD_LOG_DIRECTORY", "record_logs"))
+    os.makedirs(log_directory, exist_ok=True)
+
+    return os.path.join(log_directory, f"{log_name}.jsonl.gz")
+
+
+# Function to append one record to a log
+def append_record(logger, log_name, record):
+    with gzip.open(get_record_log_path(log_name), "at", encoding="utf-8") as log_file:
+        log_file.write(json.dumps(record) + "\n")
+
+
+# Function to read the number of records a consumer has already processed
+def get_log_offset(log_name):
+    offset_path = get_record_log_path(log_name) + ".offset"
+
+    if not os.path.exists(offset_path):
+        return 0
+
+    with open(offset_path, "r") as offset_file:
+        return int(offset_file.read().strip() or 0)
+
+
+# Function to store the consumer position atomically
+def save_log_offset(log_name, offset):
+    offset_path = get_record_log_path(log_name) + ".offset"
+
+    with open(offset_path + ".tmp", "w") as offset_file:
+        offset_file.write(str(offset))
+    os.replace(offset_path + ".tmp", offset_path)
+
+
+# Generator over (offset, record) pairs, starting after the records already consumed
+def read_records(logger, log_name, start=0):
+    log_path = get_record_log_path(log_name)
+
+    if not os.path.exists(log_path):
+        return
+
+    # Records are decompressed one line at a time, so memory stays flat
+    with gzip.open(log_path, "rt", encoding="utf-8") as log_file:
+        for offset, line in enumerate(log_file):
+            if offset < start:
+                continue
+
+            try:
+                yield offset, json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Airflow - services/recordLog.py - read_records() - Skipping malformed record {offset} in {log_path}: {e}")
+
+
+# Function to collect a key of every record the consumer has not processed yet
+def get_pending_keys(logger, log_name, key):
+    return {key(record) for _, record in read_records(logger, log_name, start=get_log_offset(log_name))}
+
+
+# Function to delete a log once its consumer has processed every record
+def clear_consumed_log(logger, log_name):
+    log_path = get_record_log_path(log_name)
+
+    if not os.path.exists(log_path):
+        return
+
+    offset = get_log_offset(log_name)
+    with gzip.open(log_path, "rt", encoding="utf-8") as log_file:
+        record_count = sum(1 for _ in log_file)
+
+    if offset >= record_count:
+        logger.info(f"Airflow - services/recordLog.py - clear_consumed_log() - All {record_count} records of {log_name} consumed, clearing the log")
+        os.remove(log_path)
+
+        if os.path.exists(log_path + ".offset"):
+            os.remove(log_path + ".offset")
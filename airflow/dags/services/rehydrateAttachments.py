@@ -0,0 +1,105 @@
+import os
+import boto3
+import argparse
+from dotenv import load_dotenv
+
+from services.logger import start_logger
+from database.connectDB import create_connection_to_postgresql, close_connection
+from database.attachmentManifest import update_manifest_status
+from services.transferAttachments import get_attachment_category, get_local_attachment_path, register_local_attachment
+
+# Rebuilds the local download directory from S3 so that attachments can be
+# re-extracted and re-embedded without touching Microsoft Graph API. The ingest
+# path never reads from S3; run this explicitly when reprocessing is needed:
+#
+#   cd airflow/dags && python -m services.rehydrateAttachments --user-email <email> [--email-id <id>] [--force]
+
+# Function to list the stored attachments of a mailbox
+def fetch_stored_attachments(logger, user_email, email_id=None):
+    logger.info(f"Airflow - services/rehydrateAttachments.py - fetch_stored_attachments() - Fetching stored attachments for {user_email}")
+
+    query = """
+        SELECT a.email_id, a.name, a.bucket_url
+        FROM users u
+        JOIN emails e ON e.owner_user_id = u.id
+        JOIN attachments a ON a.email_id = e.id
+        WHERE u.email = %(user_email)s
+          AND (%(email_id)s IS NULL OR a.email_id = %(email_id)s)
+          AND a.bucket_url IS NOT NULL
+    """
+
+    conn = create_connection_to_postgresql()
+
+    if not conn:
+        logger.error("Airflow - services/rehydrateAttachments.py - fetch_stored_attachments() - Failed to connect to the database")
+        return []
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, {"user_email": user_email, "email_id": email_id})
+        return cursor.fetchall()
+
+    except Exception as e:
+        logger.error(f"Airflow - services/rehydrateAttachments.py - fetch_stored_attachments() - Error fetching stored attachments: {e}")
+        return []
+
+    finally:
+        close_connection(conn, cursor)
+
+
+# Function to download attachments from S3 into the download directory
+def rehydrate_attachments_from_s3(logger, user_email, email_id=None, force=False):
+    logger.info(f"Airflow - services/rehydrateAttachments.py - rehydrate_attachments_from_s3() - Rehydrating attachments for {user_email} from S3")
+
+    s3_client = boto3.client("s3")
+    downloaded_files = []
+
+    # Blobs are shared between emails, so the per-email layout comes from the ATTACHMENTS table
+    for attachment_email_id, file_name, bucket_url in fetch_stored_attachments(logger, user_email, email_id):
+        category = get_attachment_category(file_name)
+
+        if not category:
+            continue
+
+        s3_bucket_name, s3_key = bucket_url.replace("s3://", "").split("/", 1)
+        local_file_path = get_local_attachment_path(user_email, attachment_email_id, category, file_name)
+
+        if os.path.exists(local_file_path) and not force:
+            logger.info(f"Airflow - services/rehydrateAttachments.py - rehydrate_attachments_from_s3() - File already exists locally: {local_file_path}. Skipping download.")
+            continue
+
+        try:
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            s3_client.download_file(s3_bucket_name, s3_key, local_file_path)
+            downloaded_files.append(local_file_path)
+
+            # Queue the file for extraction again if its contents changed
+            register_local_attachment(logger, local_file_path)
+
+            # A forced rehydration means the caller wants everything reprocessed
+            if force:
+                update_manifest_status(logger, [os.path.relpath(local_file_path, os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY")))], extraction_status="pending", embedded_status="pending")
+            logger.info(f"Airflow - services/rehydrateAttachments.py - rehydrate_attachments_from_s3() - Downloaded {s3_key} to {local_file_path}")
+
+        except Exception as e:
+            logger.error(f"Airflow - services/rehydrateAttachments.py - rehydrate_attachments_from_s3() - Failed to download {s3_key}. Error: {e}")
+
+    logger.info(f"Airflow - services/rehydrateAttachments.py - rehydrate_attachments_from_s3() - Rehydrated {len(downloaded_files)} attachments for {user_email}")
+    return downloaded_files
+
+
+def main():
+    load_dotenv()
+    logger = start_logger()
+
+    parser = argparse.ArgumentParser(description="Download stored attachments from S3 for reprocessing")
+    parser.add_argument("--user-email", required=True, help="Mailbox whose attachments should be rehydrated")
+    parser.add_argument("--email-id", default=None, help="Only rehydrate attachments of this email")
+    parser.add_argument("--force", action="store_true", help="Overwrite files that already exist locally and queue them for reprocessing")
+    args = parser.parse_args()
+
+    rehydrate_attachments_from_s3(logger, args.user_email, email_id=args.email_id, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+from dotenv import load_dotenv
+
+from services.logger import start_logger
+from services.graphArchive import list_archive_segments, read_archived_pages
+from services.processEmails import process_email_response
+from services.vectors import drop_user_collection
+from services.emailStages import index_pending_emails, categorize_pending_emails
+from database.loadtoDB import load_email_info_to_db
+from database.emailStages import mark_emails, delete_generated_categories
+from database.mailboxView import refresh_mailbox_view
+
+# Replays archived Graph pages through parse -> load -> embed -> label without
+# calling Microsoft Graph API, e.g. after changing the HTML cleaner, the
+# categorization prompt or the embedding format. Triggered by the
+# outlook_reprocess DAG or from the command line:
+#
+#   cd airflow/dags && python -m services.reprocessArchive --user-email <email> [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--rebuild-index]
+
+# Function to replay the archived mailbox of a user
+def reprocess_archived_emails(logger, user_email, since=None, until=None, rebuild_index=False):
+    logger.info(f"Airflow - services/reprocessArchive.py - reprocess_archived_emails() - Reprocessing archived emails of {user_email}")
+
+    # Checked before anything is dropped, a typo in the user or the date range must not wipe the index
+    if not list_archive_segments(user_email, "messages", since, until):
+        raise FileNotFoundError(f"No archive segments found for {user_email} between {since or 'the first run'} and {until or 'today'}")
+
+    # Without --rebuild-index, emails that are already in Milvus are not embedded again
+    if rebuild_index:
+        drop_user_collection(user_email)
+
+    page_count = 0
+    email_count = 0
+
+    # One page at a time, so memory does not grow with the size of the archive
+    for page in read_archived_pages(logger, user_email, "messages", since, until):
+        emails = page["payload"].get("value", [])
+
+        formatted_mail_responses = process_email_response(logger, emails)
+        load_email_info_to_db(logger, formatted_mail_responses, user_email)
+
+        # Replayed emails go through the embed and label stages again
+        email_ids = [email.get("id") for email in formatted_mail_responses]
+        delete_generated_categories(logger, email_ids)
+        mark_emails(logger, email_ids, "categorized", False)
+        refresh_mailbox_view(logger, email_ids)
+
+        if rebuild_index:
+            mark_emails(logger, email_ids, "vector_indexed", False)
+
+        page_count += 1
+        email_count += len(emails)
+
+    # Segments that only hold damaged pages must not look like a successful replay either
+    if not page_count:
+        raise FileNotFoundError(f"No archived pages found for {user_email} between {since or 'the first run'} and {until or 'today'}")
+
+    index_pending_emails(logger, user_email)
+    categorize_pending_emails(logger, user_email)
+
+    logger.info(f"Airflow - services/reprocessArchive.py - reprocess_archived_emails() - Replayed {email_count} emails from {page_count} archived pages of {user_email}")
+    return email_count
+
+
+def main():
+    load_dotenv()
+    logger = start_logger()
+
+    parser = argparse.ArgumentParser(description="Replay archived Graph API pages through the email pipeline")
+    parser.add_argument("--user-email", required=True, help="Mailbox whose archive should be replayed")
+    parser.add_argument("--since", default=None, help="First archive date to replay (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Last archive date to replay (YYYY-MM-DD)")
+    parser.add_argument("--rebuild-index", action="store_true", help="Drop the user's email vectors before replaying")
+    args = parser.parse_args()
+
+    reprocess_archived_emails(logger, args.user_email, since=args.since, until=args.until, rebuild_index=args.rebuild_index)
+
+
+if __name__ == "__main__":
+    main()
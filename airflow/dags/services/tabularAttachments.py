@@ -0,0 +1,182 @@
+import os
+import re
+import csv
+import boto3
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+# Spreadsheets and CSV files are also stored as one Parquet file per sheet,
+# next to the attachment blob in S3:
+#
+#   tables/<hash[:2]>/<hash>/<sheet index>.parquet
+#
+# The RAG agent runs aggregate queries on these files with DuckDB, which gives
+# exact answers that embedded text fragments of a table cannot.
+
+TABLE_BATCH_ROWS = 10000
+
+
+# Function to build the S3 key of a table extracted from a blob
+def build_table_key(content_hash, table_index):
+    return f"tables/{content_hash[:2]}/{content_hash}/{table_index}.parquet"
+
+
+# Function to turn header cells into unique, SQL friendly column names
+def normalize_column_names(header):
+    columns = []
+
+    for idx, cell in enumerate(header):
+        name = re.sub(r"[^0-9a-zA-Z]+", "_", str(cell or "")).strip("_").lower() or f"column_{idx + 1}"
+        if name[0].isdigit():
+            name = f"c_{name}"
+
+        while name in columns:
+            name = f"{name}_{idx + 1}"
+
+        columns.append(name)
+
+    return columns
+
+
+# Function to read a cell as a number, or None when it is not one
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_empty(value):
+    return value is None or value == ""
+
+
+# Function to pick a Parquet type per column from the first batch of rows
+def infer_column_types(rows, width):
+    column_types = []
+
+    for idx in range(width):
+        values = [row[idx] for row in rows if idx < len(row) and not is_empty(row[idx])]
+        is_numeric = values and all(to_number(value) is not None for value in values)
+        column_types.append(pa.float64() if is_numeric else pa.string())
+
+    return column_types
+
+
+# Function to convert a batch of rows into an Arrow record batch
+def build_record_batch(rows, columns, column_types):
+    arrays = []
+
+    for idx, column_type in enumerate(column_types):
+        values = [row[idx] if idx < len(row) else None for row in rows]
+
+        # Values that do not fit the inferred type are stored as nulls
+        if column_type == pa.float64():
+            arrays.append(pa.array([None if is_empty(value) else to_number(value) for value in values], type=column_type))
+        else:
+            arrays.append(pa.array([None if is_empty(value) else str(value) for value in values], type=column_type))
+
+    return pa.RecordBatch.from_arrays(arrays, names=columns)
+
+
+# Function to stream table rows into a Parquet file
+def write_rows_to_parquet(rows, parquet_path, max_rows=None):
+    columns = None
+    column_types = None
+    writer = None
+    batch = []
+    row_count = 0
+
+    try:
+        for row in rows:
+            # The first non-empty row names the columns
+            if columns is None:
+                if any(not is_empty(cell) for cell in row):
+                    columns = normalize_column_names(row)
+                continue
+
+            if max_rows and row_count >= max_rows:
+                break
+
+            if all(is_empty(cell) for cell in row):
+                continue
+
+            batch.append(row)
+            row_count += 1
+
+            # Rows are written in batches so memory stays bounded
+            if len(batch) >= TABLE_BATCH_ROWS:
+                if writer is None:
+                    column_types = infer_column_types(batch, len(columns))
+                    writer = pq.ParquetWriter(parquet_path, pa.schema(list(zip(columns, column_types))))
+
+                writer.write_batch(build_record_batch(batch, columns, column_types))
+                batch = []
+
+        if columns is None:
+            return None
+
+        if writer is None:
+            column_types = infer_column_types(batch, len(columns))
+            writer = pq.ParquetWriter(parquet_path, pa.schema(list(zip(columns, column_types))))
+
+        if batch:
+            writer.write_batch(build_record_batch(batch, columns, column_types))
+
+    finally:
+        if writer:
+            writer.close()
+
+    return {
+        "columns" : [{"name": name, "type": "number" if column_type == pa.float64() else "text"} for name, column_type in zip(columns, column_types)],
+        "rows"    : row_count
+    }
+
+
+# Generator over the tables of a file as (sheet name, rows)
+def iter_tables(file_path):
+    file_extension = os.path.splitext(file_path)[-1].lower()
+
+    if file_extension == ".csv":
+        with open(file_path, "r", newline="", encoding="utf-8", errors="replace") as file:
+            yield None, csv.reader(file)
+
+    elif file_extension == ".xlsx":
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield sheet.title, sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+
+# Function to store every table of a spreadsheet or CSV file as Parquet in S3
+def export_tables_to_parquet(logger, file_path, content_hash, max_rows=None):
+    logger.info(f"Airflow - services/tabularAttachments.py - export_tables_to_parquet() - Exporting tables of {file_path} to Parquet")
+
+    s3_client = boto3.client("s3")
+    s3_bucket_name = os.getenv("S3_BUCKET_NAME")
+    tables = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for table_index, (sheet_name, rows) in enumerate(iter_tables(file_path)):
+            parquet_path = os.path.join(temp_dir, f"{table_index}.parquet")
+            table = write_rows_to_parquet(rows, parquet_path, max_rows)
+
+            if not table:
+                continue
+
+            s3_key = build_table_key(content_hash, table_index)
+            s3_client.upload_file(parquet_path, s3_bucket_name, s3_key)
+
+            tables.append({"sheet": sheet_name, "s3_url": f"s3://{s3_bucket_name}/{s3_key}", **table})
+            logger.info(f"Airflow - services/tabularAttachments.py - export_tables_to_parquet() - Stored {table['rows']} rows of sheet {sheet_name} at {s3_key}")
+
+    return tables
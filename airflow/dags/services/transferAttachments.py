@@ -0,0 +1,323 @@
+import os
+import uuid
+import boto3
+import hashlib
+import requests
+from boto3.s3.transfer import TransferConfig
+
+from database.attachmentBlobs import fetch_attachment_blob, insert_attachment_blob
+from database.attachmentManifest import register_manifest_entry
+
+GRAPH_MESSAGES_ENDPOINT = "https://graph.microsoft.com/v1.0/me/messages"
+
+# Supported attachment types, grouped by the directory they are stored under
+ATTACHMENT_CATEGORIES = {
+    "PDFs"          : [".pdf"],
+    "Images"        : [".png", ".jpg", ".jpeg"],
+    "Docs"          : [".doc", ".docx"],
+    "TextFiles"     : [".txt"],
+    "SpreadSheets"  : [".xls", ".xlsx"],
+    "CSVFiles"      : [".csv"],
+}
+
+FILE_ATTACHMENT_TYPE = "#microsoft.graph.fileAttachment"
+
+
+# Function to find the category of an attachment based on its extension
+def get_attachment_category(file_name):
+    file_extension = os.path.splitext(file_name)[-1].lower()
+
+    for category, extensions in ATTACHMENT_CATEGORIES.items():
+        if file_extension in extensions:
+            return category
+
+    return None
+
+
+# Function to build the S3 multipart configuration used for streamed uploads
+def get_transfer_config():
+    chunk_size = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+
+    # Peak memory of a streamed upload is roughly chunk_size * max_concurrency,
+    # regardless of how large the attachment itself is
+    return TransferConfig(
+        multipart_threshold = chunk_size,
+        multipart_chunksize = chunk_size,
+        max_concurrency     = int(os.getenv("S3_MAX_CONCURRENCY", 4)),
+        use_threads         = True
+    )
+
+
+# Function to fetch attachment metadata (without contentBytes) from Microsoft Graph API
+def fetch_attachment_metadata(logger, access_token, email_id):
+    logger.info(f"Airflow - services/transferAttachments.py - fetch_attachment_metadata() - Fetching attachment metadata for email ID: {email_id}")
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = {"$select": "id,name,contentType,size,isInline"}
+
+    current_link = f"{GRAPH_MESSAGES_ENDPOINT}/{email_id}/attachments"
+    attachments = []
+
+    while current_link:
+        response = requests.get(current_link, headers=headers, params=params, timeout=60)
+        response.raise_for_status()
+
+        metadata = response.json()
+        attachments.extend(metadata.get("value", []))
+
+        # The nextLink already carries the query parameters
+        current_link = metadata.get("@odata.nextLink")
+        params = None
+
+    logger.info(f"Airflow - services/transferAttachments.py - fetch_attachment_metadata() - Found {len(attachments)} attachments for email ID: {email_id}")
+    return attachments
+
+
+# Function to drop attachments that should not be transferred before any bytes move
+def filter_transferable_attachments(logger, attachments, skip_ids=None):
+    skip_ids = skip_ids or set()
+    transferable = []
+
+    for attachment in attachments:
+        attachment_id = attachment.get("id")
+        file_name     = attachment.get("name")
+
+        if attachment_id in skip_ids:
+            logger.info(f"Airflow - services/transferAttachments.py - filter_transferable_attachments() - Attachment {file_name} already transferred. Skipping...")
+            continue
+
+        # Item attachments (attached mails, events) and reference attachments (OneDrive links) have no file contents
+        if attachment.get("@odata.type", FILE_ATTACHMENT_TYPE) != FILE_ATTACHMENT_TYPE:
+            logger.info(f"Airflow - services/transferAttachments.py - filter_transferable_attachments() - Skipping non-file attachment: {file_name}")
+            continue
+
+        # Inline attachments are signature logos, tracking pixels and embedded images
+        if attachment.get("isInline", False):
+            logger.info(f"Airflow - services/transferAttachments.py - filter_transferable_attachments() - Skipping inline attachment: {file_name}")
+            continue
+
+        category = get_attachment_category(file_name) if file_name else None
+        if not category:
+            logger.info(f"Airflow - services/transferAttachments.py - filter_transferable_attachments() - Skipping unsupported file type: {file_name}")
+            continue
+
+        transferable.append((attachment, category))
+
+    return transferable
+
+
+# Function to build a unique local file name for an attachment within an email
+def build_attachment_name(file_name, used_names):
+    # Attachment names come from the sender, so never trust them as paths
+    file_name = os.path.basename(file_name.replace("\\", "/"))
+    stem, extension = os.path.splitext(file_name)
+
+    unique_name = file_name
+    suffix = 1
+
+    # Two attachments with the same name on one email must not overwrite each other
+    while unique_name in used_names:
+        unique_name = f"{stem}_{suffix}{extension}"
+        suffix += 1
+
+    used_names.add(unique_name)
+    return unique_name
+
+
+# Function to build the content-addressed S3 key of an attachment
+def build_blob_key(content_hash):
+    return f"blobs/{content_hash[:2]}/{content_hash}"
+
+
+# Function to build the local path the extractor reads an attachment from
+def get_local_attachment_path(user_email, email_id, category, file_name):
+    download_dir = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY"))
+
+    return os.path.join(download_dir, user_email, email_id, category, file_name)
+
+
+# Function to compute the sha256 of a file without loading it into memory
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# Function to register a file in the download directory with the extraction manifest
+def register_local_attachment(logger, local_file_path, content_hash=None):
+    download_dir = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY"))
+    relative_path = os.path.relpath(local_file_path, download_dir)
+
+    # <user_email>/<email_id>/<category>/<file_name>
+    user_email, email_id, category, file_name = relative_path.split(os.sep)
+    file_stat = os.stat(local_file_path)
+
+    register_manifest_entry(logger, {
+        "path"         : relative_path,
+        "user_email"   : user_email,
+        "email_id"     : email_id,
+        "file_type"    : category,
+        "file_name"    : file_name,
+        "size"         : file_stat.st_size,
+        "mtime"        : file_stat.st_mtime,
+        "content_hash" : content_hash or compute_file_hash(local_file_path)
+    })
+
+
+# File-like wrapper that copies everything read from a stream into a local file and a hash
+class TeeReader:
+    def __init__(self, stream, local_file, digest):
+        self.stream = stream
+        self.local_file = local_file
+        self.digest = digest
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+
+        if chunk:
+            self.local_file.write(chunk)
+            self.digest.update(chunk)
+
+        return chunk
+
+
+# Function to download a small attachment into memory and store it under its content hash
+def transfer_attachment_in_memory(logger, s3_client, access_token, email_id, attachment, s3_bucket_name, local_file_path):
+    value_url = f"{GRAPH_MESSAGES_ENDPOINT}/{email_id}/attachments/{attachment['id']}/$value"
+
+    response = requests.get(value_url, headers={"Authorization": f"Bearer {access_token}"}, timeout=120)
+    response.raise_for_status()
+
+    content = response.content
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    with open(local_file_path, "wb") as local_file:
+        local_file.write(content)
+
+    # Identical bytes were already stored by another email or user
+    if fetch_attachment_blob(logger, content_hash):
+        logger.info(f"Airflow - services/transferAttachments.py - transfer_attachment_in_memory() - Blob {content_hash} already stored. Skipping upload.")
+        return content_hash
+
+    s3_key = build_blob_key(content_hash)
+    s3_client.put_object(
+        Bucket      = s3_bucket_name,
+        Key         = s3_key,
+        Body        = content,
+        ContentType = attachment.get("contentType") or "application/octet-stream"
+    )
+    insert_attachment_blob(logger, content_hash, f"s3://{s3_bucket_name}/{s3_key}", len(content), attachment.get("contentType"))
+
+    logger.info(f"Airflow - services/transferAttachments.py - transfer_attachment_in_memory() - Uploaded {len(content)} bytes to {s3_key}")
+    return content_hash
+
+
+# Function to stream a large attachment from Microsoft Graph API straight into an S3 multipart upload
+def stream_attachment_to_s3(logger, s3_client, access_token, email_id, attachment, s3_bucket_name, local_file_path):
+    value_url = f"{GRAPH_MESSAGES_ENDPOINT}/{email_id}/attachments/{attachment['id']}/$value"
+
+    # The hash is only known once the stream ends, so upload to a staging key first
+    staging_key = f"staging/{uuid.uuid4()}"
+    digest = hashlib.sha256()
+
+    with requests.get(value_url, headers={"Authorization": f"Bearer {access_token}"}, stream=True, timeout=120) as response:
+        response.raise_for_status()
+
+        # Let urllib3 undo any transfer encoding while S3 reads from the socket
+        response.raw.decode_content = True
+
+        # The extractor's copy is written chunk by chunk as S3 consumes the stream,
+        # so nothing has to be downloaded back from S3 afterwards
+        with open(local_file_path, "wb") as local_file:
+            s3_client.upload_fileobj(
+                Fileobj   = TeeReader(response.raw, local_file, digest),
+                Bucket    = s3_bucket_name,
+                Key       = staging_key,
+                ExtraArgs = {"ContentType": attachment.get("contentType") or "application/octet-stream"},
+                Config    = get_transfer_config()
+            )
+
+    content_hash = digest.hexdigest()
+
+    try:
+        if fetch_attachment_blob(logger, content_hash):
+            logger.info(f"Airflow - services/transferAttachments.py - stream_attachment_to_s3() - Blob {content_hash} already stored. Discarding staged upload.")
+
+        else:
+            # Server-side copy, the bytes do not pass through the worker again
+            s3_key = build_blob_key(content_hash)
+            s3_client.copy(
+                CopySource = {"Bucket": s3_bucket_name, "Key": staging_key},
+                Bucket     = s3_bucket_name,
+                Key        = s3_key,
+                Config     = get_transfer_config()
+            )
+            insert_attachment_blob(logger, content_hash, f"s3://{s3_bucket_name}/{s3_key}", os.path.getsize(local_file_path), attachment.get("contentType"))
+            logger.info(f"Airflow - services/transferAttachments.py - stream_attachment_to_s3() - Streamed attachment {attachment.get('name')} to {s3_key}")
+
+    finally:
+        s3_client.delete_object(Bucket=s3_bucket_name, Key=staging_key)
+
+    return content_hash
+
+
+# Function to transfer every supported attachment of an email to S3
+def transfer_attachments(logger, access_token, user_email, email_id, s3_bucket_name, skip_ids=None):
+    logger.info(f"Airflow - services/transferAttachments.py - transfer_attachments() - Transferring attachments for email ID: {email_id}")
+
+    attachments = fetch_attachment_metadata(logger, access_token, email_id)
+    transferable = filter_transferable_attachments(logger, attachments, skip_ids=skip_ids)
+
+    if not transferable:
+        logger.info(f"Airflow - services/transferAttachments.py - transfer_attachments() - No attachments to transfer for email ID: {email_id}")
+        return []
+
+    s3_client = boto3.client("s3")
+    stream_threshold = int(os.getenv("ATTACHMENT_STREAM_THRESHOLD", 4 * 1024 * 1024))
+
+    used_names = set()
+    transferred = []
+
+    for attachment, category in transferable:
+        file_name = build_attachment_name(attachment.get("name"), used_names)
+        size      = attachment.get("size") or 0
+
+        local_file_path = get_local_attachment_path(user_email, email_id, category, file_name)
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+
+        try:
+            # Small files are kept in memory and written once for the extractor
+            if size <= stream_threshold:
+                content_hash = transfer_attachment_in_memory(logger, s3_client, access_token, email_id, attachment, s3_bucket_name, local_file_path)
+            else:
+                content_hash = stream_attachment_to_s3(logger, s3_client, access_token, email_id, attachment, s3_bucket_name, local_file_path)
+
+        except Exception as e:
+            logger.error(f"Airflow - services/transferAttachments.py - transfer_attachments() - Failed to transfer {file_name} for email ID: {email_id}. Error: {e}")
+
+            # A partially written file would otherwise be picked up by the extractor
+            if os.path.exists(local_file_path):
+                os.remove(local_file_path)
+            continue
+
+        register_local_attachment(logger, local_file_path, content_hash)
+
+        transferred.append({
+            "id"           : attachment.get("id"),
+            "email_id"     : email_id,
+            "user_email"   : user_email,
+            "name"         : file_name,
+            "category"     : category,
+            "content_type" : attachment.get("contentType"),
+            "size"         : size,
+            "content_hash" : content_hash,
+            "s3_url"       : f"s3://{s3_bucket_name}/{build_blob_key(content_hash)}",
+            "local_path"   : local_file_path
+        })
+
+    logger.info(f"Airflow - services/transferAttachments.py - transfer_attachments() - Transferred {len(transferred)} attachments for email ID: {email_id}")
+    return transferred
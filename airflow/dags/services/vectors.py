@@ -1,11 +1,11 @@
 import os
-import re
 import json
-import tiktoken
 from openai import OpenAI
 from dotenv import load_dotenv
 from services.logger import start_logger
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from database.attachmentBlobs import fetch_attachment_blob, update_attachment_blob_embeddings
+from services.chunking import chunk_sections, count_tokens
+from services.recordLog import read_records, get_log_offset, save_log_offset
 from pymilvus import MilvusClient, CollectionSchema, FieldSchema, DataType
 
 # Load env
@@ -51,34 +51,23 @@ def connect_to_Milvus():
     finally:
         return client
     
-def count_tokens(text):
-    '''Counts the tokens in the given text using the specified tokenizer '''
-    
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-    return len(tokenizer.encode(text))
-
-def remove_urls(text):
-    ''' Remove URLs from the text '''
-    
-    return re.sub(r'http\S+|www\S+', '', text)
+def build_table_schema_text(file_name, section, sample_rows=5):
+    ''' Describe a table by its columns and first rows, used in place of chunks of the whole table '''
 
-def preprocess_text(text, max_tokens=7000):
-    ''' Remove URLs from email content if token count for text exceeds max tokens '''
+    table = section["table"]
+    columns = ", ".join(f"{column['name']} ({column['type']})" for column in table["columns"])
+    sample = "\n".join(section["text"].splitlines()[:sample_rows + 2])
 
-    token_count = count_tokens(text)
-
-    if token_count > max_tokens:
-        logger.warning(f"Airflow - MILVUS - Token count ({token_count}) exceeds {max_tokens}, removing URLs...")
-        text = remove_urls(text)
-        
-        token_count = count_tokens(text)
-        logger.warning(f"Airflow - MILVUS - Token count after URL removal: {token_count}")
-    
-    return text
+    return (
+        f"Table from {file_name}" + (f", sheet {section['sheet']}" if section.get("sheet") else "") + "\n"
+        f"Columns: {columns}\n"
+        f"Rows: {table['rows']}\n"
+        f"Sample:\n{sample}"
+    )
 
-def openai_embeddings(content):
-    ''' Convert text to OpenAI embeddings '''
-    logger.info("Airflow - MILVUS - openai_embeddings() - Connecting to OpenAI...")
+def openai_embeddings_batch(contents):
+    ''' Convert several texts to OpenAI embeddings with a single request '''
+    logger.info(f"Airflow - MILVUS - openai_embeddings_batch() - Creating embeddings for {len(contents)} texts...")
 
     embeddings = None
     client = None
@@ -90,14 +79,15 @@ def openai_embeddings(content):
             organization = os.getenv("ORGANIZATION_ID")
         )
 
-        embeddings = client.embeddings.create(
-            input = [content], 
+        response = client.embeddings.create(
+            input = contents, 
             model = os.getenv("EMBEDDING_MODEL")
-        ).data[0].embedding
+        )
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
     
     except Exception as exception:
-        logger.error("Airflow - MILVUS - openai_embeddings() - Exception occurred when converting content to embeddings (See exception below)")
-        logger.error(f"Airflow - MILVUS - openai_embeddings() - {exception}")
+        logger.error("Airflow - MILVUS - openai_embeddings_batch() - Exception occurred when converting contents to embeddings (See exception below)")
+        logger.error(f"Airflow - MILVUS - openai_embeddings_batch() - {exception}")
 
     finally:
         
@@ -106,6 +96,21 @@ def openai_embeddings(content):
         
         return embeddings
 
+def split_email_for_indexing(data_to_index, max_tokens=None):
+    ''' Build the texts to embed for an email, one per body chunk when the body is too long for a single vector '''
+
+    max_tokens = max_tokens or int(os.getenv("EMAIL_CHUNK_MAX_TOKENS", 1024))
+
+    header = "; ".join([f"{str(key).upper()}: {value}" for key, value in data_to_index.items() if key != "body"])
+    body = data_to_index.get("body") or ""
+
+    # Short emails keep a single vector, exactly as before
+    if count_tokens(body) <= max_tokens:
+        return ["; ".join([f"{str(key).upper()}: {value}" for key, value in data_to_index.items()])]
+
+    # Every chunk repeats the header so it can be matched on sender and subject too
+    return [f"{header}; BODY: {chunk['text']}" for chunk in chunk_sections([{"text": body}], max_tokens=max_tokens)]
+
 def create_embeddings_and_index(data_to_index, metadata):
     ''' Create embeddings using OpenAI embeddings and index the vectors '''
 
@@ -175,24 +180,28 @@ def create_embeddings_and_index(data_to_index, metadata):
         logger.error("Airflow - MILVUS - connect_to_milvus() - Exception occurred when connecting to Milvus database (See exception below)")
         logger.error(f"Airflow - MILVUS - connect_to_milvus() - {exception}")
 
-    # Check if token limit is being exceeded
-    data_to_index["body"] = preprocess_text(text=data_to_index["body"], max_tokens=7000)
-
-    # Content to index
-    content = "; ".join([f"{str(key).upper()}: {value}" for key, value in data_to_index.items()])
+    # Long bodies are indexed as several vectors instead of one diluted (or rejected) vector
+    contents = split_email_for_indexing(data_to_index)
 
     try:
-        embedding = openai_embeddings(content=content)
-
-        vectors = {
-            "embedding"     : embedding,
-            "metadata"      : metadata,
-            "page_content"  : content
-        }
+        embeddings = openai_embeddings_batch(contents=contents)
+
+        if not embeddings:
+            raise ValueError(f"No embeddings returned for email {metadata.get('id')}")
+
+        # parent_id links the chunks of one email so retrieval can collapse them again
+        vectors = [
+            {
+                "embedding"     : embedding,
+                "metadata"      : {**metadata, "parent_id": metadata.get("id"), "chunk_index": idx, "chunk_count": len(contents)},
+                "page_content"  : content
+            }
+            for idx, (content, embedding) in enumerate(zip(contents, embeddings))
+        ]
 
         conn.insert(collection_name=collection_name, data=vectors)
         is_indexed = True
-        logger.info(f"Airflow - MILVUS - create_embeddings_and_index() - Saved vectors with metadata to {collection_name} successfully.")
+        logger.info(f"Airflow - MILVUS - create_embeddings_and_index() - Saved {len(vectors)} vectors with metadata to {collection_name} successfully.")
         
     except Exception as exception:
         logger.error("Airflow - MILVUS - create_embeddings_and_index() - Exception occurred when creating and indexing embeddings (See exception below)")
@@ -204,33 +213,47 @@ def create_embeddings_and_index(data_to_index, metadata):
         # If needed in future
         return is_indexed 
 
-def embed_email_attachments(filename: str):
-    ''' Read the filename for the json file, and create embeddings for email attachments '''
+def drop_user_collection(user_email):
+    ''' Drop the email collection of a user so that it can be rebuilt from scratch '''
 
-    logger.info("Airflow - MILVUS - embed_email_attachments() - Creating embeddings for email attachments...")
-    data = []
+    logger.info(f"Airflow - MILVUS - drop_user_collection() - Dropping email collection of {user_email}")
+
+    conn = connect_to_Milvus()
+    if not conn:
+        logger.error("Airflow - MILVUS - drop_user_collection() - Cannot drop collection because connection to Milvus failed")
+        return False
+
+    collection_name = str(user_email)
+    collection_name = collection_name.replace('@', os.getenv("__AT"))
+    collection_name = collection_name.replace('.', os.getenv("__PERIOD"))
 
     try:
-        logger.info(f"Airflow - MILVUS - embed_email_attachments() - Reading {filename}")
+        if conn.has_collection(collection_name):
+            conn.drop_collection(collection_name)
+        return True
+    
+    except Exception as exception:
+        logger.error(f"Airflow - MILVUS - drop_user_collection() - {exception}")
+        return False
+    
+    finally:
+        conn.close()
 
-        with open(file=filename, mode='r') as file:
-            data = json.load(file)
+def embed_email_attachments(log_name: str):
+    ''' Stream the unconsumed records of the extraction log, create embeddings for email attachments and return the paths that were indexed '''
+
+    logger.info("Airflow - MILVUS - embed_email_attachments() - Creating embeddings for email attachments...")
+    embedded_paths = []
 
-        if len(data) == 0:
-            raise ValueError(f"Expected some data in {filename}, but found nothing. Skipping...")
+    try:
+        start_offset = get_log_offset(log_name)
+        logger.info(f"Airflow - MILVUS - embed_email_attachments() - Reading {log_name} from record {start_offset}")
         
         conn = connect_to_Milvus()
         if not conn:
             logger.error("Airflow - MILVUS - embed_email_attachments() - Cannot create embeddings because connection to Milvus failed")
             raise ConnectionError()
         
-        # LangChain
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size      = 1000,
-            chunk_overlap   = 100,
-            length_function = len
-        )
-
         # Attachments Collection
         fields = [
             FieldSchema(
@@ -257,7 +280,7 @@ def embed_email_attachments(filename: str):
         
         logger.info(f"Airflow - MILVUS - embed_email_attachments() - Preparing content for embeddings...")
         
-        for record in data:
+        for offset, record in read_records(logger, log_name, start=start_offset):
 
             user_id     = record["email_id"]
             email_id    = record["email"]
@@ -289,32 +312,109 @@ def embed_email_attachments(filename: str):
                 conn.create_index(collection_name=collection_name, index_params=index_params)
                 logger.info(f"Airflow - MILVUS - embed_email_attachments() - Added index to embeddings successfully.")
 
-            # Create chunks and embed them
-            chunks = text_splitter.split_text(content)
-
-            logger.info(f"Airflow - MILVUS - embed_email_attachments() - Creating embeddings for file {file_name}")
-
-            for idx, chunk in enumerate(chunks):
-                embedding = openai_embeddings(content=chunk)
+            content_hash = record.get("content_hash")
+            blob = fetch_attachment_blob(logger, content_hash) if content_hash else None
 
-                if embedding:
-                    metadata = {
-                        "user_id"     : user_id,
-                        "email_id"    : email_id,
-                        "file_type"   : file_type,
-                        "file_name"   : file_name,
-                        "chunk_index" : idx
-                    }
-
-                    vectors = {
-                        "embedding"     : embedding,
-                        "metadata"      : metadata,
-                        "page_content"  : chunk
-                    }
+            # The same bytes were already embedded for another email or user
+            if blob and blob["embedded_chunks"]:
+                logger.info(f"Airflow - MILVUS - embed_email_attachments() - Reusing cached embeddings of blob {content_hash} for file {file_name}")
+                embedded_chunks = blob["embedded_chunks"]
+            
+            else:
+                # Create chunks and embed them. Chunks follow the page, sheet and heading structure of the file
+                sections = record.get("sections") or [{"text": content}]
+                chunks = chunk_sections([section for section in sections if not section.get("table")])
+
+                # A table stored as Parquet is represented by a single schema record
+                for section in sections:
+                    if section.get("table"):
+                        chunks.append({
+                            "text"     : build_table_schema_text(file_name, section),
+                            "page"     : None,
+                            "page_end" : None,
+                            "sheet"    : section.get("sheet"),
+                            "table"    : section["table"]
+                        })
+                
+                embedded_chunks = []
+
+                logger.info(f"Airflow - MILVUS - embed_email_attachments() - Creating embeddings for {len(chunks)} chunks of file {file_name}")
+
+                # One request per batch of chunks instead of one request per chunk
+                batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))
+
+                for batch_start in range(0, len(chunks), batch_size):
+                    batch = chunks[batch_start:batch_start + batch_size]
+                    embeddings = openai_embeddings_batch(contents=[chunk["text"] for chunk in batch])
+
+                    # A file is embedded completely or not at all, a partial set would be cached for every copy of the blob
+                    if not embeddings or len(embeddings) != len(batch):
+                        embedded_chunks = None
+                        break
+
+                    for idx, (chunk, embedding) in enumerate(zip(batch, embeddings), start=batch_start):
+                        embedded_chunks.append({
+                            "chunk_index"  : idx,
+                            "page"         : chunk["page"],
+                            "page_end"     : chunk["page_end"],
+                            "sheet"        : chunk["sheet"],
+                            "table"        : chunk.get("table"),
+                            "page_content" : chunk["text"],
+                            "embedding"    : embedding
+                        })
+
+                # The record is consumed but its path is not reported as embedded, so the
+                # manifest keeps it pending and the next run appends it to the log again
+                if embedded_chunks is None:
+                    logger.error(f"Airflow - MILVUS - embed_email_attachments() - Failed to embed every chunk of file {file_name}, it will be retried by the next run")
+                    save_log_offset(log_name, offset + 1)
+                    continue
+
+                if blob and embedded_chunks:
+                    update_attachment_blob_embeddings(logger, content_hash, embedded_chunks)
+
+            # A record retried after a partial insert replaces the vectors it left behind
+            conn.delete(
+                collection_name = collection_name,
+                filter          = f'metadata["email_id"] == {json.dumps(email_id)} and metadata["file_name"] == {json.dumps(file_name)}'
+            )
 
-                    conn.insert(collection_name=collection_name, data=vectors, timeout=None)
-                    logger.info(f"Airflow - MILVUS - embed_email_attachments() - Saved attachment vectors with metadata to {collection_name} successfully.")
+            vectors = []
+            for embedded_chunk in embedded_chunks:
+                metadata = {
+                    "user_id"      : user_id,
+                    "email_id"     : email_id,
+                    "file_type"    : file_type,
+                    "file_name"    : file_name,
+                    "content_hash" : content_hash,
+                    "chunk_index"  : embedded_chunk["chunk_index"],
+                    "page"         : embedded_chunk.get("page"),
+                    "page_end"     : embedded_chunk.get("page_end"),
+                    "sheet"        : embedded_chunk.get("sheet"),
+                    "table_url"    : (embedded_chunk.get("table") or {}).get("s3_url"),
+                    "columns"      : (embedded_chunk.get("table") or {}).get("columns")
+                }
+
+                vectors.append({
+                    "embedding"     : embedded_chunk["embedding"],
+                    "metadata"      : metadata,
+                    "page_content"  : embedded_chunk["page_content"]
+                })
+
+            # All vectors of a file are inserted together
+            if vectors:
+                conn.insert(collection_name=collection_name, data=vectors, timeout=None)
+                logger.info(f"Airflow - MILVUS - embed_email_attachments() - Saved {len(vectors)} attachment vectors with metadata to {collection_name} successfully.")
+
+            if embedded_chunks:
+                embedded_paths.append(record.get("path"))
+
+            # Resume from the next record if this run stops here
+            save_log_offset(log_name, offset + 1)
     
     except Exception as exception:
         logger.error("Airflow - MILVUS - embed_email_attachments() - Exception occurred when embedding email attachments (See exception below)")
         logger.error(f"Airflow - MILVUS - embed_email_attachments() - {exception}")
+
+    # Paths of the records that were fully indexed
+    return embedded_paths
@@ -0,0 +1,131 @@
+import os
+import re
+import boto3
+import hashlib
+import duckdb
+import threading
+from langchain.tools import tool
+from dotenv import load_dotenv
+
+from utils.logs import start_logger
+
+# Load environment variables
+load_dotenv()
+
+# Logging
+logger = start_logger()
+
+# Spreadsheet and CSV attachments are stored by the Airflow pipeline as one
+# Parquet file per sheet. Queries run in-process with DuckDB on a local copy.
+TABLE_CACHE_DIRECTORY = os.path.join("tmp", "tables")
+MAX_RESULT_ROWS = 50
+
+# Key layout written by airflow/dags/services/tabularAttachments.build_table_key
+TABLE_KEY_PATTERN = re.compile(r"^tables/[0-9a-f]{2}/[0-9a-f]{64}/\d+\.parquet$")
+
+s3_client = boto3.client(
+    's3',
+    aws_access_key_id     = os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name           = os.getenv('AWS_REGION')
+)
+
+
+def download_table(table_url: str) -> str:
+    """ Download a Parquet table from S3 once and return its local path """
+
+    # The URL comes from the LLM, so only tables written by the pipeline to our bucket are accepted
+    prefix = f"s3://{os.getenv('S3_BUCKET_NAME')}/"
+    key = table_url[len(prefix):] if table_url.startswith(prefix) else ""
+
+    if not TABLE_KEY_PATTERN.match(key):
+        raise ValueError(f"Not an attachment table URL: {table_url}")
+
+    # Table keys embed the content hash of the attachment, so a cached copy never goes stale
+    local_path = os.path.join(TABLE_CACHE_DIRECTORY, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".parquet")
+
+    if not os.path.exists(local_path):
+        logger.info(f"AGENTS/ATTACHMENT_TABLES - download_table() - Downloading {table_url}")
+        os.makedirs(TABLE_CACHE_DIRECTORY, exist_ok=True)
+        s3_client.download_file(os.getenv("S3_BUCKET_NAME"), key, local_path)
+
+    return local_path
+
+
+def run_table_query(table_url: str, sql: str) -> str:
+    """ Run one SELECT statement on a table with bounded memory, threads and time """
+
+    logger.info(f"AGENTS/ATTACHMENT_TABLES - run_table_query() - Running query on {table_url}: {sql}")
+
+    statement = sql.strip().rstrip(";")
+    if not statement.lower().startswith(("select", "with")) or ";" in statement:
+        return "Only a single SELECT statement is allowed"
+
+    try:
+        local_path = download_table(table_url)
+
+        with duckdb.connect() as conn:
+            # Queries run inside the API process, a cross join over a large sheet must not take it down
+            conn.execute(f"SET memory_limit = '{os.getenv('TABLE_QUERY_MEMORY_LIMIT', '256MB')}'")
+            conn.execute(f"SET threads = {int(os.getenv('TABLE_QUERY_THREADS', 2))}")
+
+            conn.execute("CREATE TABLE sheet AS SELECT * FROM read_parquet(?)", [local_path])
+
+            # The query itself cannot read or write anything outside of `sheet`
+            conn.execute("SET enable_external_access = false")
+
+            # Interrupted when it runs longer than TABLE_QUERY_TIMEOUT_SECONDS
+            timer = threading.Timer(float(os.getenv("TABLE_QUERY_TIMEOUT_SECONDS", 10)), conn.interrupt)
+            timer.start()
+
+            try:
+                cursor = conn.execute(statement)
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchmany(MAX_RESULT_ROWS + 1)
+
+            finally:
+                timer.cancel()
+
+        lines = [" | ".join(columns)]
+        lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in rows[:MAX_RESULT_ROWS])
+
+        if len(rows) > MAX_RESULT_ROWS:
+            lines.append(f"... (more than {MAX_RESULT_ROWS} rows, refine the query)")
+
+        return "\n".join(lines)
+
+    except duckdb.InterruptException:
+        logger.error(f"AGENTS/ATTACHMENT_TABLES - run_table_query() - Query on {table_url} timed out")
+        return "Query failed: it took too long, simplify or filter the query"
+
+    except Exception as e:
+        logger.error(f"AGENTS/ATTACHMENT_TABLES - run_table_query() - Query failed: {e}")
+        return f"Query failed: {e}"
+
+
+def build_table_query_tool(table_urls):
+    """ Build the query_attachment_table tool for one question. It only accepts the
+        table URLs of the attachments retrieved from the current user's collection """
+
+    allowed_table_urls = set(table_urls)
+
+    @tool
+    def query_attachment_table(table_url: str, sql: str) -> str:
+        """
+        Run a read-only DuckDB SQL query on a spreadsheet or CSV attachment.
+        The table is available as `sheet`. Use it for totals, counts, averages,
+        filters and lookups on tabular attachments.
+
+        Args:
+            table_url: The table URL listed for the attachment (s3://...parquet)
+            sql: A single SELECT statement over the table `sheet`
+        """
+
+        # The URL comes from the LLM, whatever it asks for only the retrieved tables can be read
+        if table_url not in allowed_table_urls:
+            logger.warning(f"AGENTS/ATTACHMENT_TABLES - query_attachment_table() - Refusing a table that was not retrieved: {table_url}")
+            return "Only the tables listed for this question can be queried"
+
+        return run_table_query(table_url, sql)
+
+    return query_attachment_table
@@ -50,12 +50,16 @@ def fetch_email_from_postgres(email_id):
     
     try:
         email_fetch_query = """
-            SELECT emails.id, emails.subject, emails.body, emails.sent_datetime, emails.reply_to, senders.id, senders.name, senders.email_address, recipients.name, recipients.email_address
+            SELECT emails.id, emails.subject, emails.body, emails.sent_datetime, emails.reply_to, senders.id, sender_contacts.display_name, sender_contacts.address, recipient_contacts.display_name, recipient_contacts.address
             FROM emails
             JOIN senders
             ON emails.id = senders.email_id
+            LEFT JOIN contacts sender_contacts
+            ON senders.contact_id = sender_contacts.id
             JOIN recipients
             ON emails.id = recipients.email_id
+            LEFT JOIN contacts recipient_contacts
+            ON recipients.contact_id = recipient_contacts.id
             WHERE emails.id = %s
             LIMIT 1;
         """
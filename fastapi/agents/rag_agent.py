@@ -8,7 +8,9 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
 from agents.state import AgentState
+from agents.attachment_tables import build_table_query_tool
 
 from utils.logs import start_logger
 
@@ -122,12 +124,40 @@ class EmailRAGAgent:
                     f"ID: {metadata.get('email_id', 'N/A')}\n"
                     f"File: {metadata.get('file_name', 'N/A')}\n"
                     f"Type: {metadata.get('file_type', 'N/A')}\n"  
-                    f"Content: {doc.page_content}\n"
+                    + (f"Table URL: {metadata.get('table_url')}\n" if metadata.get("table_url") else "")
+                    + f"Content: {doc.page_content}\n"
                 )
         
         logger.info(f"AGENTS/RAG_AGENT - _format_docs() - Successfully formatted LangChain documents") 
         return "\n\n".join(formatted_docs)
     
+    def _collapse_email_chunks(self, docs: List[Document], k: int) -> List[Document]:
+        """ Merge chunks of the same email (same parent_id) into one document, keeping retrieval order """
+
+        collapsed = {}
+
+        for doc in docs:
+            metadata = doc.metadata.get("metadata", {})
+            parent_id = metadata.get("parent_id") or metadata.get("id")
+
+            if parent_id not in collapsed:
+                if len(collapsed) >= k:
+                    continue
+                collapsed[parent_id] = []
+            collapsed[parent_id].append(doc)
+
+        results = []
+        for chunks in collapsed.values():
+            # Matching chunks of one email are shown in their original order
+            chunks.sort(key=lambda doc: doc.metadata.get("metadata", {}).get("chunk_index", 0))
+            results.append(Document(
+                page_content = "\n...\n".join(doc.page_content for doc in chunks),
+                metadata     = chunks[0].metadata
+            ))
+
+        logger.info(f"AGENTS/RAG_AGENT - _collapse_email_chunks() - Collapsed {len(docs)} chunks into {len(results)} emails")
+        return results
+
     def _determine_query_type(self, question: str) -> Dict:
         """Determine the type and requirements of the query"""
         
@@ -175,14 +205,15 @@ class EmailRAGAgent:
             attachment_k = 3 if query_analysis["primary_focus"] in ["attachments", "both"] else 1
             
             # Search emails
+            # Long emails are indexed as several chunks, so fetch extra and collapse them per email
             email_retriever = self.email_vectorstore.as_retriever(
                 search_kwargs={
-                    "k": email_k,
+                    "k": email_k * 3,
                     "score_threshold": 0.65 if query_analysis["primary_focus"] == "emails" else 0.75
                 }
             )
 
-            email_results = email_retriever.invoke(question)
+            email_results = self._collapse_email_chunks(email_retriever.invoke(question), email_k)
             for email_result in email_results:
                 results.append(email_result)
 
@@ -210,8 +241,55 @@ class EmailRAGAgent:
         
         except Exception as e:
             logger.error(f"AGENTS/RAG_AGENT - _combined_retrieval - Error searching attachments: {e}")
+            attachment_results = []
+
+        context = self._format_docs(results)
+
+        # Tabular attachments are answered exactly by querying them rather than from their schema alone
+        tables = [doc.metadata.get("metadata", {}) for doc in attachment_results if doc.metadata.get("metadata", {}).get("table_url")]
+        if tables:
+            context += "\n\n" + self._query_tables(question, tables)
+
+        return context
+
+    def _query_tables(self, question: str, tables: List[Dict]) -> str:
+        """ Let the LLM run aggregate queries on the tabular attachments found for the question """
 
-        return self._format_docs(results)
+        logger.info(f"AGENTS/RAG_AGENT - _query_tables() - Querying {len(tables)} tabular attachments")
+
+        table_descriptions = "\n".join(
+            f"- {table.get('file_name')}" + (f" (sheet {table.get('sheet')})" if table.get("sheet") else "") +
+            f": {table.get('table_url')} columns: " + ", ".join(f"{column['name']} ({column['type']})" for column in table.get("columns") or [])
+            for table in tables
+        )
+
+        prompt = f"""
+            Question: {question}
+
+            The following attachments are tables you can query with the query_attachment_table tool:
+            {table_descriptions}
+
+            If the question needs numbers, totals or lookups from these tables, call the tool with a DuckDB SELECT
+            statement over the table `sheet`. Otherwise do not call the tool.
+        """
+
+        try:
+            # Only the tables retrieved for this question can be queried, whatever URL the model asks for
+            query_attachment_table = build_table_query_tool(table.get("table_url") for table in tables)
+
+            response = self.llm.bind_tools([query_attachment_table]).invoke([HumanMessage(content=prompt)])
+
+            results = []
+            for tool_call in response.tool_calls[:3]:
+                output = query_attachment_table.invoke(tool_call["args"])
+                results.append(f"Table query: {tool_call['args'].get('sql')}\nResult:\n{output}")
+
+            logger.info(f"AGENTS/RAG_AGENT - _query_tables() - Ran {len(results)} table queries")
+            return "\n\n".join(results)
+
+        except Exception as e:
+            logger.error(f"AGENTS/RAG_AGENT - _query_tables() - Error querying tables: {e}")
+            return ""
 
     def _setup_rag_chain(self):
         """Set up the RAG chain with configurable retriever"""
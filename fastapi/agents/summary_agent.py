@@ -167,14 +167,14 @@ class ThreadAnalyzer:
                             e.conversation_id,
                             json_agg(
                                 DISTINCT jsonb_build_object(
-                                    'sender_email', s.email_address,
-                                    'sender_name', s.name
+                                    'sender_email', sc.address,
+                                    'sender_name', sc.display_name
                                 )
                             ) AS senders,
                             json_agg(
                                 DISTINCT jsonb_build_object(
-                                    'recipient_email', r.email_address,
-                                    'recipient_name', r.name,
+                                    'recipient_email', rc.address,
+                                    'recipient_name', rc.display_name,
                                     'type', r.type
                                 )
                             ) AS recipients,
@@ -193,7 +193,9 @@ class ThreadAnalyzer:
                         FROM 
                             emails e
                             LEFT JOIN senders s ON e.id = s.email_id
+                            LEFT JOIN contacts sc ON s.contact_id = sc.id
                             LEFT JOIN recipients r ON e.id = r.email_id
+                            LEFT JOIN contacts rc ON r.contact_id = rc.id
                             LEFT JOIN attachments a ON e.id = a.email_id
                         WHERE 
                             e.conversation_id = %s
@@ -1,15 +1,15 @@
 import os
 import csv
-import base64
 import logging
+import pytesseract
+from PIL import Image
 from typing import Dict, Optional
 import pymupdf as fitz
 from docx import Document
 import mammoth
 from openpyxl import load_workbook
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
 from dotenv import load_dotenv
+from utils.imageSummaries import is_tiny_image, summarize_image
 
 # Load environment variables
 load_dotenv()
@@ -17,90 +17,50 @@ load_dotenv()
 # Initialize logging
 logger = logging.getLogger(__name__)
 
-def encode_image_to_base64(logger, image_path):
-    logger.info(f"Ariflow - encode_image_to_base64 - Encoding image to base64")
-    try:
-        with open(image_path, 'rb') as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-        logger.info(f"Ariflow - encode_image_to_base64 - Image encoded to base64 successfully")
-        return img_base64
-    except Exception as e:
-        logger.error(f"Ariflow - encode_image_to_base64 - Error encoding image to base64: {e}")
-        return None
- 
-def image_summarize(logger, img_base64, prompt):
-    logger.info(f"Ariflow - image_summarize - Summarizing image with GPT")
-    try:
-        chat = ChatOpenAI(
-            model       = "gpt-4o", 
-            max_tokens  = 1024,
-            api_key     = os.getenv("OPENAI_API_KEY")
-        )
+def parse_images(logger, image_path):
+    logger.info(f"Ariflow - parse_images - Generating summaries for images in {image_path}")
 
-        msg = chat.invoke(
-            [
-                HumanMessage(
-                    content=[
-                        {
-                            "type": "text", 
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                        },
-                    ]
-                )
-            ]
-        )
-        logger.info(f"Ariflow - image_summarize - Summary generated successfully")
-        return msg.content
-    
-    except Exception as e:
-        logger.error(f"Ariflow - image_summarize - Error generating summary with GPT-4o: {e}")
+    if not os.path.isfile(image_path):
         return None
 
-def parse_images(logger, image_path):
-    logger.info(f"Ariflow - parse_images - Generating summaries for images in {image_path}")
-    prompt = (
-        "You are an assistant tasked with summarizing images for retrieval via RAGs. "
-        "These summaries will be embedded and used to retrieve the raw image via RAGs. "
-        "Give a concise summary of the image that is well optimized for retrieval via RAGs."
-    )
-    
-    if os.path.isfile(image_path):
-        logger.info(f"Ariflow - parse_images - Processing image")
+    # Tiny images, the summary cache shared with the pipeline and the vision rate limit live in utils/imageSummaries.py
+    if is_tiny_image(image_path):
+        logger.info(f"Ariflow - parse_images - Skipping tiny image {image_path}")
+        return None
 
-        # Encode image to base64
-        image_base64 = encode_image_to_base64(logger, image_path)
-        if image_base64:
-            image_summary = image_summarize(logger, image_base64, prompt)
-            logger.info(f"Ariflow - parse_images - Image {image_path} summary: {image_summary}")
-        
-            if image_summary:
-                return image_summary
-            else:
-                return "Failed to summarize image"
-        else:
-            return f"Failed to encode image {image_path}"
+    try:
+        return summarize_image(image_path)
+    except Exception as e:
+        logger.error(f"Ariflow - parse_images - Error summarizing image {image_path}: {e}")
+        return None
 
 def parse_pdf_files(logger, file_path: str, page_limit: int = 5) -> str:
     """Process PDF files with page limit."""
     try:
         pdf_document = fitz.open(file_path)
-        content = ""
+        parts = []
         pages_to_process = min(page_limit, len(pdf_document))
         
         for page_num in range(pages_to_process):
             page = pdf_document[page_num]
-            content += f"\n--- Page {page_num + 1} ---\n"
-            content += page.get_text()
+            text = page.get_text()
+
+            # Scanned pages have no text layer, so read them with Tesseract
+            if not text.strip() and page.get_images():
+                try:
+                    pixmap = page.get_pixmap(dpi=200, alpha=False)
+                    text = pytesseract.image_to_string(Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples))
+                except Exception as e:
+                    logger.error(f"OCR failed on page {page_num + 1} of {file_path}: {str(e)}")
+
+            parts.append(f"\n--- Page {page_num + 1} ---\n")
+            parts.append(text)
         
         if len(pdf_document) > pages_to_process:
-            content += f"\n... ({len(pdf_document) - page_limit} remaining pages truncated) ..."
+            parts.append(f"\n... ({len(pdf_document) - page_limit} remaining pages truncated) ...")
             
         pdf_document.close()
-        return content.strip()
+        return "".join(parts).strip()
     except Exception as e:
         logger.error(f"Error parsing PDF file {file_path}: {str(e)}")
         return f"Error parsing PDF file {file_path}: {str(e)}"
@@ -108,32 +68,35 @@ def parse_pdf_files(logger, file_path: str, page_limit: int = 5) -> str:
 def parse_excel_files(logger, file_path: str) -> str:
     """Process Excel files with row limit."""
     try:
-        workbook = load_workbook(file_path, data_only=True)
-        content = ""
+        # Read-only mode streams rows instead of loading the whole workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        parts = []
         sheets_processed = 0
         rows_per_sheet = 100
         
-        for sheet_name in workbook.sheetnames:
-            if sheets_processed >= 5:  # Limit to first 5 sheets
-                content += f"\n... (remaining {len(workbook.sheetnames) - sheets_processed} sheets truncated) ..."
-                break
-                
-            sheet = workbook[sheet_name]
-            content += f"\nSheet: {sheet_name}\n"
-            
-            # Process only first 100 rows of each sheet
-            row_count = 0
-            for row in sheet.iter_rows(values_only=True):
-                if row_count >= rows_per_sheet:
-                    content += "\n... (remaining rows truncated) ...\n"
+        try:
+            for sheet in workbook.worksheets:
+                if sheets_processed >= 5:  # Limit to first 5 sheets
+                    parts.append(f"\n... (remaining {len(workbook.sheetnames) - sheets_processed} sheets truncated) ...")
                     break
                     
-                content += ", ".join([str(cell) if cell is not None else "" for cell in row]) + "\n"
-                row_count += 1
+                parts.append(f"\nSheet: {sheet.title}\n")
                 
-            sheets_processed += 1
+                # Process only first 100 rows of each sheet
+                row_count = 0
+                for row in sheet.iter_rows(values_only=True):
+                    if row_count >= rows_per_sheet:
+                        parts.append("\n... (remaining rows truncated) ...\n")
+                        break
+                        
+                    parts.append(", ".join([str(cell) if cell is not None else "" for cell in row]) + "\n")
+                    row_count += 1
+                    
+                sheets_processed += 1
+        finally:
+            workbook.close()
             
-        return content.strip()
+        return "".join(parts).strip()
     except Exception as e:
         logger.error(f"Error parsing XLSX file {file_path}: {str(e)}")
         return f"Error parsing XLSX file {file_path}: {str(e)}"
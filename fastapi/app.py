@@ -1,16 +1,28 @@
 import uvicorn
 from routes import auth, extras
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from utils.variables import load_env_vars
+from database.pool import open_pool, close_pool
+from database.connection import close_connection_pool
 from fastapi.middleware.cors import CORSMiddleware
 
 # Check if the env file is present before loading the application
 env = load_env_vars()
 
+# PostgreSQL connection pools for the lifetime of the application
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db_pool = await open_pool()
+    yield
+    await close_pool(app.state.db_pool)
+    close_connection_pool()
+
 # Initialize the app
 app = FastAPI(
-    debug = env["APP_DEBUG"],
-    title = env["APP_TITLE"]
+    debug    = env["APP_DEBUG"],
+    title    = env["APP_TITLE"],
+    lifespan = lifespan
 )
 
 # Allow CORS
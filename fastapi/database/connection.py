@@ -1,6 +1,7 @@
+import threading
 from typing import Optional
-from psycopg2 import connect
 from utils.logs import start_logger
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2._psycopg import connection
 from utils.variables import load_env_vars
 
@@ -10,47 +11,85 @@ env = load_env_vars()
 # Logging
 logger = start_logger()
 
+# Sync code paths (auth flow, agents, image summaries) borrow their connections
+# from this pool instead of opening one per query. The async routes use the
+# pool in database/pool.py. Both pools are per process.
+_pool = None
+_pool_lock = threading.Lock()
+
+# ThreadedConnectionPool raises when it is exhausted, the semaphore makes callers wait instead
+_pool_slots = threading.BoundedSemaphore(int(env.get("DATABASE_POOL_MAX_SIZE") or 10))
+
+def get_connection_pool() -> ThreadedConnectionPool:
+    ''' Return the process wide pool of sync connections, creating it on first use '''
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            logger.info("DATABASE/CONNECTION - get_connection_pool() - Opening the PostgreSQL connection pool")
+
+            # psycopg2 closes returned connections beyond minconn, so both bounds are
+            # the same and every connection is reused
+            max_size = int(env.get("DATABASE_POOL_MAX_SIZE") or 10)
+            _pool = ThreadedConnectionPool(
+                minconn  = max_size,
+                maxconn  = max_size,
+                dbname   = env["DATABASE_NAME"],
+                user     = env["DATABASE_USER"],
+                password = env["DATABASE_PASSWORD"],
+                host     = env["DATABASE_HOST"],
+                port     = env["DATABASE_PORT"]
+            )
+
+    return _pool
+
 def open_connection() -> Optional[connection]:
-    ''' Open a connection with PostgreSQL database and return the connection object on successful connection '''
+    ''' Borrow a connection with PostgreSQL database from the pool and return the connection object on success '''
 
-    logger.info("DATABASE/CONNECTION - open_connection() - Opening a connection to PostgreSQL database")
-    
-    host = env["DATABASE_HOST"]
-    port = env["DATABASE_PORT"]
-    user = env["DATABASE_USER"]
-    password = env["DATABASE_PASSWORD"]
-    dbname = env["DATABASE_NAME"]
+    logger.info("DATABASE/CONNECTION - open_connection() - Borrowing a connection to PostgreSQL database")
+
+    if not _pool_slots.acquire(timeout=float(env.get("DATABASE_POOL_TIMEOUT_SECONDS") or 10)):
+        logger.error("DATABASE/CONNECTION - open_connection() - Timed out waiting for a free connection in the pool")
+        return None
 
     try:
-        # Open connection
-        conn = connect(
-            dbname   = dbname,
-            user     = user,
-            password = password,
-            host     = host,
-            port     = port
-        )
-        
+        conn = get_connection_pool().getconn()
+
         logger.info("DATABASE/CONNECTION - open_connection() - Connection established with PostgreSQL database")
-        return conn 
-    
+        return conn
+
     except Exception as exception:
+        _pool_slots.release()
+
         logger.error("DATABASE/CONNECTION - open_connection() - Failed to open a connection to PostgreSQL database (See exception below)")
         logger.error(f"DATABASE/CONNECTION - open_connection() - {exception}")
 
         return None
-    
+
 def close_connection(conn):
-    ''' Close an open connection with PostgreSQL database '''
+    ''' Hand a borrowed connection back to the pool. Open transactions are rolled back and broken connections discarded '''
 
     try:
         if conn:
-            conn.close()
-            logger.info("DATABASE/CONNECTION - close_connection() - Connection closed with PostgreSQL database")
-        
+            get_connection_pool().putconn(conn, close=bool(conn.closed))
+            _pool_slots.release()
+            logger.info("DATABASE/CONNECTION - close_connection() - Connection returned to the pool")
+
         else:
             logger.warning("DATABASE/CONNECTION - close_connection() - The connection object provided is not associated with any existing open connection with PostgreSQL database. Nothing to close.")
-    
+
     except Exception as exception:
         logger.info("DATABASE/CONNECTION - close_connection() - Exception occurred while attempting to close the connection with PostgreSQL database (See exception below)")
         logger.error(f"DATABASE/CONNECTION - close_connection() - {exception}")
+
+def close_connection_pool():
+    ''' Close every connection in the sync pool, used on application shutdown '''
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            logger.info("DATABASE/CONNECTION - close_connection_pool() - Closing the PostgreSQL connection pool")
+            _pool.closeall()
+            _pool = None
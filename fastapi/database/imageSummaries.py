@@ -0,0 +1,62 @@
+from utils.logs import start_logger
+from database.connection import open_connection, close_connection
+
+# Logging
+logger = start_logger()
+
+def fetch_image_summary(content_hash: str):
+    ''' Fetch a cached vision summary by the sha256 of the image bytes.
+        The IMAGE_SUMMARIES table is filled by the Airflow pipeline as well '''
+
+    logger.info(f"DATABASE/IMAGESUMMARIES - fetch_image_summary() - Looking up summary for image {content_hash}")
+
+    # Start a connection
+    conn = open_connection()
+
+    # Cached summary
+    summary = None
+
+    if conn:
+        try:
+
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT summary FROM image_summaries WHERE content_hash = %s", (content_hash,))
+                row = cursor.fetchone()
+                summary = row[0] if row else None
+
+        except Exception as exception:
+            logger.error(f"DATABASE/IMAGESUMMARIES - fetch_image_summary() - Failed to fetch summary for image {content_hash} (See exception below)")
+            logger.error(f"DATABASE/IMAGESUMMARIES - fetch_image_summary() - {exception}")
+
+        finally:
+            close_connection(conn=conn)
+
+    return summary
+
+def insert_image_summary(content_hash: str, summary: str):
+    ''' Cache the vision summary of an image for later requests and pipeline runs '''
+
+    logger.info(f"DATABASE/IMAGESUMMARIES - insert_image_summary() - Caching summary for image {content_hash}")
+
+    # Start a connection
+    conn = open_connection()
+
+    if conn:
+        try:
+
+            with conn.cursor() as cursor:
+                query = """
+                    INSERT INTO image_summaries (content_hash, summary)
+                    VALUES (%s, %s)
+                    ON CONFLICT (content_hash) DO NOTHING
+                """
+                cursor.execute(query, (content_hash, summary))
+                conn.commit()
+
+        except Exception as exception:
+            logger.error(f"DATABASE/IMAGESUMMARIES - insert_image_summary() - Failed to cache summary for image {content_hash} (See exception below)")
+            logger.error(f"DATABASE/IMAGESUMMARIES - insert_image_summary() - {exception}")
+            conn.rollback()
+
+        finally:
+            close_connection(conn=conn)
@@ -1,10 +1,12 @@
 import jwt
 import json
+import asyncio
 import requests
 from fastapi import status
 from datetime import datetime
 from utils.logs import start_logger
 from requests.auth import HTTPBasicAuth
+from psycopg.rows import dict_row
 from utils.variables import load_env_vars
 from database.connection import open_connection, close_connection
 
@@ -220,7 +222,8 @@ def trigger_airflow(job_id: int):
                 url     = airflow_endpoint, 
                 data    = json.dumps(payload, default=serialize_datetime), 
                 auth    = auth,
-                headers = headers
+                headers = headers,
+                timeout = int(env.get('AIRFLOW_TIMEOUT', 30))
             )
             
             if response.status_code == status.HTTP_200_OK:
@@ -238,79 +241,175 @@ def trigger_airflow(job_id: int):
     
     return dispatch_status
 
-def dequeue_job():
-    ''' Fetch the topmost job marked as 'pending' '''
 
-    logger.info(f"DATABASE/JOBS - dequeue_job() - Fetching first job_id marked as {env['DEFAULT_JOB_STATUS']}")
+# Async variants of the queries above for the FastAPI routes. They run on a
+# connection lent by the pool (database/pool.py), which is in autocommit mode,
+# so there is no commit or rollback. The sync functions that remain serve the auth flow.
 
-    # Start a connection
-    conn = open_connection()
+async def fetch_user_via_job_async(conn, job_id: int):
+    ''' Fetches user data based on job_id on a pooled connection '''
+
+    logger.info(f"DATABASE/JOBS - fetch_user_via_job_async() - Fetching user data for job_id {job_id} from queued jobs")
 
     # Fetched job result
     result = None
 
     if conn:
         try:
-            
-            with conn.cursor() as cursor:
-                logger.info(f"DATABASE/JOBS - fetch_job() - Preparing SQL query to fetch first job...")
 
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                query = """
+                    SELECT * FROM users WHERE email IN (
+                        SELECT email FROM queued_jobs
+                        WHERE id = %s AND status = %s LIMIT 1
+                    );
+                """
+                await cursor.execute(query, (job_id, env['DEFAULT_JOB_STATUS']))
+                auth_dict = await cursor.fetchone()
+
+                if auth_dict:
+                    # Decode the id_token
+                    auth_dict['id_token_claims'] = jwt.decode(
+                        jwt     = auth_dict["id_token"],
+                        options = {"verify_signature": False}
+                    )
+
+                    result = auth_dict
+
+                    logger.info(f"DATABASE/JOBS - fetch_user_via_job_async() - Fetched user data via job_id")
+
+        except Exception as exception:
+            logger.error(f"DATABASE/JOBS - fetch_user_via_job_async() - Failed to fetch user data via job_id (See exception below)")
+            logger.error(f"DATABASE/JOBS - fetch_user_via_job_async() - {exception}")
+
+    return result
+
+async def update_job_async(conn, job_id: int, status:str):
+    ''' Update job status based on job_id on a pooled connection '''
+
+    logger.info(f"DATABASE/JOBS - update_job_async() - Updating status for job_id {job_id} to {status}")
+
+    if conn:
+        try:
+
+            async with conn.cursor() as cursor:
+                query = """
+                    UPDATE queued_jobs
+                    SET status = %s
+                    WHERE id = %s;
+                """
+                await cursor.execute(query, (status, job_id))
+
+                if cursor.rowcount > 0:
+                    logger.info(f"DATABASE/JOBS - update_job_async() - Successfully updated status for job_id {job_id}")
+
+                else:
+                    logger.error(f"DATABASE/JOBS - update_job_async() - job_id {job_id} not found or status is already '{status}'")
+
+        except Exception as exception:
+            logger.error(f"DATABASE/JOBS - update_job_async() - Failed to update the status for job_id {job_id} (See exception below)")
+            logger.error(f"DATABASE/JOBS - update_job_async() - {exception}")
+
+async def trigger_airflow_async(conn, job_id: int):
+    ''' Send user token to Airflow via API and trigger the DAG, without blocking the event loop '''
+
+    logger.info(f"DATABASE/JOBS - trigger_airflow_async() - Triggering Airflow for job_id {job_id} from queued jobs")
+    data_dict = await fetch_user_via_job_async(conn, job_id=job_id)
+    dispatch_status = False
+
+    if data_dict:
+        payload = {
+            "conf": data_dict
+        }
+
+        airflow_endpoint = "http://" + env['AIRFLOW_HOST'] + ':' +env['AIRFLOW_PORT'] + f"/api/v1/dags/{env['AIRFLOW_DAG_ID']}/dagRuns"
+        auth = HTTPBasicAuth(username=env['AIRFLOW_USER'], password=env['AIRFLOW_PASSWORD'])
+
+        try:
+            logger.info(f"DATABASE/JOBS - trigger_airflow_async() - Sending user data to {airflow_endpoint}")
+
+            # Convert datetime objects to ISO format timestamp strings (Closure)
+            def serialize_datetime(obj):
+                if isinstance(obj, datetime):
+                    return obj.isoformat()
+
+                raise TypeError("Type not serializable")
+
+            headers = {"Content-Type": "application/json"}
+
+            # requests is blocking, run it in a worker thread
+            response = await asyncio.to_thread(
+                requests.post,
+                url     = airflow_endpoint,
+                data    = json.dumps(payload, default=serialize_datetime),
+                auth    = auth,
+                headers = headers,
+                timeout = int(env.get('AIRFLOW_TIMEOUT', 30))
+            )
+
+            if response.status_code == status.HTTP_200_OK:
+                logger.info(f"DATABASE/JOBS - trigger_airflow_async() - Successfully sent data to Airflow")
+                await update_job_async(conn, job_id=job_id, status=env['JOB_SUCCESSFUL'])
+                dispatch_status = True
+
+            else:
+                logger.info(f"DATABASE/JOBS - trigger_airflow_async() - Failed to send data to Airflow (See error below)")
+                logger.info(f"DATABASE/JOBS - trigger_airflow_async() - {response.text}")
+
+        except Exception as exception:
+            logger.error(f"DATABASE/JOBS - trigger_airflow_async() - Exception occurred while attempting to send user data to Airflow")
+            logger.error(f"DATABASE/JOBS - trigger_airflow_async() - {exception}")
+
+    return dispatch_status
+
+async def dequeue_job_async(conn):
+    ''' Fetch the topmost job marked as 'pending' on a pooled connection '''
+
+    logger.info(f"DATABASE/JOBS - dequeue_job_async() - Fetching first job_id marked as {env['DEFAULT_JOB_STATUS']}")
+
+    # Fetched job result
+    result = None
+
+    if conn:
+        try:
+
+            async with conn.cursor() as cursor:
                 query = """
                     SELECT id FROM queued_jobs
                     WHERE status = %s ORDER BY id ASC LIMIT 1
                 """
-                logger.info(f"DATABASE/JOBS - fetch_job() - Fetching first job...")
-                
-                cursor.execute(query, (env['DEFAULT_JOB_STATUS'],))
-                result = cursor.fetchone()
+                await cursor.execute(query, (env['DEFAULT_JOB_STATUS'],))
+                row = await cursor.fetchone()
 
-                if result:
-                    result = result[0]
-                
-                else:
-                    logger.warning(f"DATABASE/JOBS - dequeue_job() - No pending jobs found")
-                    result = None
+                if row:
+                    result = row[0]
 
+                else:
+                    logger.warning(f"DATABASE/JOBS - dequeue_job_async() - No pending jobs found")
 
         except Exception as exception:
-            logger.error(f"DATABASE/JOBS - delete_job() - Failed to fetch first job_id from the queue (See exception below)")
-            logger.error(f"DATABASE/JOBS - delete_job() - {exception}")
-        
-        finally:
-            close_connection(conn=conn)
+            logger.error(f"DATABASE/JOBS - dequeue_job_async() - Failed to fetch first job_id from the queue (See exception below)")
+            logger.error(f"DATABASE/JOBS - dequeue_job_async() - {exception}")
 
     return result
 
-def delete_failed_jobs():
-    """ Delete jobs from the queued_jobs table where status = 'failed' """
-    
-    logger.info(f"DATABASE/JOBS - delete_failed_jobs() - Deleting jobs with status 'failed'")
+async def delete_failed_jobs_async(conn):
+    """ Delete jobs from the queued_jobs table where status = 'failed' on a pooled connection """
 
-    # Start a connection
-    conn = open_connection()
+    logger.info(f"DATABASE/JOBS - delete_failed_jobs_async() - Deleting jobs with status 'failed'")
 
     if conn:
         try:
-            
-            with conn.cursor() as cursor:
-                logger.info(f"DATABASE/JOBS - delete_failed_jobs() - Preparing SQL query to delete failed jobs...")
 
+            async with conn.cursor() as cursor:
                 query = """
                     DELETE FROM queued_jobs
                     WHERE status = %s
                 """
-                logger.info(f"DATABASE/JOBS - delete_failed_jobs() - Deleting failed jobs...")
-                
-                cursor.execute(query, (env['JOB_FAILED'],))
-                conn.commit()
+                await cursor.execute(query, (env['JOB_FAILED'],))
 
-                # Log how many rows were deleted
-                rows_deleted = cursor.rowcount
-                logger.info(f"DATABASE/JOBS - delete_failed_jobs() - {rows_deleted} job(s) deleted with status 'failed'")
+                logger.info(f"DATABASE/JOBS - delete_failed_jobs_async() - {cursor.rowcount} job(s) deleted with status 'failed'")
 
         except Exception as exception:
-            logger.error(f"DATABASE/JOBS - delete_failed_jobs() - Failed to delete failed jobs (See exception below)")
-            logger.error(f"DATABASE/JOBS - delete_failed_jobs() - {exception}")
-        
-        finally:
-            close_connection(conn=conn)
+            logger.error(f"DATABASE/JOBS - delete_failed_jobs_async() - Failed to delete failed jobs (See exception below)")
+            logger.error(f"DATABASE/JOBS - delete_failed_jobs_async() - {exception}")
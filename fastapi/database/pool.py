@@ -0,0 +1,69 @@
+from fastapi import Request
+from utils.logs import start_logger
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from utils.variables import load_env_vars
+
+# Load env
+env = load_env_vars()
+
+# Logging
+logger = start_logger()
+
+async def open_pool() -> AsyncConnectionPool:
+    ''' Open the application wide pool of async connections with PostgreSQL database '''
+
+    logger.info("DATABASE/POOL - open_pool() - Opening the PostgreSQL connection pool")
+
+    conninfo = make_conninfo(
+        dbname   = env["DATABASE_NAME"],
+        user     = env["DATABASE_USER"],
+        password = env["DATABASE_PASSWORD"],
+        host     = env["DATABASE_HOST"],
+        port     = env["DATABASE_PORT"]
+    )
+
+    # Autocommit, so a connection handed back after a read is not left inside a transaction
+    pool = AsyncConnectionPool(
+        conninfo = conninfo,
+        min_size = int(env.get("DATABASE_POOL_MIN_SIZE") or 2),
+        max_size = int(env.get("DATABASE_POOL_MAX_SIZE") or 10),
+        timeout  = float(env.get("DATABASE_POOL_TIMEOUT_SECONDS") or 10),
+        kwargs   = {"autocommit": True},
+        open     = False
+    )
+
+    # Connections are created in the background, the app starts even if PostgreSQL is down
+    await pool.open(wait=False)
+
+    logger.info("DATABASE/POOL - open_pool() - PostgreSQL connection pool opened")
+    return pool
+
+async def close_pool(pool: AsyncConnectionPool):
+    ''' Close the pool and every connection in it '''
+
+    logger.info("DATABASE/POOL - close_pool() - Closing the PostgreSQL connection pool")
+
+    await pool.close()
+
+async def get_db_connection(request: Request):
+    ''' Dependency that lends a pooled connection to a request and takes it back afterwards.
+        Yields None when no connection could be obtained, like open_connection() does '''
+
+    pool = request.app.state.db_pool
+
+    try:
+        conn = await pool.getconn()
+
+    except Exception as exception:
+        logger.error("DATABASE/POOL - get_db_connection() - Failed to get a connection from the pool (See exception below)")
+        logger.error(f"DATABASE/POOL - get_db_connection() - {exception}")
+
+        yield None
+        return
+
+    try:
+        yield conn
+
+    finally:
+        await pool.putconn(conn)
@@ -1,13 +1,15 @@
+import asyncio
 from utils.logs import start_logger
-from fastapi import APIRouter, status, Request
+from fastapi import APIRouter, status, Request, Query, Depends
 from utils.variables import load_env_vars
 from fastapi.responses import JSONResponse
 from auth.authenticate import refresh_access_tokens, is_token_valid
-from database.jobs import dequeue_job, trigger_airflow, delete_failed_jobs, fetch_user_via_job
-from utils.services import fetch_emails, load_email, get_email_category, send_mail_response
+from database.pool import get_db_connection
+from database.jobs import dequeue_job_async, trigger_airflow_async, delete_failed_jobs_async, fetch_user_via_job_async
+from utils.services import fetch_emails, search_emails, get_folder_counts, load_email, get_email_category, send_mail_response
 from agents.controller import process_input
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, Optional
 
 # Validation classes
 class EmailContext(BaseModel):
@@ -57,23 +59,24 @@ def healthcheck():
     description = f"Dispatch Jobs that are marked as {env['DEFAULT_JOB_STATUS']}",
     tags        = ["Jobs"]
 )
-def dispatch_pending_jobs():
+async def dispatch_pending_jobs(conn = Depends(get_db_connection)):
     ''' Manually trigger Airflow  '''
 
-    logger.info("ROUTES/EXTRAS - healthcheck() - GET /health request received")
+    logger.info(f"ROUTES/EXTRAS - dispatch_pending_jobs() - GET {env['DISPATCH_ENDPOINT']} request received")
 
     job_id = None
+    is_valid = False
     dispatch_status = None
 
     # First, clear all jobs marked as failed (Optional)
-    delete_failed_jobs()
+    await delete_failed_jobs_async(conn)
 
     # Pull a pending job from the queued jobs
-    job_id = dequeue_job()
+    job_id = await dequeue_job_async(conn)
 
     if job_id:
         # Fetch user's data based on job_id
-        auth_dict = fetch_user_via_job(job_id=int(job_id))
+        auth_dict = await fetch_user_via_job_async(conn, job_id=int(job_id))
 
         if auth_dict:
             # Validate if tokens have expired or not
@@ -81,15 +84,15 @@ def dispatch_pending_jobs():
         
         if is_valid:
             # Trigger Airflow 
-            dispatch_status = trigger_airflow(job_id=int(job_id))
+            dispatch_status = await trigger_airflow_async(conn, job_id=int(job_id))
         
-        else:
+        elif auth_dict:
             # Access token has expired
-            # Attempt to regenerate the access tokens
-            refresh_auth_dict = refresh_access_tokens(refresh_token=str(auth_dict["refresh_token"]))
+            # Attempt to regenerate the access tokens (blocking MSAL call and sync database write, off the event loop)
+            refresh_auth_dict = await asyncio.to_thread(refresh_access_tokens, refresh_token=str(auth_dict["refresh_token"]))
 
             if refresh_auth_dict:
-                dispatch_status = trigger_airflow(job_id=int(job_id))
+                dispatch_status = await trigger_airflow_async(conn, job_id=int(job_id))
 
 
     if job_id and dispatch_status:
@@ -117,14 +120,111 @@ def dispatch_pending_jobs():
 @router.get(
     path        = env["FETCH_MAILS_ENDPOINT"] + "/{folder_name}",
     name        = "Fetch Emails",
-    description = "Endpoint to fetch emails with sender email, body preview, and subject",
+    description = "Endpoint to fetch a page of emails with sender email, body preview, and subject, newest first. Pass next_cursor as before= for older mail and previous_cursor as after= for newer mail",
     tags        = ["Emails"]
 )
-def fetch_emails_endpoint(folder_name: str):
+async def fetch_emails_endpoint(
+    folder_name : str,
+    user_email  : Optional[str] = None,
+    limit       : int = Query(default=10, ge=1, le=100),
+    before      : Optional[str] = None,
+    after       : Optional[str] = None,
+    conn                        = Depends(get_db_connection)
+):
 
     logger.info(f"ROUTES/EXTRAS - fetch_emails_endpoint() - GET /fetch_emails/{folder_name} Request to fetch email data received")
 
-    response = fetch_emails(folder_name)  
+    if before and after:
+        return JSONResponse(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            content     = {
+                "status"  : status.HTTP_400_BAD_REQUEST,
+                "message" : "Only one of before and after can be given"
+            }
+        )
+
+    response = await fetch_emails(conn, folder_name, user_email, limit=limit, before=before, after=after)
+
+    return JSONResponse(
+        status_code = response["status"],
+        content     = response
+    )
+
+
+# Router to fetch the mailbox view of a folder
+@router.get(
+    path        = env["MAILBOX_VIEW_ENDPOINT"] + "/{folder_name}",
+    name        = "Mailbox View",
+    description = "Endpoint to fetch a page of emails together with their categories and attachment metadata, paginated like Fetch Emails",
+    tags        = ["Emails"]
+)
+async def mailbox_view_endpoint(
+    folder_name : str,
+    user_email  : Optional[str] = None,
+    limit       : int = Query(default=10, ge=1, le=100),
+    before      : Optional[str] = None,
+    after       : Optional[str] = None,
+    conn                        = Depends(get_db_connection)
+):
+
+    logger.info(f"ROUTES/EXTRAS - mailbox_view_endpoint() - GET {env['MAILBOX_VIEW_ENDPOINT']}/{folder_name} Request to fetch the mailbox view received")
+
+    if before and after:
+        return JSONResponse(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            content     = {
+                "status"  : status.HTTP_400_BAD_REQUEST,
+                "message" : "Only one of before and after can be given"
+            }
+        )
+
+    response = await fetch_emails(conn, folder_name, user_email, limit=limit, before=before, after=after, with_details=True)
+
+    return JSONResponse(
+        status_code = response["status"],
+        content     = response
+    )
+
+
+# Router to search emails
+@router.get(
+    path        = env["SEARCH_MAILS_ENDPOINT"],
+    name        = "Search Emails",
+    description = "Endpoint to full-text search the mailbox by subject, sender, body and attachment text, ranked and paginated",
+    tags        = ["Emails"]
+)
+async def search_emails_endpoint(
+    q           : str,
+    user_email  : Optional[str] = None,
+    folder_name : Optional[str] = None,
+    category    : Optional[str] = None,
+    limit       : int = Query(default=20, ge=1, le=100),
+    cursor      : Optional[str] = None,
+    conn                        = Depends(get_db_connection)
+):
+
+    logger.info(f"ROUTES/EXTRAS - search_emails_endpoint() - GET {env['SEARCH_MAILS_ENDPOINT']} Request to search emails received")
+
+    response = await search_emails(conn, q, user_email=user_email, folder_name=folder_name, category=category, limit=limit, cursor=cursor)
+
+    return JSONResponse(
+        status_code = response["status"],
+        content     = response
+    )
+
+
+# Router to fetch the counts of every folder
+@router.get(
+    path        = env["FOLDER_COUNTS_ENDPOINT"],
+    name        = "Folder Counts",
+    description = "Endpoint to fetch the total and unread email counts of every folder",
+    tags        = ["Emails"]
+)
+async def folder_counts_endpoint(user_email: Optional[str] = None, conn = Depends(get_db_connection)):
+
+    logger.info(f"ROUTES/EXTRAS - folder_counts_endpoint() - GET {env['FOLDER_COUNTS_ENDPOINT']} Request to fetch folder counts received")
+
+    response = await get_folder_counts(conn, user_email)
 
     return JSONResponse(
         status_code = response["status"],
@@ -139,11 +239,11 @@ def fetch_emails_endpoint(folder_name: str):
     description = "Endpoint to load email details by email ID",
     tags        = ["Emails"]
 )
-def load_email_endpoint(email_id: str):
+async def load_email_endpoint(email_id: str, conn = Depends(get_db_connection)):
 
     logger.info(f"ROUTES/EXTRAS - load_email_endpoint() - GET /load_email/{email_id} Request to load email details")
 
-    response = load_email(email_id)
+    response = await load_email(conn, email_id)
 
     # Return the dictionary as a JSONResponse
     return JSONResponse(
@@ -159,11 +259,11 @@ def load_email_endpoint(email_id: str):
     description = "Endpoint to get category by email ID",
     tags        = ["Emails"]
 )
-def get_category_endpoint(email_id: str):
+async def get_category_endpoint(email_id: str, conn = Depends(get_db_connection)):
 
     logger.info(f"ROUTES/EXTRAS - get_category_endpoint() - GET /get_category/{email_id} Request to get email category")
 
-    response = get_email_category(email_id)
+    response = await get_email_category(conn, email_id)
 
     # Return the dictionary as a JSONResponse
     return JSONResponse(
@@ -229,11 +329,11 @@ async def chatbot_handler(user_data: RequestData):
     description = "Endpoint to send a post request to send email response",
     tags        = ["Emails"]
 )
-def send_email_endpoint(request: EmailRequest):
+async def send_email_endpoint(request: EmailRequest, conn = Depends(get_db_connection)):
 
     logger.info(f"ROUTES/EXTRAS - send_email_endpoint() - POST /send_email/ Request send an email")
 
-    response = send_mail_response(request.user_email, request.response_output)
+    response = await send_mail_response(conn, request.user_email, request.response_output)
 
     # Return the dictionary as a JSONResponse
     return JSONResponse(
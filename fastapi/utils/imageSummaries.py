@@ -0,0 +1,133 @@
+import os
+import time
+import base64
+import hashlib
+import threading
+from PIL import Image
+from utils.logs import start_logger
+from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage
+from database.imageSummaries import fetch_image_summary, insert_image_summary
+
+# Logging
+logger = start_logger()
+
+# Image summaries of the FastAPI service. The Airflow pipeline has the same
+# module (airflow/dags/services/imageSummaries.py) and both share the
+# IMAGE_SUMMARIES cache, so compute_image_hash and IMAGE_SUMMARY_PROMPT must be
+# changed in both places together. The cache is keyed by the exact bytes of the
+# image, never by what it looks like. Everything else image related in the
+# service goes through summarize_image().
+
+IMAGE_SUMMARY_PROMPT = (
+    "You are an assistant tasked with summarizing images for retrieval via RAGs. "
+    "These summaries will be embedded and used to retrieve the raw image via RAGs. "
+    "Give a concise summary of the image that is well optimized for retrieval via RAGs."
+)
+
+# One client is shared by every vision call made from this process
+_vision_client = None
+_vision_client_lock = threading.Lock()
+
+# Start time of the most recent vision call, used to space out requests
+_last_request_time = 0.0
+_rate_limit_lock = threading.Lock()
+
+def get_vision_client():
+    ''' Return the shared GPT-4o client, creating it on first use '''
+
+    global _vision_client
+
+    with _vision_client_lock:
+        if _vision_client is None:
+            _vision_client = ChatOpenAI(
+                model       = "gpt-4o",
+                max_tokens  = 1024,
+                api_key     = os.getenv("OPENAI_API_KEY")
+            )
+
+    return _vision_client
+
+def wait_for_rate_limit():
+    ''' Block until the next vision call fits in IMAGE_SUMMARY_RPM '''
+
+    global _last_request_time
+
+    min_interval = 60.0 / int(os.getenv("IMAGE_SUMMARY_RPM", 60))
+
+    with _rate_limit_lock:
+        wait_time = _last_request_time + min_interval - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        _last_request_time = time.monotonic()
+
+def is_tiny_image(image_path: str) -> bool:
+    ''' Tracking pixels, spacers and icons are not worth a vision call '''
+
+    min_bytes = int(os.getenv("IMAGE_MIN_BYTES", 2048))
+    min_dimension = int(os.getenv("IMAGE_MIN_DIMENSION", 32))
+
+    if os.path.getsize(image_path) < min_bytes:
+        return True
+
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+        return width < min_dimension or height < min_dimension
+
+    except Exception as exception:
+        logger.error(f"UTILS/IMAGESUMMARIES - is_tiny_image() - Error reading image {image_path}: {exception}")
+        return False
+
+def compute_image_hash(image_path: str, chunk_size: int = 1024 * 1024) -> str:
+    ''' sha256 of the image bytes, the key of the IMAGE_SUMMARIES cache '''
+
+    # Perceptual hashes collide for look-alike images (scanned forms, screenshots,
+    # near-blank pages), which would serve one mailbox's summary to another
+    digest = hashlib.sha256()
+
+    with open(image_path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def summarize_image(image_path: str) -> str:
+    ''' Summarize one image, going through the summary cache first. Raises when no summary could be made '''
+
+    image_hash = compute_image_hash(image_path)
+
+    cached_summary = fetch_image_summary(image_hash)
+    if cached_summary:
+        logger.info(f"UTILS/IMAGESUMMARIES - summarize_image() - Reusing cached summary for {image_path}")
+        return cached_summary
+
+    with open(image_path, "rb") as image_file:
+        image_base64 = base64.b64encode(image_file.read()).decode("utf-8")
+
+    wait_for_rate_limit()
+
+    message = get_vision_client().invoke(
+        [
+            HumanMessage(
+                content=[
+                    {
+                        "type": "text",
+                        "text": IMAGE_SUMMARY_PROMPT
+                    },
+                    {
+                        "type"      : "image_url",
+                        "image_url" : {"url": f"data:image/jpeg;base64,{image_base64}"},
+                    },
+                ]
+            )
+        ]
+    )
+
+    if not message.content:
+        raise RuntimeError(f"Failed to summarize image {image_path}")
+
+    insert_image_summary(image_hash, message.content)
+    logger.info(f"UTILS/IMAGESUMMARIES - summarize_image() - Image {image_path} summary: {message.content}")
+
+    return message.content
@@ -1,12 +1,15 @@
 from fastapi import status
 from datetime import datetime
-from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
 
 from utils.logs import start_logger
 from utils.variables import load_env_vars
-from database.connection import open_connection, close_connection
 
+import asyncio
 import requests
+import base64
+import json
+import time
 import os
 
 env = load_env_vars()
@@ -14,13 +17,37 @@ env = load_env_vars()
 # Initialize Logger
 logger = start_logger()
 
+# Folder counts per user_email (None for all mailboxes) as (expires_at, counts). Every worker
+# process has its own copy, so entries only ever expire by FOLDER_COUNTS_TTL_SECONDS
+FOLDER_COUNTS_CACHE = {}
+
+# Function to encode the sort key of a row as an opaque page cursor
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+# Function to decode a page cursor back into the sort key values
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
 # Function to fetch emails from email folder
-def fetch_emails(folder_name):
-    ''' Fetches email data from the PostgreSQL database and returns a dictionary '''
+async def fetch_emails(conn, folder_name, user_email=None, limit=10, before=None, after=None, with_details=False):
+    ''' Fetches one page of email data from the PostgreSQL database and returns a dictionary.
+        with_details adds the categories and attachment metadata of every email to the same query '''
     
     logger.info(f"UTILS/EMAILS - services/fetch_emails() - Fetching emails from folder {folder_name}")
+
+    # Pages are keyed on (received_datetime, id): before= pages towards older mail, after= towards newer mail
+    try:
+        cursor_datetime, cursor_id = decode_cursor(before or after) if (before or after) else (None, None)
+
+    except Exception as e:
+        logger.error(f"UTILS/EMAILS - services/fetch_emails() - Invalid cursor: {str(e)}")
+
+        return {
+            "status"  : status.HTTP_400_BAD_REQUEST,
+            "message" : "Invalid page cursor"
+        }
     
-    conn = open_connection()
     response = None
 
     if conn is None:
@@ -32,50 +59,78 @@ def fetch_emails(folder_name):
         }
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        async with conn.cursor(row_factory=dict_row) as cursor:
             
-            query = """
+            # MAILBOX_VIEW is kept by the Airflow pipeline with one row per email per
+            # mailbox, so a page is a single index scan with no joins
+            owner_filter = "AND v.user_email = %(user_email)s" if user_email else ""
+
+            # Newer pages are read upwards from the cursor and flipped afterwards,
+            # so both directions walk idx_mailbox_view_user_folder_page
+            if after:
+                page_filter = "AND (v.received_datetime, v.email_id) > (%(cursor_datetime)s, %(cursor_id)s)"
+                page_order = "v.received_datetime ASC, v.email_id ASC"
+            elif before:
+                page_filter = "AND (v.received_datetime, v.email_id) < (%(cursor_datetime)s, %(cursor_id)s)"
+                page_order = "v.received_datetime DESC, v.email_id DESC"
+            else:
+                page_filter = ""
+                page_order = "v.received_datetime DESC, v.email_id DESC"
+
+            # Categories and attachment metadata are precomputed in the row
+            details_columns = """,
+                    v.categories,
+                    v.attachments""" if with_details else ""
+
+            query = f"""
                 SELECT 
-                    s.email_address AS sender_email,
-                    s.name AS sender_name,
-                    r.email_address AS recipient_email,
-                    r.email_id AS email_id,
-                    e.body_preview,
-                    e.subject,
-                    e.sent_datetime,
-                    e.received_datetime,
-                    e.is_read
+                    v.sender_email,
+                    v.sender_name,
+                    v.user_email AS recipient_email,
+                    v.email_id,
+                    v.body_preview,
+                    v.subject,
+                    v.sent_datetime,
+                    v.received_datetime,
+                    v.is_read,
+                    v.has_attachments{details_columns}
                 FROM 
-                    recipients r
-                INNER JOIN 
-                    emails e ON r.email_id = e.id
-                INNER JOIN 
-                    senders s ON e.id = s.email_id
-                INNER JOIN
-                    email_folders f ON e.parent_folder_id = f.id
+                    mailbox_view v
                 WHERE 
-                    r.email_address IN (
-                        SELECT 
-                            email 
-                        FROM 
-                            users
-                    )
-                    AND f.display_name = %(folder_name)s
+                    v.folder_name = %(folder_name)s
+                    {owner_filter}
+                    {page_filter}
                 ORDER BY 
-                    e.received_datetime DESC
-                LIMIT 10;
+                    {page_order}
+                LIMIT %(limit)s;
             """
             logger.info("UTILS/EMAILS - services/fetch_emails() - Executing SQL query")
-            cursor.execute(query, {'folder_name': folder_name})
-            records = cursor.fetchall()
+            await cursor.execute(query, {
+                "folder_name"     : folder_name,
+                "user_email"      : user_email,
+                "cursor_datetime" : cursor_datetime,
+                "cursor_id"       : cursor_id,
+                "limit"           : limit + 1
+            })
+            records = await cursor.fetchall()
 
-            if not records:
-                logger.info("UTILS/EMAILS - services/fetch_emails() - No records found")
-                
-                response = {
-                    "status"  : status.HTTP_404_NOT_FOUND,
-                    "message" : "No email data found matching the query."
-                }
+            # One extra row tells whether there is another page in the direction read
+            has_more = len(records) > limit
+            records = records[:limit]
+
+            if after:
+                records.reverse()
+
+            # Newest first on every page; a cursor is handed out only when that side has more rows
+            next_cursor = None
+            previous_cursor = None
+
+            if records:
+                if has_more or after:
+                    next_cursor = encode_cursor(records[-1]["received_datetime"].isoformat(), records[-1]["email_id"])
+
+                if (has_more and after) or before:
+                    previous_cursor = encode_cursor(records[0]["received_datetime"].isoformat(), records[0]["email_id"])
 
             # Convert datetime objects to strings
             for record in records:
@@ -88,9 +143,11 @@ def fetch_emails(folder_name):
 
             logger.info(f"UTILS/EMAILS - services/fetch_emails() - {len(records)} records fetched successfully from {folder_name}")
             response = {
-                "status"  : status.HTTP_200_OK,
-                "data"    : records,
-                "message" : "Emails fetched successfully"
+                "status"          : status.HTTP_200_OK,
+                "data"            : records,
+                "next_cursor"     : next_cursor,
+                "previous_cursor" : previous_cursor,
+                "message"         : "Emails fetched successfully"
             }
 
     except Exception as e:
@@ -101,17 +158,217 @@ def fetch_emails(folder_name):
             "message" : "An error occurred while fetching email data."
         }
 
-    finally:
-        close_connection(conn=conn)
-        return response       
+    return response
+
+# Function to search the whole mailbox with Postgres full-text search
+async def search_emails(conn, query_text, user_email=None, folder_name=None, category=None, limit=20, cursor=None):
+    ''' Ranks emails matching query_text over subject, sender, body and attachment text, newest page first '''
+
+    logger.info(f"UTILS/EMAILS - services/search_emails() - Searching emails for '{query_text}'")
+
+    try:
+        cursor_rank, cursor_id = decode_cursor(cursor) if cursor else (None, None)
+        cursor_rank = float(cursor_rank) if cursor_rank is not None else None
+
+    except Exception as e:
+        logger.error(f"UTILS/EMAILS - services/search_emails() - Invalid cursor {cursor}: {str(e)}")
+
+        return {
+            "status"  : status.HTTP_400_BAD_REQUEST,
+            "message" : "Invalid search cursor"
+        }
+
+    response = None
+
+    if conn is None:
+        logger.error("UTILS/EMAILS - services/search_emails() - Database connection failed")
+
+        return {
+            "status"  : status.HTTP_503_SERVICE_UNAVAILABLE,
+            "message" : "Database connection failed"
+        }
+
+    try:
+        async with conn.cursor(row_factory=dict_row) as db_cursor:
+
+            filters = ""
+            if user_email:
+                filters += " AND u.email = %(user_email)s"
+            if folder_name:
+                filters += " AND f.display_name = %(folder_name)s"
+            if category:
+                filters += " AND EXISTS (SELECT 1 FROM categories c WHERE c.email_id = e.id AND lower(c.category) = lower(%(category)s::TEXT))"
+
+            # The GIN index on search_vector finds the matches, and results are paged
+            # by (rank, id) so a page never repeats or skips rows of the previous one
+            query = f"""
+                WITH matches AS (
+                    SELECT 
+                        sc.address AS sender_email,
+                        sc.display_name AS sender_name,
+                        u.email AS recipient_email,
+                        e.id AS email_id,
+                        e.body_preview,
+                        e.subject,
+                        e.sent_datetime,
+                        e.received_datetime,
+                        e.is_read,
+                        e.has_attachments,
+                        f.display_name AS folder_name,
+                        ARRAY(SELECT c.category FROM categories c WHERE c.email_id = e.id ORDER BY c.category) AS categories,
+                        ts_rank_cd(e.search_vector, q.query)::FLOAT8 AS rank
+                    FROM 
+                        emails e
+                    CROSS JOIN
+                        websearch_to_tsquery('english', %(query_text)s) AS q(query)
+                    INNER JOIN
+                        users u ON e.owner_user_id = u.id
+                    LEFT JOIN 
+                        senders s ON e.id = s.email_id
+                    LEFT JOIN
+                        contacts sc ON s.contact_id = sc.id
+                    LEFT JOIN
+                        email_folders f ON e.parent_folder_id = f.id
+                    WHERE 
+                        e.search_vector @@ q.query
+                        {filters}
+                )
+                SELECT * 
+                FROM 
+                    matches
+                WHERE 
+                    %(cursor_rank)s::FLOAT8 IS NULL 
+                    OR (rank, email_id) < (%(cursor_rank)s::FLOAT8, %(cursor_id)s)
+                ORDER BY 
+                    rank DESC, email_id DESC
+                LIMIT %(limit)s;
+            """
+            logger.info("UTILS/EMAILS - services/search_emails() - Executing SQL query")
+            await db_cursor.execute(query, {
+                "query_text"  : query_text,
+                "user_email"  : user_email,
+                "folder_name" : folder_name,
+                "category"    : category,
+                "cursor_rank" : cursor_rank,
+                "cursor_id"   : cursor_id,
+                "limit"       : limit + 1
+            })
+            records = await db_cursor.fetchall()
+
+            # One extra row tells whether there is a next page
+            next_cursor = None
+            if len(records) > limit:
+                records = records[:limit]
+                next_cursor = encode_cursor(records[-1]["rank"], records[-1]["email_id"])
+
+            # Convert datetime objects to strings
+            for record in records:
+                if isinstance(record.get("sent_datetime"), datetime):
+                    record["sent_datetime"] = record["sent_datetime"].isoformat()
+                
+                if isinstance(record.get("received_datetime"), datetime):
+                    record["received_datetime"] = record["received_datetime"].isoformat()
+
+            logger.info(f"UTILS/EMAILS - services/search_emails() - {len(records)} matching emails fetched successfully")
+            response = {
+                "status"      : status.HTTP_200_OK,
+                "data"        : records,
+                "next_cursor" : next_cursor,
+                "message"     : "Emails searched successfully"
+            }
+
+    except Exception as e:
+        logger.error(f"UTILS/EMAILS - services/search_emails() - Error executing query: {str(e)}")
+        
+        response = {
+            "status"  : status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "message" : "An error occurred while searching emails."
+        }
+
+    return response
+
+# Function to get the total and unread email counts of every folder
+async def get_folder_counts(conn, user_email=None):
+    ''' Returns the folder counts kept in EMAIL_FOLDERS by the pipeline, cached for FOLDER_COUNTS_TTL_SECONDS '''
+
+    logger.info(f"UTILS/EMAILS - services/get_folder_counts() - Fetching folder counts of {user_email or 'all mailboxes'}")
+
+    cached = FOLDER_COUNTS_CACHE.get(user_email)
+    if cached and cached[0] > time.monotonic():
+        logger.info("UTILS/EMAILS - services/get_folder_counts() - Serving folder counts from the cache")
+
+        return {
+            "status"  : status.HTTP_200_OK,
+            "data"    : cached[1],
+            "message" : "Folder counts fetched successfully"
+        }
+
+    response = None
+
+    if conn is None:
+        logger.error("UTILS/EMAILS - services/get_folder_counts() - Database connection failed")
+
+        return {
+            "status"  : status.HTTP_503_SERVICE_UNAVAILABLE,
+            "message" : "Database connection failed"
+        }
+
+    try:
+        async with conn.cursor(row_factory=dict_row) as cursor:
+
+            owner_filter = "WHERE u.email = %(user_email)s" if user_email else ""
+
+            # One row per folder and mailbox, counts are refreshed by the pipeline after every sync
+            query = f"""
+                SELECT 
+                    f.display_name AS folder_name,
+                    SUM(f.total_item_count) AS total_count,
+                    SUM(f.unread_item_count) AS unread_count
+                FROM 
+                    email_folders f
+                LEFT JOIN
+                    users u ON f.owner_user_id = u.id
+                {owner_filter}
+                GROUP BY 
+                    f.display_name;
+            """
+            logger.info("UTILS/EMAILS - services/get_folder_counts() - Executing SQL query")
+            await cursor.execute(query, {"user_email": user_email})
+            records = await cursor.fetchall()
+
+            counts = {
+                record["folder_name"]: {
+                    "total"  : int(record["total_count"] or 0),
+                    "unread" : int(record["unread_count"] or 0)
+                }
+                for record in records
+            }
+
+            FOLDER_COUNTS_CACHE[user_email] = (time.monotonic() + float(env.get("FOLDER_COUNTS_TTL_SECONDS") or 30), counts)
+
+            logger.info(f"UTILS/EMAILS - services/get_folder_counts() - Counts of {len(counts)} folders fetched successfully")
+            response = {
+                "status"  : status.HTTP_200_OK,
+                "data"    : counts,
+                "message" : "Folder counts fetched successfully"
+            }
+
+    except Exception as e:
+        logger.error(f"UTILS/EMAILS - services/get_folder_counts() - Error executing query: {str(e)}")
+
+        response = {
+            "status"  : status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "message" : "An error occurred while fetching folder counts."
+        }
+
+    return response
 
 # Function to load email details
-def load_email(email_id: str):
+async def load_email(conn, email_id: str):
     ''' Fetches email details from the database based on the provided email ID '''
     
     logger.info(f"UTILS/EMAILS - load_email() - Loading email with ID: {email_id}")
     
-    conn = open_connection()
     response = None
 
     if conn is None:
@@ -123,12 +380,12 @@ def load_email(email_id: str):
         }
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        async with conn.cursor(row_factory=dict_row) as cursor:
             
             query = """
                 SELECT 
-                    s.email_address AS sender_email,
-                    r.name AS recipient_name,
+                    sc.address AS sender_email,
+                    rc.display_name AS recipient_name,
                     e.subject,
                     e.received_datetime,
                     e.body,
@@ -137,8 +394,12 @@ def load_email(email_id: str):
                     emails e
                 INNER JOIN 
                     senders s ON e.id = s.email_id
+                LEFT JOIN
+                    contacts sc ON s.contact_id = sc.id
                 INNER JOIN 
                     recipients r ON e.id = r.email_id
+                LEFT JOIN
+                    contacts rc ON r.contact_id = rc.id
                 LEFT JOIN 
                     attachments a ON e.id = a.email_id AND e.has_attachments = TRUE
                 WHERE 
@@ -146,8 +407,8 @@ def load_email(email_id: str):
             """
             
             logger.info("UTILS/EMAILS - load_email() - Executing SQL query")
-            cursor.execute(query, (email_id,))
-            records = cursor.fetchall()
+            await cursor.execute(query, (email_id,))
+            records = await cursor.fetchall()
 
             if not records:
                 logger.info("UTILS/EMAILS - load_email() - No email found with the provided ID")
@@ -155,6 +416,7 @@ def load_email(email_id: str):
                     "status"  : status.HTTP_404_NOT_FOUND,
                     "message" : "No email found with the provided ID."
                 }
+                return response
 
             # Aggregate attachments if multiple rows are returned for the same email_id
             email_data = {
@@ -181,15 +443,12 @@ def load_email(email_id: str):
             "message" : "An error occurred while loading the email data."
         }
 
-    finally:
-        close_connection(conn=conn)
-        return response
+    return response
     
 
-def get_email_category(email_id: str):
+async def get_email_category(conn, email_id: str):
     logger.info(f"UTILS/EMAILS - get_email_category() - Loading categories for email ID: {email_id}")
     
-    conn = open_connection()
     response = None
     
     if conn is None:
@@ -200,7 +459,7 @@ def get_email_category(email_id: str):
         }
     
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        async with conn.cursor(row_factory=dict_row) as cursor:
             
             query = """
                 SELECT 
@@ -213,8 +472,8 @@ def get_email_category(email_id: str):
             """
             
             logger.info("UTILS/EMAILS - get_email_category() - Executing SQL query")
-            cursor.execute(query, (email_id,))
-            records = cursor.fetchall()
+            await cursor.execute(query, (email_id,))
+            records = await cursor.fetchall()
             
             if not records:
                 logger.info("UTILS/EMAILS - get_email_category() - No categories found for the provided email ID")
@@ -240,14 +499,11 @@ def get_email_category(email_id: str):
             "message": "An error occurred while loading the email categories."
         }
     
-    finally:
-        close_connection(conn=conn)
-        return response
+    return response
     
-def get_access_token(user_email):
+async def get_access_token(conn, user_email):
     logger.info(f"UTILS/EMAILS - get_access_token() - Fetching access token of user with email: {user_email}")
     
-    conn = open_connection()
     response = None
     
     if conn is None:
@@ -258,7 +514,7 @@ def get_access_token(user_email):
         }
     
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        async with conn.cursor(row_factory=dict_row) as cursor:
             
             query = """
                 SELECT 
@@ -270,8 +526,8 @@ def get_access_token(user_email):
             """
             
             logger.info("UTILS/EMAILS - get_access_token() - Executing SQL query")
-            cursor.execute(query, (user_email,))
-            record = cursor.fetchone()
+            await cursor.execute(query, (user_email,))
+            record = await cursor.fetchone()
             
             if not record:
                 logger.info(f"UTILS/EMAILS - get_access_token() - Access token not found for email: {user_email}")
@@ -288,14 +544,11 @@ def get_access_token(user_email):
         }
         return response
     
-    finally:
-        close_connection(conn=conn)
 
 # Function to send an email
-def send_mail_response(user_email, response_output):
+async def send_mail_response(conn, user_email, response_output):
     logger.info(f"UTILS/EMAILS - send_mail_response() - Sending mail response generated by response_agent")
     
-    conn = open_connection()
     response = None
     
     if conn is None:
@@ -306,49 +559,64 @@ def send_mail_response(user_email, response_output):
         }
     
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            
-            access_token = get_access_token(user_email)
+        # Same pooled connection, the token lookup does not take a second one
+        access_token = await get_access_token(conn, user_email)
 
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
+        if not isinstance(access_token, str):
+            logger.error(f"UTILS/EMAILS - send_mail_response() - No access token available for {user_email}")
+            return {
+                "status": status.HTTP_401_UNAUTHORIZED,
+                "data": False,
+                "message": "No access token available to send an email"
             }
 
-            email_body = {
-                "message": {
-                    "subject": response_output['subject'],
-                    "body": {
-                        "contentType": "HTML",
-                        "content": response_output['body']
-                    },
-                    "toRecipients": [
-                        {
-                            "emailAddress": {
-                                "address": response_output['recipient_email']
-                            }
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+
+        email_body = {
+            "message": {
+                "subject": response_output['subject'],
+                "body": {
+                    "contentType": "HTML",
+                    "content": response_output['body']
+                },
+                "toRecipients": [
+                    {
+                        "emailAddress": {
+                            "address": response_output['recipient_email']
                         }
-                    ]
-                }
+                    }
+                ]
             }
+        }
 
-            send_mail_endpoint = os.getenv("SEND_EMAILS_ENDPOINT")
+        send_mail_endpoint = os.getenv("SEND_EMAILS_ENDPOINT")
 
-            # Post request to send an email
-            response = requests.post(
-                send_mail_endpoint,
-                headers=headers,
-                json=email_body,
-                timeout=30
-            )
+        # Post request to send an email, off the event loop
+        graph_response = await asyncio.to_thread(
+            requests.post,
+            send_mail_endpoint,
+            headers=headers,
+            json=email_body,
+            timeout=30
+        )
 
-            if response.status_code == 202:
-                logger.info(f"Email sent successfully to {response_output['recipient_email']}")
-                response = {
-                    "status": status.HTTP_200_OK,
-                    "data": True,
-                    "message": "Email sent successfully"
-                }
+        if graph_response.status_code == 202:
+            logger.info(f"Email sent successfully to {response_output['recipient_email']}")
+            response = {
+                "status": status.HTTP_200_OK,
+                "data": True,
+                "message": "Email sent successfully"
+            }
+        else:
+            logger.error(f"UTILS/EMAILS - send_mail_response() - Graph API refused the email with status {graph_response.status_code}: {graph_response.text}")
+            response = {
+                "status": status.HTTP_502_BAD_GATEWAY,
+                "data": False,
+                "message": "Failed to send an email"
+            }
     
     except Exception as e:
         logger.error(f"UTILS/EMAILS - send_mail_response() - Error while sending mail: {str(e)}")
@@ -358,6 +626,4 @@ def send_mail_response(user_email, response_output):
             "message": "An error occurred while sending an email, Failed to send an email"
         }
     
-    finally:
-        close_connection(conn=conn)
-        return response
\ No newline at end of file
+    return response
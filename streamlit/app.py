@@ -41,12 +41,12 @@ if 'selected_folder' not in st.session_state:
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 
-def get_folder_count(folder_name):
-    """Get the count of emails in a folder"""
-    response = email_service.fetch_emails(folder=folder_name)
+def get_folder_counts():
+    """Get the email counts of every folder in one request"""
+    response = email_service.fetch_folder_counts(user_email=st.session_state.get("preferred_username"))
     if response["status"] == 200 and "data" in response:
-        return len(response["data"])
-    return 0
+        return response["data"]
+    return {}
 
 def render_sidebar():
     with st.sidebar:
@@ -65,6 +65,8 @@ def render_sidebar():
             "Outbox": {"icon": "📨", "value": "Outbox"}
         }
 
+        folder_counts = get_folder_counts()
+
         for label, details in nav_options.items():
             col1, col2 = st.columns([7, 1])  # Adjust ratio as needed
             
@@ -73,11 +75,14 @@ def render_sidebar():
                 button_text = f"{details['icon']} {label}"
                 if st.button(button_text, key=f"nav_{details['value']}", use_container_width=True):
                     st.session_state.selected_folder = details['value']
+                    # A new folder starts on its newest page
+                    st.session_state.page_before = None
+                    st.session_state.page_after = None
                     st.rerun()
             
             # Show count if greater than 0
             with col2:
-                count = get_folder_count(details['value'])
+                count = folder_counts.get(details['value'], {}).get("total", 0)
                 if count > 0:
                     st.markdown(f"<div class='folder-count'>{count}</div>", unsafe_allow_html=True)
 
@@ -15,11 +15,23 @@ class EmailService:
         self.s3_client = boto3.client('s3')
         logger.info(f"EmailService initialized with base URL: {self.base_url}")
     
-    def fetch_emails(self, folder) -> Dict[str, Any]:
-        """Fetch all emails from the API."""
+    def fetch_emails(self, folder, user_email: str = None, limit: int = 10, before: str = None, after: str = None, with_details: bool = False) -> Dict[str, Any]:
+        """Fetch a page of the emails of a folder from the API, limited to the mailbox of user_email if given.
+        Pass the next_cursor of a page as before for older mail, its previous_cursor as after for newer mail.
+        with_details reads the mailbox view, which also carries the categories and attachments of every email."""
+        endpoint = os.getenv('MAILBOX_VIEW_ENDPOINT') if with_details else os.getenv('FETCH_MAILS_ENDPOINT')
         try:
             logger.info("Fetching emails from API...")
-            response = requests.get(f"{self.base_url}/{os.getenv('FETCH_MAILS_ENDPOINT')}/{folder}")
+            params = {
+                "user_email": user_email,
+                "limit": limit,
+                "before": before,
+                "after": after
+            }
+            response = requests.get(
+                f"{self.base_url}/{endpoint}/{folder}",
+                params={key: value for key, value in params.items() if value is not None}
+            )
             response.raise_for_status()
             data = response.json()
             logger.info(f"Successfully fetched {len(data.get('data', []))} emails")
@@ -29,7 +41,54 @@ class EmailService:
             return {
                 "status": 500,
                 "message": "Failed to fetch emails",
-                "data": []
+                "data": [],
+                "next_cursor": None,
+                "previous_cursor": None
+            }
+
+    def fetch_folder_counts(self, user_email: str = None) -> Dict[str, Any]:
+        """Fetch the total and unread counts of every folder from the API in one call."""
+        try:
+            logger.info("Fetching folder counts from API...")
+            params = {"user_email": user_email} if user_email else None
+            response = requests.get(f"{self.base_url}/{os.getenv('FOLDER_COUNTS_ENDPOINT')}", params=params)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            logger.error(f"Error fetching folder counts: {str(e)}")
+            return {
+                "status": 500,
+                "message": "Failed to fetch folder counts",
+                "data": {}
+            }
+
+    def search_emails(self, query: str, user_email: str = None, folder: str = None, category: str = None, limit: int = 20, cursor: str = None) -> Dict[str, Any]:
+        """Full-text search the mailbox on the API, ranked, with the categories of every match."""
+        try:
+            logger.info(f"Searching emails for: {query}")
+            params = {
+                "q": query,
+                "user_email": user_email,
+                "folder_name": folder,
+                "category": category,
+                "limit": limit,
+                "cursor": cursor
+            }
+            response = requests.get(
+                f"{self.base_url}/{os.getenv('SEARCH_MAILS_ENDPOINT')}",
+                params={key: value for key, value in params.items() if value is not None}
+            )
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"Search returned {len(data.get('data', []))} emails")
+            return data
+        except requests.RequestException as e:
+            logger.error(f"Error searching emails: {str(e)}")
+            return {
+                "status": 500,
+                "message": "Failed to search emails",
+                "data": [],
+                "next_cursor": None
             }
 
     def get_s3_download_url(self, bucket_name: str, s3_key: str) -> str:
@@ -69,6 +128,27 @@ class EmailService:
             logger.error(f"Error parsing S3 URL: {str(e)}")
             return None
 
+    def enrich_attachments(self, attachments: list) -> list:
+        """Add presigned download URLs to attachments given as S3 URLs or as dictionaries with a bucket_url."""
+        enriched_attachments = []
+        for attachment in attachments:
+            if isinstance(attachment, str):
+                # If attachment is just the S3 URL string
+                attachment_details = self.get_attachment_details(attachment)
+                if attachment_details:
+                    enriched_attachments.append(attachment_details)
+            elif isinstance(attachment, dict) and attachment.get('bucket_url'):
+                # If attachment is a dictionary with bucket_url
+                attachment_details = self.get_attachment_details(attachment['bucket_url'])
+                if attachment_details:
+                    attachment_details.update({
+                        'name': attachment.get('name'),
+                        'content_type': attachment.get('content_type'),
+                        'size': attachment.get('size')
+                    })
+                    enriched_attachments.append(attachment_details)
+        return enriched_attachments
+
     def load_email(self, email_id: str) -> Dict[str, Any]:
         """Load specific email details with S3 attachment information."""
         try:
@@ -79,25 +159,7 @@ class EmailService:
             
             # If email has attachments, add download URLs
             if data["status"] == 200 and data["data"].get("attachments"):
-                enriched_attachments = []
-                for attachment in data["data"]["attachments"]:
-                    if isinstance(attachment, str):
-                        # If attachment is just the S3 URL string
-                        attachment_details = self.get_attachment_details(attachment)
-                        if attachment_details:
-                            enriched_attachments.append(attachment_details)
-                    elif isinstance(attachment, dict) and attachment.get('bucket_url'):
-                        # If attachment is a dictionary with bucket_url
-                        attachment_details = self.get_attachment_details(attachment['bucket_url'])
-                        if attachment_details:
-                            attachment_details.update({
-                                'name': attachment.get('name'),
-                                'content_type': attachment.get('content_type'),
-                                'size': attachment.get('size')
-                            })
-                            enriched_attachments.append(attachment_details)
-                
-                data["data"]["attachments"] = enriched_attachments
+                data["data"]["attachments"] = self.enrich_attachments(data["data"]["attachments"])
             
             return data
             
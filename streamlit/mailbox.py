@@ -120,8 +120,12 @@ def get_category(email):
     }
 
     try:
-        # Get categories for this email from email service
-        response = email_service.get_email_category(email['id'])
+        # Search results already carry their categories
+        if email.get("categories") is not None:
+            response = {"status": 200, "data": email["categories"]}
+        else:
+            # Get categories for this email from email service
+            response = email_service.get_email_category(email['id'])
         
         if response["status"] == 200 and response["data"]:
             # Process all categories from response
@@ -158,11 +162,20 @@ def initialize_session_state():
         st.session_state.show_chat = not st.session_state.get('show_chat', False)
         
 
-# Fetch emails and update session state
-def fetch_emails(email_service):
+# Fetch a page of emails and update session state
+def fetch_emails(email_service, before=None, after=None):
     with st.spinner(f'Fetching emails from {st.session_state.selected_folder}......'):
-        response = email_service.fetch_emails(folder=st.session_state.selected_folder)
+        response = email_service.fetch_emails(
+            folder=st.session_state.selected_folder,
+            user_email=st.session_state.get("preferred_username"),
+            before=before,
+            after=after,
+            with_details=True
+        )
         if response["status"] == 200:
+            # Cursors of the neighbouring pages, None when there is nothing more that way
+            st.session_state.next_cursor = response.get("next_cursor")
+            st.session_state.previous_cursor = response.get("previous_cursor")
             emails_data = response["data"]
             logger.info(f"Processing {len(emails_data)} emails from {st.session_state.selected_folder}")
             st.session_state.emails = [
@@ -176,7 +189,9 @@ def fetch_emails(email_service):
                     "read": email.get("is_read", False),
                     "starred": False,
                     "category": "Work",
-                    "attachments": email_service.load_attachments(email["email_id"]) if email.get("has_attachments") else []
+                    # The mailbox view carries categories and attachments, no request per email
+                    "categories": email.get("categories", []),
+                    "attachments": email_service.enrich_attachments(email.get("attachments", []))
                 }
                 for email in emails_data
             ]
@@ -207,6 +222,9 @@ def load_email_content(email_id):
                         'read': True  # Mark as read
                     }
                     return email_data
+
+            # Search results from outside the loaded folder list
+            return email_data
         else:
             logger.error(f"Failed to load email {email_id}: {email_response.get('message', 'Unknown error')}")
             return None
@@ -227,31 +245,11 @@ def render_email_list():
 
     with col2:
         if st.button("🔄", key="refresh_button"):
-            # Call fetch_emails function to reload the email list
-            response = email_service.fetch_emails(st.session_state.selected_folder)
-            if response["status"] == 200:
-                # Update session state emails
-                st.session_state.emails = [
-                    {
-                        "id": email["email_id"],
-                        "sender": email["sender_name"],
-                        "email": email["sender_email"],
-                        "subject": email["subject"],
-                        "content": email["body_preview"] if email.get("body_preview") else "",
-                        "date": email["received_datetime"],
-                        "read": email.get("is_read", False),
-                        "starred": False,
-                        "category": "Work",
-                        "attachments": email_service.load_attachments(email["email_id"]) if email.get("has_attachments") else []
-                    }
-                    for email in response["data"]
-                ]
-                # Set a success flag in session state
-                st.session_state.refresh_success = True
-            else:
-                # Handle error, optionally set an error flag
-                st.session_state.refresh_success = False
-                st.error(f"Failed to refresh emails: {response['message']}")
+            # Go back to the newest page, render_mailbox fetches it on the rerun
+            st.session_state.page_before = None
+            st.session_state.page_after = None
+            st.session_state.refresh_success = True
+            st.rerun()
 
     
     # Search Input Field
@@ -264,23 +262,33 @@ def render_email_list():
     
     st.session_state.search_query = search_query
 
-    # Filter emails based on search query
+    # Search the whole mailbox on the server, results are kept until the query changes
     filtered_emails = st.session_state.get("emails", [])
     if search_query:
-        filtered_emails = []
-        for email in st.session_state.get("emails", []):
-            # Get categories for the email
-            email_categories = get_category(email)
-            # Convert categories to lowercase for case-insensitive search
-            category_names = [cat['name'].lower() for cat in email_categories]
-            
-            # Check if search query matches any email field or categories
-            if (search_query in email.get("sender", "").lower() or
-                search_query in email.get("email", "").lower() or
-                search_query in email.get("subject", "").lower() or
-                search_query in email.get("content", "").lower() or
-                any(search_query in cat_name for cat_name in category_names)):
-                filtered_emails.append(email)
+        if st.session_state.get("search_results_query") != search_query:
+            response = email_service.search_emails(search_query, user_email=st.session_state.get("preferred_username"))
+            if response["status"] != 200:
+                st.error(f"Failed to search emails: {response['message']}")
+
+            st.session_state.search_results_query = search_query
+            st.session_state.search_results = [
+                {
+                    "id": email["email_id"],
+                    "sender": email["sender_name"] or "",
+                    "email": email["sender_email"] or "",
+                    "subject": email["subject"],
+                    "content": email["body_preview"] if email.get("body_preview") else "",
+                    "date": email["received_datetime"],
+                    "read": email.get("is_read", False),
+                    "starred": False,
+                    "category": "Work",
+                    "categories": email.get("categories", []),
+                    "attachments": []
+                }
+                for email in response.get("data", [])
+            ]
+
+        filtered_emails = st.session_state.search_results
 
     # Email List Container
     email_list_container = st.container()
@@ -341,6 +349,22 @@ def render_email_list():
                             logger.info(f"Stored selected_email_id: {email['id']}")
                             st.rerun()
 
+    # Pager over the folder, search results are a single ranked page
+    if not search_query:
+        newer_col, older_col = st.columns(2)
+
+        with newer_col:
+            if st.button("← Newer", key="newer_page", disabled=not st.session_state.get("previous_cursor"), use_container_width=True):
+                st.session_state.page_before = None
+                st.session_state.page_after = st.session_state.previous_cursor
+                st.rerun()
+
+        with older_col:
+            if st.button("Older →", key="older_page", disabled=not st.session_state.get("next_cursor"), use_container_width=True):
+                st.session_state.page_before = st.session_state.next_cursor
+                st.session_state.page_after = None
+                st.rerun()
+
 
 # Render selected email
 def render_selected_email():
@@ -578,7 +602,7 @@ def render_chat_window():
 # Update your existing render_mailbox function
 def render_mailbox():
     initialize_session_state()
-    fetch_emails(email_service)
+    fetch_emails(email_service, before=st.session_state.get("page_before"), after=st.session_state.get("page_after"))
 
     if not st.session_state.get('show_chat', False):
         # Regular email interface